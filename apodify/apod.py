@@ -1,17 +1,44 @@
+import cache
+import catalog
+import collections
 import colorama
+import colorindex
 import colors
+import concurrent.futures
 import config
 import datetime
+import enum
+import httpclient
+import io
 import json
+import jobqueue
+import manifest
+import metacache
+import metrics
+import mmap
 import os
 import pathlib
-import requests
+import preview
+import resultcache
+import supa
+import threading
 import typing
 import utils
 
-from PIL import Image, ImageDraw
+from PIL import Image
 from logger import logger
-from supa import supabase_upload_v1
+
+# requests is imported by the functions which send requests, see `httpclient`;
+# local (the mirror, which loads asyncio) only with `source: "local"`
+if typing.TYPE_CHECKING:
+    import requests
+
+_IMAGE_CACHE = None
+_IMAGE_CACHE_LOCK = threading.Lock()
+_SUPABASE_UPLOADER = None
+
+
+_TEMP_APOD_DATA_PATH = pathlib.Path("./.temp/apod_data.json")
 
 
 def get_apod_data() -> typing.List[typing.Dict[str, typing.Union[str, int]]]:
@@ -21,12 +48,55 @@ def get_apod_data() -> typing.List[typing.Dict[str, typing.Union[str, int]]]:
         A list of dictionaries, where each dictionary represents APOD data for a specific date.
     """
 
+    return list(iter_apod_data())
+
+
+def _read_temp_apod_data() -> typing.Iterator[typing.Dict[str, typing.Union[str, int]]]:
+    with open(_TEMP_APOD_DATA_PATH, encoding="utf-8") as file:
+        while line := file.readline():
+            line = line.strip().rstrip(",")
+            if line in ("[", "]", ""):
+                continue
+
+            try:
+                apod_item = json.loads(line)
+            except ValueError:
+                # written with indentation by an older version
+                file.seek(0)
+                yield from json.load(file)
+                return
+
+            yield apod_item
+
+
+def iter_apod_data() -> typing.Iterator[typing.Dict[str, typing.Union[str, int]]]:
+    """Stream Astronomy Picture of the Day (APOD) data for a specified date range, oldest day first.
+
+    Chunks of the date range are retrieved concurrently (`apod_workers`), but only up to
+    `apod_workers` chunks ahead of the consumer, so the data of the whole date range is never kept
+    in memory. The days are written to `/.temp/apod_data.json` as they are streamed (one day per line).
+
+    A failed chunk does not stop the days of the other chunks; the error is raised after them.
+
+    Yields:
+        Dictionaries, where each dictionary represents APOD data for a specific date.
+    """
+
     if config.get.use_temp_apod_data:
-        if os.path.isfile(".temp/apod_data.json") is True:
-            with open(".temp/apod_data.json", encoding="utf-8") as file:
-                data = json.loads(file.read())
-                logger.info("APOD data loaded from the temporary file.")
-                return data
+        if _TEMP_APOD_DATA_PATH.is_file():
+            logger.info("APOD data loaded from the temporary file.")
+            start_date, end_date = (
+                (config.get.start_date, config.get.end_date)
+                if config.get.date is None
+                else (config.get.date, config.get.date)
+            )
+            # the file may have been written for another date range
+            yield from (
+                apod_item
+                for apod_item in _read_temp_apod_data()
+                if start_date <= apod_item["date"] <= end_date
+            )
+            return
         else:
             logger.warning("The temp file with APOD items was not found!")
 
@@ -44,94 +114,621 @@ def get_apod_data() -> typing.List[typing.Dict[str, typing.Union[str, int]]]:
         f"Retrieving APOD data ({f'{config.get.start_date} - {config.get.end_date}' if config.get.date is None else f'{config.get.date}'}) ..."
     )
 
-    base_url = "https://api.nasa.gov/planetary/apod"
-
     # using the search parameters 'start_date' and 'end_date' even for a single day
     # instead of just 'date', because the APOD API returns the data as a table in such cases;
-    query = (
-        f"start_date={config.get.start_date}&end_date={config.get.end_date}"
+    chunks = (
+        utils.split_date_range(config.get.start_date, config.get.end_date)
         if config.get.date is None
-        else f"start_date={config.get.date}&end_date={config.get.date}"
+        else [(config.get.date, config.get.date)]
     )
 
-    url = f"{base_url}?api_key={os.getenv('NASA_API_KEY')}&{query}&thumbs=true"
+    logger.debug(f"{len(chunks)} chunk/s to retrieve.")
 
-    response = requests.get(url)
+    failed_chunks = []
+    days = 0
 
-    if response.status_code == 200:
-        logger.info("Request was successful (status code 200).")
+    _TEMP_APOD_DATA_PATH.parent.mkdir(exist_ok=True, parents=True)
+    tmp_path = _TEMP_APOD_DATA_PATH.with_name(f"{_TEMP_APOD_DATA_PATH.name}.tmp")
 
-        logger.debug(
-            f"X-RateLimit-Remaining: {response.headers.get('X-RateLimit-Remaining')}."
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=config.get.apod_workers
+    ) as executor, open(tmp_path, "w", encoding="utf-8") as file:
+        remaining_chunks = iter(chunks)
+        futures = collections.deque()
+
+        def submit_chunk() -> None:
+            chunk = next(remaining_chunks, None)
+            if chunk is not None:
+                futures.append((chunk, executor.submit(_get_apod_chunk, *chunk)))
+
+        for _ in range(max(1, config.get.apod_workers)):
+            submit_chunk()
+
+        file.write("[")
+
+        # chunks are consumed in order, the next one is requested as soon as a slot is free
+        while futures:
+            chunk, future = futures.popleft()
+            submit_chunk()
+
+            try:
+                chunk_data = future.result()
+            except utils.CriticalError as critical_error:
+                logger.error(critical_error)
+                failed_chunks.append(chunk)
+                continue
+
+            for apod_item in sorted(
+                chunk_data, key=lambda apod_item: apod_item["date"]
+            ):
+                file.write(("\n" if days == 0 else ",\n") + json.dumps(apod_item))
+                days += 1
+                yield apod_item
+
+        file.write("\n]\n")
+
+    if failed_chunks:
+        tmp_path.unlink(missing_ok=True)
+        raise utils.CriticalError(
+            "Failed to get data from APOD API for some of the chunks (the others are kept in '/.temp/apod_data/')",
+            {"failed_chunks": sorted(failed_chunks)},
+        )
+
+    logger.debug(f"{days} day/s total.")
+
+    # todo: add option to disable it
+    logger.info("Response json written to '/.temp/apod_data.json'.")
+    os.replace(tmp_path, _TEMP_APOD_DATA_PATH)
+
+    for start_date, end_date in chunks:
+        _get_apod_chunk_path(start_date, end_date).unlink(missing_ok=True)
+
+
+def _use_local_mirror() -> bool:
+    """Check whether APOD data and images are read from the local mirror (`source`)."""
+
+    if config.get.source not in ("network", "local"):
+        raise utils.CriticalError(
+            f"Unknown 'source': '{config.get.source}' (expected 'network' or 'local')"
         )
 
-        apod_data = response.json()
-        logger.debug(f"{len(apod_data)} day/s total.")
+    return config.get.source == "local"
+
+
+def _get_apod_chunk_path(start_date: str, end_date: str) -> pathlib.Path:
+    return pathlib.Path(f"./.temp/apod_data/{start_date}_{end_date}.json")
+
+
+def _get_apod_chunk(
+    start_date: str, end_date: str
+) -> typing.List[typing.Dict[str, typing.Union[str, int]]]:
+    """Retrieve APOD data for a single chunk of the date range, retrying on failure.
+
+    Every successfully retrieved chunk is written to `/.temp/apod_data/` right away,
+    so in case of failure of another chunk, the next run does not need to retrieve it again.
+    Chunks are removed after the whole date range is written to `/.temp/apod_data.json`.
+
+    With `source: "local"`, the days mirrored by `local.py` are read from `/.local_apod/`
+    and only the rest of the chunk is retrieved from the APOD API.
+
+    With `metadata_cache`, the days retrieved by earlier runs are read from the metadata cache
+    and only the sub-ranges of the chunk which are not cached (or expired) are requested.
+
+    Args:
+        start_date: The first day of the chunk (format: "YYYY-MM-DD").
+        end_date: The last day of the chunk (format: "YYYY-MM-DD").
 
-        # todo: add option to disable it
-        logger.info("Writing response json to '/.temp/apod_data.json' ...")
-        pathlib.Path(f"./.temp/apod_data.json").write_text(
-            json.dumps(apod_data, indent=4)
+    Returns:
+        A list of dictionaries, where each dictionary represents APOD data for a specific date.
+    """
+
+    chunk_file = _get_apod_chunk_path(start_date, end_date)
+
+    if chunk_file.is_file() and end_date < utils.TODAY:
+        logger.info(f"APOD data ({start_date} - {end_date}) loaded from a chunk file.")
+        return json.loads(chunk_file.read_text(encoding="utf-8"))
+
+    mirrored_data = []
+    if _use_local_mirror():
+        import local
+
+        mirrored_data, missing_date = local.read_apods(start_date, end_date)
+        metrics.increment("mirror_hits_total", len(mirrored_data), kind="data")
+
+        if missing_date is None:
+            logger.info(
+                f"APOD data ({start_date} - {end_date}) loaded from the local mirror."
+            )
+            return mirrored_data
+
+        logger.info(
+            f"APOD data from {missing_date} is not mirrored, retrieving it from APOD API ..."
         )
+        start_date = missing_date
+
+    cached_data = []
+    missing_ranges = [(start_date, end_date)]
+    metadata_cache = metacache.get_cache()
+    if metadata_cache is not None:
+        cached_data, missing_ranges = metadata_cache.lookup(start_date, end_date)
+        metrics.increment("metadata_cache_hits_total", len(cached_data))
+
+        if not missing_ranges:
+            logger.info(
+                f"APOD data ({start_date} - {end_date}) loaded from the metadata cache."
+            )
+            return mirrored_data + cached_data
 
-        return apod_data
-    else:
+        logger.debug(
+            f"{len(cached_data)} day/s of {start_date} - {end_date} loaded from the metadata cache, {len(missing_ranges)} range/s to retrieve."
+        )
+
+    retrieved_data = []
+    for missing_start_date, missing_end_date in missing_ranges:
+        range_data = _request_apod_data(missing_start_date, missing_end_date)
+        if metadata_cache is not None:
+            metadata_cache.store(missing_start_date, missing_end_date, range_data)
+        retrieved_data.extend(range_data)
+
+    apod_data = mirrored_data + sorted(
+        cached_data + retrieved_data, key=lambda apod_item: apod_item["date"]
+    )
+
+    chunk_file.parent.mkdir(exist_ok=True, parents=True)
+    chunk_file.write_text(json.dumps(apod_data))
+
+    return apod_data
+
+
+def _request_apod_data(
+    start_date: str, end_date: str
+) -> typing.List[typing.Dict[str, typing.Union[str, int]]]:
+    """Request APOD data for a date range from the APOD API (`apod_api_url`)."""
+
+    import requests
+
+    base_url = config.get.apod_api_url
+    query = f"start_date={start_date}&end_date={end_date}"
+    url = f"{base_url}?api_key={os.getenv('NASA_API_KEY')}&{query}&thumbs=true"
+
+    # connection errors, 429 and 5xx responses are retried by the HTTP client
+    try:
+        response = httpclient.get(url, timeout=config.get.apod_timeout)
+    except requests.RequestException as exception:
         raise utils.CriticalError(
-            "Failed to get data from APOD API",
+            f"Failed to get data from APOD API ({start_date} - {end_date}): {exception}",
+            {"url": url},
+        )
+
+    if response.status_code == 200:
+        logger.info(
+            f"Request for {start_date} - {end_date} was successful (status code 200)."
+        )
+        return response.json()
+
+    raise utils.CriticalError(
+        f"Failed to get data from APOD API ({start_date} - {end_date})",
+        {
+            "url": response.url,
+            "status_code": response.status_code,
+            "headers": dict(response.headers),
+            "response": response.text,
+        },
+    )
+
+
+def select_image_url(
+    url: str, hdurl: str | None, thumbnail_url: str | None, media_type: str
+) -> str:
+    """Select the URL of the image used for color extraction.
+
+    Args:
+        url: The URL of the APOD image or thumbnail of the APOD video.
+        hdurl: The URL for any high-resolution image for that day.
+        thumbnail_url: The URL of thumbnail of the video.
+        media_type: May be 'image' or 'video', based on content.
+
+    Returns:
+        The URL of the image that should be downloaded.
+    """
+
+    if media_type == "video" and thumbnail_url:
+        return thumbnail_url
+    elif config.get.use_hdurl is True and hdurl:
+        return hdurl
+
+    # fix: make sure it points to an image url
+    return url
+
+
+def _get_image_cache() -> cache.DiskCache | None:
+    """Return the image cache, or None if caching images is disabled."""
+
+    global _IMAGE_CACHE
+
+    if config.get.image_cache is False:
+        return None
+
+    with _IMAGE_CACHE_LOCK:
+        if _IMAGE_CACHE is None:
+            _IMAGE_CACHE = cache.DiskCache(
+                config.get.image_cache_dir, config.get.image_cache_max_mb * 1024 * 1024
+            )
+
+    return _IMAGE_CACHE
+
+
+class FetchFailure(enum.Enum):
+    """The reason why an APOD image could not be fetched.
+
+    Only `HTTP_ERROR` (429 and 5xx responses), `TIMEOUT` and `CONNECTION_ERROR` may go away
+    when the image is fetched again (see `jobqueue.TRANSIENT_ERRORS`).
+    """
+
+    HTTP_ERROR = "http_error"
+    CLIENT_ERROR = "client_error"
+    NOT_AN_IMAGE = "not_an_image"
+    TOO_LARGE = "too_large"
+    TIMEOUT = "timeout"
+    CONNECTION_ERROR = "connection_error"
+    DECODE_ERROR = "decode_error"
+
+
+class Download(typing.NamedTuple):
+    """The result of downloading an APOD image."""
+
+    data: bytes | bytearray | mmap.mmap | None
+    content_type: str | None
+    failure: FetchFailure | None = None
+
+
+class FetchedImage(typing.NamedTuple):
+    """The result of fetching and opening an APOD image."""
+
+    img: Image.Image | None
+    content_type: str | None
+    size: tuple[int, int] | None
+    failure: FetchFailure | None = None
+    content_hash: str | None = None
+
+
+def _content_length(response: "requests.Response") -> int | None:
+    """Return the Content-Length of a response, or None if it is missing or invalid."""
+
+    try:
+        content_length = int(response.headers.get("content-length"))
+    except (TypeError, ValueError):
+        return None
+
+    return content_length if content_length >= 0 else None
+
+
+def _read_body(response: "requests.Response", max_bytes: int) -> bytearray | None:
+    """Read the body of a streamed response in chunks, or return None if it exceeds `max_bytes`.
+
+    The chunks are written into a new buffer sized from the Content-Length header (up to
+    `max_bytes`), which is returned as it is, without another copy.
+    """
+
+    content_length = _content_length(response)
+    buffer = bytearray(min(content_length, max_bytes) if content_length else 0)
+    size = 0
+
+    for chunk in response.iter_content(chunk_size=64 * 1024):
+        end = size + len(chunk)
+        if end > max_bytes:
+            return None
+
+        if end > len(buffer):
+            # without a (correct) Content-Length, grow geometrically, so large images need only
+            # a few reallocations
+            buffer.extend(bytes(max(len(buffer), end - len(buffer))))
+
+        buffer[size:end] = chunk
+        size = end
+
+    # a body shorter than its Content-Length (or than the grown buffer) is truncated in place
+    del buffer[size:]
+
+    return buffer
+
+
+@metrics.span("fetch")
+def download_apod_image(url: str) -> Download:
+    """Download an APOD image from a given URL.
+
+    The body is streamed in chunks into a buffer sized from its Content-Length, and the download is aborted
+    as soon as it exceeds `image_max_mb`. The content type is checked before reading the body.
+
+    Args:
+        url: The URL of the image to download.
+
+    Returns:
+        A `Download` tuple containing three elements:
+            - The raw bytes of the image, or None if the download failed.
+            - A string representing the content type of the response.
+            - The reason of the failure (`FetchFailure`), or None if the download succeeded.
+
+    Notes:
+        Downloaded images are kept in the image cache (see `image_cache_dir`). A cached image is
+        revalidated with a conditional request (ETag/Last-Modified) when `image_cache_revalidate`
+        is enabled, otherwise it is used without any network traffic.
+    """
+
+    import requests
+
+    logger.info(f"Fetching an APOD image ...")
+
+    image_cache = _get_image_cache()
+    cached = image_cache.get(url) if image_cache is not None else None
+    headers = {}
+
+    if cached is not None:
+        img_data, meta = cached
+
+        if config.get.image_cache_revalidate is False:
+            logger.debug("The image was loaded from the cache.")
+            metrics.increment("image_cache_hits_total")
+            return Download(img_data, meta["content_type"])
+
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    max_bytes = config.get.image_max_mb * 1024 * 1024
+
+    try:
+        with httpclient.get(
+            url, headers=headers, stream=True, timeout=config.get.image_timeout
+        ) as response:
+            content_type = response.headers.get("content-type")
+
+            if response.status_code == 304 and cached is not None:
+                logger.debug("The cached image is still valid (status code 304).")
+                metrics.increment("image_cache_hits_total")
+                return Download(img_data, meta["content_type"])
+
+            if response.status_code != 200:
+                if response.status_code == 406:
+                    logger.warning(
+                        f"406 Not Acceptable, see: https://developer.mozilla.org/en-US/docs/Web/HTTP/Status/406"
+                    )
+                else:
+                    logger.warning(
+                        f"Failed to fetch the image (status code {response.status_code}).",
+                        {"url": url},
+                    )
+                return Download(
+                    None,
+                    content_type,
+                    (
+                        FetchFailure.CLIENT_ERROR
+                        if 400 <= response.status_code < 500
+                        and response.status_code != 429
+                        else FetchFailure.HTTP_ERROR
+                    ),
+                )
+
+            if not content_type or not content_type.startswith("image/"):
+                # todo: extract colors from a link/page anyway?
+                logger.warning("The URL does not point to an image.", {"url": url})
+                return Download(None, content_type, FetchFailure.NOT_AN_IMAGE)
+
+            # an invalid Content-Length is ignored, the body is checked while it is read
+            content_length = _content_length(response)
+            img_data = (
+                None
+                if content_length is not None and content_length > max_bytes
+                else _read_body(response, max_bytes)
+            )
+
+            if img_data is None:
+                logger.warning(
+                    f"The image is larger than {config.get.image_max_mb} MB.",
+                    {"url": url},
+                )
+                return Download(None, content_type, FetchFailure.TOO_LARGE)
+
+    except requests.Timeout:
+        logger.warning("Fetching the image timed out.", {"url": url})
+        return Download(None, None, FetchFailure.TIMEOUT)
+    except requests.RequestException as exception:
+        logger.warning(f"Failed to fetch the image: {exception}")
+        return Download(None, None, FetchFailure.CONNECTION_ERROR)
+
+    metrics.increment("bytes_downloaded_total", len(img_data))
+
+    if image_cache is not None:
+        image_cache.put(
+            url,
+            img_data,
             {
-                "url": response.url,
-                "status_code": response.status_code,
-                "headers": dict(response.headers),
-                "response": response.json(),
+                "content_type": content_type,
+                "etag": response.headers.get("etag"),
+                "last_modified": response.headers.get("last-modified"),
             },
         )
 
+    return Download(img_data, content_type)
+
 
-def fetch_apod_image(url: str) -> tuple[Image.Image, str, tuple[int, int]]:
-    """Fetch an APOD image from a given URL and save it locally.
+def find_local_image(date: str | None, url: str) -> tuple[str, str | None] | None:
+    """Find the image of a day in the local mirror (`source: "local"`).
+
+    Args:
+        date: The date of the APOD (format: "YYYY-MM-DD").
+        url: The URL of the image selected by `select_image_url`.
+
+    Returns:
+        The path and the content type of the mirrored image, or None if it has to be downloaded.
+    """
+
+    if date is None or not _use_local_mirror():
+        return None
+
+    import local
+
+    path = local.find_image(date, url)
+    if path is None:
+        logger.debug(f"The image of {date} is not mirrored.")
+        return None
+
+    metrics.increment("mirror_hits_total", kind="image")
+    return str(path), local.content_type(path)
+
+
+def open_apod_image(img_data: bytes | bytearray | mmap.mmap) -> Image.Image:
+    """Open an APOD image as a Pillow's Image object.
+
+    The image is decoded directly from memory, or from a memory-mapped file of the local mirror.
+    """
+
+    return Image.open(
+        img_data if isinstance(img_data, mmap.mmap) else io.BytesIO(img_data)
+    )
+
+
+def fetch_apod_image(url: str, date: str | None = None) -> FetchedImage:
+    """Fetch an APOD image from a given URL.
 
     Args:
         url: The URL of the image to fetch.
+        date: The date of the APOD, used to find the image in the local mirror (see `find_local_image`).
 
     Returns:
-        A tuple containing two elements:
+        A `FetchedImage` tuple containing four elements:
             - A Pillow's Image object representing the fetched image.
             - A string representing the content type of the fetched image.
             - A tuple containing the size of the image (width, height).
+            - The reason of the failure (`FetchFailure`), or None if the image was fetched.
+            - The content hash of the image (see `resultcache`).
 
     Notes:
-        The retrieved image is saved at ./.temp/apod_image.
+        The image is kept in memory, so several images can be fetched at the same time.
     """
 
-    logger.info(f"Fetching an APOD image ...")
+    local_image = find_local_image(date, url)
+    if local_image is not None:
+        import local
+
+        download = Download(local.open_image(local_image[0]), local_image[1])
+    else:
+        download = download_apod_image(url)
+
+    if download.failure is not None:
+        return FetchedImage(None, download.content_type, None, download.failure)
 
     try:
-        response = requests.get(url)
+        img = open_apod_image(download.data)
+        return FetchedImage(
+            img,
+            download.content_type,
+            img.size,
+            content_hash=resultcache.content_hash(download.data),
+        )
+    except (OSError, Image.DecompressionBombError) as exception:
+        logger.warning(f"Failed to decode the image: {exception}")
+        return FetchedImage(
+            None, download.content_type, None, FetchFailure.DECODE_ERROR
+        )
 
-        if response.status_code == 200:
-            content_type = response.headers.get("content-type")
 
-            if content_type and content_type.startswith("image/"):
-                img_data = response.content
-                with open("./.temp/apod_image", "wb") as handler:
-                    handler.write(img_data)
-                img = Image.open("./.temp/apod_image")
-                return img, content_type, img.size
-            else:
-                # todo: extract colors from a link/page anyway?
-                logger.warning("The URL does not point to an image.", {"url": url})
-                return None, content_type, None
-        elif response.status_code == 406:
-            logger.warning(
-                f"406 Not Acceptable, see: https://developer.mozilla.org/en-US/docs/Web/HTTP/Status/406"
-            )
+def analyze_apod_image(
+    img: Image.Image, content_hash: str | None = None
+) -> tuple[typing.List[str], typing.List[str]]:
+    """Extract the color palette and the filterable colors from an APOD image.
+
+    Args:
+        img: The APOD image. Must be a Pillow's Image object.
+        content_hash: The content hash of the downloaded image. If given, the result is looked up in
+            (and saved to) the result cache, so an unchanged image is not analyzed again (it is only
+            decoded if a preview is rendered from it).
+
+    Returns:
+        A tuple containing the color palette and the filterable colors, both as hexadecimal color codes.
+    """
+
+    if content_hash is not None:
+        cached = resultcache.get(content_hash)
+        if cached is not None:
+            logger.info("Using the cached colors of the image ...")
+            metrics.increment("result_cache_hits_total")
+            return cached
+
+    _colors_palette = (
+        colors.extract_colors(img) if config.get.save_color_palette is True else []
+    )
+    _filterable_colors = (
+        colors.find_closest_colors(_colors_palette)
+        if (
+            config.get.save_filterable_colors is True
+            and config.get.save_color_palette is True
+        )
+        else []
+    )
+
+    _hex_colors_palette = []
+    for _color in _colors_palette:
+        _hex_colors_palette.append(colors.rgb_to_hex(_color))
+
+    if content_hash is not None:
+        resultcache.put(content_hash, _hex_colors_palette, _filterable_colors)
 
-        return None, response.headers.get("content-type"), None
+    return _hex_colors_palette, _filterable_colors
+
+
+def _on_supabase_upload_failure(row: dict, exception: Exception) -> None:
+    """Mark a day as failed in the run manifest when its row could not be uploaded."""
+    manifest.record(
+        f"{row['year']}-{row['month']:02}-{row['day']:02}",
+        False,
+        f"upload_error: {exception}",
+    )
+
+
+def _get_supabase_uploader() -> supa.BatchUploader:
+    """Return the uploader used for saving APOD data to Supabase, creating it on first use."""
+
+    global _SUPABASE_UPLOADER
+
+    if _SUPABASE_UPLOADER is None:
+        _SUPABASE_UPLOADER = supa.BatchUploader(
+            supa.get_client(),
+            "apods_v1",
+            on_conflict="year,month,day",
+            batch_size=config.get.supabase_batch_size,
+            flush_interval=config.get.supabase_flush_interval,
+            retries=config.get.supabase_retries,
+            backoff=config.get.http_backoff,
+            on_failure=_on_supabase_upload_failure,
+        )
 
-    except:
-        return None, None, None
+    return _SUPABASE_UPLOADER
 
 
+def finalize() -> None:
+    """Flush and close everything that buffers saved APOD data (previews, Supabase uploads, the catalog, the color index).
+
+    Must be called once all the days are processed.
+    """
+
+    global _SUPABASE_UPLOADER
+
+    preview.close()
+
+    if _SUPABASE_UPLOADER is not None:
+        _SUPABASE_UPLOADER.close()
+        _SUPABASE_UPLOADER = None
+
+    catalog.close()
+    colorindex.close()
+    jobqueue.close()
+    manifest.close()
+    metacache.close()
+
+
+@metrics.span("persist")
 def save_apod_data(
     date: str,
     color_palette: typing.List[str],
@@ -143,7 +740,9 @@ def save_apod_data(
     img_size: tuple[int, int],
     is_animated: bool,
 ) -> None:
-    """Save APOD data (for a single day) to a JSON file.
+    """Save APOD data (for a single day) to Supabase, a JSON file or the catalog (`output_backend`).
+
+    Only the fields enabled by the `save_*` settings are saved; in the catalog, the other columns are left empty.
 
     Args:
         date: The date for which the APOD data is saved (format: "YYYY-MM-DD").
@@ -162,22 +761,55 @@ def save_apod_data(
         "date": date,
     }
 
+    if config.get.color_index is True:
+        colorindex.get_index().add(date, filterable_colors, media_type)
+
     if config.get.supabase_upload is True:
         date_obj = datetime.datetime.strptime(date, "%Y-%m-%d")
-        supabase_upload_v1(
-            date_obj.year,
-            date_obj.month,
-            date_obj.day,
-            url,
-            hdurl,
-            media_type,
-            img_size[0],
-            img_size[1],
-            round(img_size[0] / img_size[1], 1),
-            color_palette,
+        _get_supabase_uploader().add(
+            supa.apods_v1_row(
+                date_obj.year,
+                date_obj.month,
+                date_obj.day,
+                url,
+                hdurl,
+                media_type,
+                img_size[0],
+                img_size[1],
+                round(img_size[0] / img_size[1], 1),
+                color_palette,
+            )
+        )
+        return
+
+    if config.get.output_backend == "sqlite":
+        catalog.get_catalog().add(
+            {
+                "date": date,
+                "url": url if config.get.save_url is True else None,
+                "media_type": media_type
+                if config.get.save_media_type is True
+                else None,
+                "content_type": content_type
+                if config.get.save_content_type is True
+                else None,
+                "width": img_size[0] if config.get.save_img_width is True else None,
+                "height": img_size[1] if config.get.save_img_height is True else None,
+                "wh_ratio": round(img_size[0] / img_size[1], 1)
+                if config.get.save_img_wh_ratio
+                else None,
+                "is_animated": is_animated if config.get.save_is_animated else None,
+            },
+            color_palette if config.get.save_color_palette is True else None,
+            filterable_colors if config.get.save_filterable_colors is True else None,
         )
         return
 
+    if config.get.output_backend != "json":
+        raise utils.CriticalError(
+            f"Unknown 'output_backend': '{config.get.output_backend}' (expected 'json' or 'sqlite')"
+        )
+
     if config.get.save_url is True:
         dict_data["url"] = url
     if config.get.save_media_type is True:
@@ -200,12 +832,18 @@ def save_apod_data(
     final_data_json = json.dumps(dict_data, indent=4)
     date_obj = datetime.datetime.strptime(date, "%Y-%m-%d")
     outfile = pathlib.Path(
-        f"./.output/data/{date_obj.year}/{str(date_obj.month).zfill(2)}/{str(date_obj.day).zfill(2)}.json"
+        config.output_path(
+            "data",
+            str(date_obj.year),
+            str(date_obj.month).zfill(2),
+            f"{str(date_obj.day).zfill(2)}.json",
+        )
     )
     outfile.parent.mkdir(exist_ok=True, parents=True)
     outfile.write_text(final_data_json)
 
 
+@metrics.span("preview")
 def generate_combined_image(
     img: Image.Image,
     date: str,
@@ -214,6 +852,9 @@ def generate_combined_image(
 ) -> None:
     """Generate a combined image from an APOD image, its color palette, and filterable colors.
 
+    Only reducing the image (`preview_max_height`) happens here, the combined image and the
+    contact sheets (`preview_contact_sheets`) are rendered and saved on a background thread.
+
     Args:
         apod_image: The APOD image to be included in the combined image. Must be a Pillow's Image object.
         date: The APOD date for which the image is generated (YYYY-MM-DD).
@@ -221,51 +862,12 @@ def generate_combined_image(
         filterable_colors: The filterable colors corresponding to the color palette.
     """
 
-    if config.get.generate_combined_image is False:
+    if not preview.enabled():
         return
 
     logger.info(f"Generating a combined image for previewing results ...")
 
-    # todo: improve this implementation
-
-    img_width, img_height = img.size
-    new_image = Image.new(
-        "RGB", (img_width + 10 + 100 + 10 + 100 + 10, img_height), "white"
-    )
-    new_image.paste(img, (0, 0))
-
-    draw = ImageDraw.Draw(new_image)
-
-    rec_height = (img_height - 20) / len(color_palette)
-
-    pos_x = img_width + 10
-    pos_y = 10
-
-    for i, color in enumerate(color_palette):
-        draw.rectangle(
-            [
-                (pos_x, pos_y + i * rec_height),
-                (pos_x + 100, pos_y + (i + 1) * rec_height),
-            ],
-            fill=color,
-            outline=None,
-        )
-
-    pos_x = img_width + 10 + 100 + 10
-    pos_y = 10
-
-    if config.get.save_filterable_colors is True:
-        for i, color in enumerate(filterable_colors):
-            draw.rectangle(
-                [
-                    (pos_x, pos_y + i * rec_height),
-                    (pos_x + 100, pos_y + (i + 1) * rec_height),
-                ],
-                fill=color,
-                outline=None,
-            )
-
-    new_image.save(f"./.output/images/{date}.jpg", "JPEG")
+    preview.submit(date, preview.thumbnail(img), color_palette, filterable_colors)
 
 
 def extend_apod(
@@ -290,6 +892,7 @@ def extend_apod(
 
     Returns:
         A boolean: True is the operation was succesfull and False in case of an error.
+        The result (and the reason of a failure) is recorded in the run manifest (`manifest.record`).
 
     """
 
@@ -303,17 +906,10 @@ def extend_apod(
     if media_type not in ["image", "video"]:
         logger.critical("The media type was not recognized!")
         logger.warning("Skipping this day!")
+        manifest.record(date, False, "unknown_media_type")
         return False
 
-    _img_url = ""
-
-    if media_type == "video" and thumbnail_url:
-        _img_url = thumbnail_url
-    elif config.get.use_hdurl is True and hdurl:
-        _img_url = hdurl
-    else:
-        # fix: make sure it points to an image url
-        _img_url = url
+    _img_url = select_image_url(url, hdurl, thumbnail_url, media_type)
 
     logger.info(f"Extending APOD from {date} ...")
 
@@ -325,44 +921,50 @@ def extend_apod(
     # logger.debug(f"explanation:     {explanation}")
     logger.debug(f"_img_url:        {_img_url}")
 
-    _img, _content_type, _img_size = fetch_apod_image(_img_url)
+    _img, _content_type, _img_size, _failure, _content_hash = fetch_apod_image(
+        _img_url, date
+    )
+
+    _error = _failure.value if _failure is not None else None
+    _extended = False
 
     if _img is not None:
-        _colors_palette = (
-            colors.extract_colors(_img) if config.get.save_color_palette is True else []
-        )
-        _filterable_colors = (
-            colors.find_closest_colors(_colors_palette)
-            if (
-                config.get.save_filterable_colors is True
-                and config.get.save_color_palette is True
+        try:
+            _hex_colors_palette, _filterable_colors = analyze_apod_image(
+                _img, _content_hash
             )
-            else []
-        )
 
-        _hex_colors_palette = []
-        for _color in _colors_palette:
-            _hex_colors_palette.append(colors.rgb_to_hex(_color))
-
-        save_apod_data(
-            date,
-            _hex_colors_palette,
-            _filterable_colors,
-            _img_url,
-            hdurl,
-            media_type,
-            _content_type,
-            _img_size,
-            getattr(_img, "is_animated", False),
-        )
+            save_apod_data(
+                date,
+                _hex_colors_palette,
+                _filterable_colors,
+                _img_url,
+                hdurl,
+                media_type,
+                _content_type,
+                _img_size,
+                getattr(_img, "is_animated", False),
+            )
 
-        generate_combined_image(_img, date, _hex_colors_palette, _filterable_colors)
+            generate_combined_image(_img, date, _hex_colors_palette, _filterable_colors)
+            _extended = True
+        except Exception as exception:
+            # the same as a failed analysis in a worker process (see `pipeline.run`)
+            logger.error(f"Failed to extend APOD from {date}: {exception}")
+            _error = f"{type(exception).__name__}: {exception}"
+        finally:
+            # the full-resolution image is not needed anymore (the preview is a reduced copy)
+            _img.close()
 
-    else:
-        logger.warning("This APOD was NOT extended!")
+    elif _failure is not None:
+        logger.warning(f"This APOD was NOT extended! ({_failure.value})")
+        metrics.increment("fetch_failures_total", reason=_failure.value)
+
+    metrics.increment("days_total", status="extended" if _extended else "failed")
+    manifest.record(date, _extended, _error)
 
     logger.info(
         f"Finished in {colorama.Style.BRIGHT}{(datetime.datetime.now() - _apod_start_time).total_seconds()}{colorama.Style.NORMAL} sec!"
     )
 
-    return True
+    return _extended
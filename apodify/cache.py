@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import pathlib
+import threading
+import typing
+
+from logger import logger
+
+# eviction frees space down to this share of the size cap, so the blobs are scanned rarely
+LOW_WATER_MARK = 0.9
+
+
+class DiskCache:
+    """A content-addressed on-disk cache with a size cap and LRU eviction.
+
+    Every key (e.g. a URL) has a small JSON entry with its metadata, which points to a blob
+    named after the SHA-256 hash of its content. Blobs with the same content are stored only once.
+    The modification time of a blob is used as its last access time. Once the cache grows past
+    its cap, the least recently used blobs are evicted down to `LOW_WATER_MARK` of the cap.
+    """
+
+    def __init__(self, directory: str, max_bytes: int) -> None:
+        self.directory = pathlib.Path(directory)
+        self.max_bytes = max_bytes
+
+        self._entries_dir = self.directory / "entries"
+        self._blobs_dir = self.directory / "blobs"
+        self._entries_dir.mkdir(parents=True, exist_ok=True)
+        self._blobs_dir.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._size = sum(blob.stat().st_size for blob in self._iter_blobs())
+
+    def _iter_blobs(self) -> typing.Iterator[pathlib.Path]:
+        return (path for path in self._blobs_dir.glob("*/*") if path.is_file())
+
+    def _entry_path(self, key: str) -> pathlib.Path:
+        return self._entries_dir / f"{hashlib.sha256(key.encode()).hexdigest()}.json"
+
+    def _blob_path(self, content_hash: str) -> pathlib.Path:
+        return self._blobs_dir / content_hash[:2] / content_hash
+
+    @staticmethod
+    def _write_atomic(path: pathlib.Path, data: bytes) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(
+            f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+        )
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+
+    def get_meta(self, key: str) -> dict | None:
+        """Return the metadata stored for a key, or None if the key is not cached."""
+
+        try:
+            meta = json.loads(self._entry_path(key).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+        if not self._blob_path(meta["hash"]).is_file():
+            # the blob was evicted
+            self._entry_path(key).unlink(missing_ok=True)
+            return None
+
+        return meta
+
+    def get(self, key: str) -> tuple[bytes, dict] | None:
+        """Return the content and the metadata stored for a key, or None if the key is not cached."""
+
+        meta = self.get_meta(key)
+        if meta is None:
+            return None
+
+        blob_path = self._blob_path(meta["hash"])
+        try:
+            data = blob_path.read_bytes()
+            os.utime(blob_path)
+        except OSError:
+            return None
+
+        return data, meta
+
+    def put(self, key: str, data: bytes, meta: dict | None = None) -> str:
+        """Store content for a key.
+
+        Args:
+            key: The key of the content (e.g. a URL).
+            data: The content to store.
+            meta: Additional metadata stored next to the content.
+
+        Returns:
+            The SHA-256 hash of the content.
+        """
+
+        content_hash = hashlib.sha256(data).hexdigest()
+        blob_path = self._blob_path(content_hash)
+
+        with self._lock:
+            if blob_path.is_file():
+                os.utime(blob_path)
+            else:
+                self._write_atomic(blob_path, data)
+                self._size += len(data)
+
+        self._write_atomic(
+            self._entry_path(key),
+            json.dumps(
+                {**(meta or {}), "key": key, "hash": content_hash, "size": len(data)}
+            ).encode(),
+        )
+
+        if self._size > self.max_bytes:
+            self.evict()
+
+        return content_hash
+
+    def evict(self) -> None:
+        """Remove the least recently used blobs until the cache is within `LOW_WATER_MARK` of its size cap."""
+
+        with self._lock:
+            blobs = sorted(
+                ((blob, blob.stat()) for blob in self._iter_blobs()),
+                key=lambda blob: blob[1].st_mtime,
+            )
+            # other processes may share the cache, the scan gives its actual size
+            self._size = sum(stat.st_size for _, stat in blobs)
+
+            evicted = 0
+            for blob, stat in blobs:
+                if self._size <= self.max_bytes * LOW_WATER_MARK:
+                    break
+                blob.unlink(missing_ok=True)
+                self._size -= stat.st_size
+                evicted += 1
+
+        logger.debug(f"{evicted} blob/s evicted from the cache at '{self.directory}'.")
@@ -0,0 +1,256 @@
+import config
+import pathlib
+import sqlite3
+import threading
+import typing
+
+from logger import logger
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS apods (
+    date TEXT PRIMARY KEY,
+    url TEXT,
+    media_type TEXT,
+    content_type TEXT,
+    width INTEGER,
+    height INTEGER,
+    wh_ratio REAL,
+    is_animated INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS colors (
+    date TEXT NOT NULL REFERENCES apods (date) ON DELETE CASCADE,
+    kind TEXT NOT NULL CHECK (kind IN ('palette', 'filterable')),
+    position INTEGER NOT NULL,
+    color TEXT NOT NULL,
+    PRIMARY KEY (date, kind, position)
+);
+
+CREATE INDEX IF NOT EXISTS apods_media_type ON apods (media_type, date);
+CREATE INDEX IF NOT EXISTS apods_dimensions ON apods (width, height);
+CREATE INDEX IF NOT EXISTS colors_color ON colors (kind, color, date);
+"""
+
+_UPSERT_APOD = """
+INSERT INTO apods (date, url, media_type, content_type, width, height, wh_ratio, is_animated)
+VALUES (:date, :url, :media_type, :content_type, :width, :height, :wh_ratio, :is_animated)
+ON CONFLICT (date) DO UPDATE SET
+    url = excluded.url,
+    media_type = excluded.media_type,
+    content_type = excluded.content_type,
+    width = excluded.width,
+    height = excluded.height,
+    wh_ratio = excluded.wh_ratio,
+    is_animated = excluded.is_animated
+"""
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+class Catalog:
+    """A SQLite database with the saved APOD data (one row per day), used instead of JSON files.
+
+    Colors are kept in a separate table (one row per color of the palette or of the filterable colors),
+    so days can be searched by color with an index. Days are written in batched transactions;
+    pending days are committed when the batch is full and on `flush` / `close`.
+
+    Args:
+        path: The path of the database file.
+        batch_size: The number of days written in a single transaction.
+    """
+
+    def __init__(self, path: str, batch_size: int = 500) -> None:
+        self.path = pathlib.Path(path)
+        self.batch_size = batch_size
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        # days are saved from the main thread only, the lock guards `flush` called at exit
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.execute("PRAGMA synchronous = NORMAL")
+        self._connection.execute("PRAGMA foreign_keys = ON")
+        self._connection.executescript(_SCHEMA)
+
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def add(
+        self,
+        row: typing.Dict[str, typing.Any],
+        color_palette: typing.List[str] | None,
+        filterable_colors: typing.List[str] | None,
+    ) -> None:
+        """Queue a day to be saved, replacing the data saved before for the same date.
+
+        Args:
+            row: The values of the `apods` table; `None` for the fields which are not saved.
+            color_palette: The color palette, or `None` if it is not saved.
+            filterable_colors: The filterable colors, or `None` if they are not saved.
+        """
+
+        with self._lock:
+            self._pending.append((row, color_palette, filterable_colors))
+            if len(self._pending) >= self.batch_size:
+                self._write()
+
+    def _write(self) -> None:
+        if not self._pending:
+            return
+
+        colors = [
+            (row["date"], kind, position, color)
+            for row, color_palette, filterable_colors in self._pending
+            for kind, palette in (
+                ("palette", color_palette),
+                ("filterable", filterable_colors),
+            )
+            for position, color in enumerate(palette or [])
+        ]
+
+        with self._connection:
+            self._connection.executemany(
+                _UPSERT_APOD, [row for row, _, _ in self._pending]
+            )
+            self._connection.executemany(
+                "DELETE FROM colors WHERE date = ?",
+                [(row["date"],) for row, _, _ in self._pending],
+            )
+            self._connection.executemany(
+                "INSERT INTO colors (date, kind, position, color) VALUES (?, ?, ?, ?)",
+                colors,
+            )
+
+        logger.debug(f"{len(self._pending)} day/s written to the catalog.")
+        self._pending = []
+
+    def flush(self) -> None:
+        """Write all queued days."""
+
+        with self._lock:
+            self._write()
+
+    def dates(self) -> typing.Set[str]:
+        """Return the dates of all saved days (including the queued ones)."""
+
+        with self._lock:
+            return {
+                date for (date,) in self._connection.execute("SELECT date FROM apods")
+            } | {row["date"] for row, _, _ in self._pending}
+
+    def iter_filterable(
+        self,
+    ) -> typing.Iterator[typing.Tuple[str, typing.List[str], str | None]]:
+        """Iterate over (date, filterable colors, media type) of all saved days."""
+
+        self.flush()
+
+        filterable = {}
+        for date, color in self._connection.execute(
+            "SELECT date, color FROM colors WHERE kind = 'filterable' ORDER BY date, position"
+        ):
+            filterable.setdefault(date, []).append(color)
+
+        for date, media_type in self._connection.execute(
+            "SELECT date, media_type FROM apods ORDER BY date"
+        ):
+            yield date, filterable.get(date, []), media_type
+
+    def iter_days(
+        self,
+    ) -> typing.Iterator[
+        typing.Tuple[
+            typing.Dict[str, typing.Any],
+            typing.List[str] | None,
+            typing.List[str] | None,
+        ]
+    ]:
+        """Iterate over (row, color palette, filterable colors) of all saved days, as taken by `add`."""
+
+        self.flush()
+
+        colors = {}
+        for date, kind, color in self._connection.execute(
+            "SELECT date, kind, color FROM colors ORDER BY date, kind, position"
+        ):
+            colors.setdefault((date, kind), []).append(color)
+
+        cursor = self._connection.execute("SELECT * FROM apods ORDER BY date")
+        columns = [column[0] for column in cursor.description]
+        for values in cursor:
+            row = dict(zip(columns, values))
+            yield row, colors.get((row["date"], "palette")), colors.get(
+                (row["date"], "filterable")
+            )
+
+    def iter_palettes(self) -> typing.Iterator[typing.Tuple[str, typing.List[str]]]:
+        """Iterate over (date, color palette) of all saved days with filterable colors."""
+
+        self.flush()
+
+        palettes = {}
+        for date, color in self._connection.execute(
+            "SELECT date, color FROM colors WHERE kind = 'palette' "
+            "AND date IN (SELECT date FROM colors WHERE kind = 'filterable') "
+            "ORDER BY date, position"
+        ):
+            palettes.setdefault(date, []).append(color)
+
+        yield from palettes.items()
+
+    def update_filterable(self, filterable: typing.Dict[str, typing.List[str]]) -> None:
+        """Replace the filterable colors of saved days in a single transaction.
+
+        Args:
+            filterable: The new filterable colors keyed by date.
+        """
+
+        self.flush()
+
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "DELETE FROM colors WHERE date = ? AND kind = 'filterable'",
+                [(date,) for date in filterable],
+            )
+            self._connection.executemany(
+                "INSERT INTO colors (date, kind, position, color) VALUES (?, 'filterable', ?, ?)",
+                [
+                    (date, position, color)
+                    for date, colors in filterable.items()
+                    for position, color in enumerate(colors)
+                ],
+            )
+
+    def close(self) -> None:
+        """Write all queued days and close the database."""
+
+        with self._lock:
+            self._write()
+            self._connection.close()
+
+
+def get_catalog() -> Catalog:
+    """Return the catalog at `catalog_path` (within `output_dir`), opening it on first use."""
+
+    global _catalog
+
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = Catalog(
+                config.output_path(config.get.catalog_path),
+                config.get.catalog_batch_size,
+            )
+
+    return _catalog
+
+
+def close() -> None:
+    """Close the catalog if it was opened."""
+
+    global _catalog
+
+    with _catalog_lock:
+        if _catalog is not None:
+            _catalog.close()
+            _catalog = None
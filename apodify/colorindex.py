@@ -0,0 +1,267 @@
+import argparse
+import base64
+import catalog
+import config
+import datetime
+import json
+import os
+import pathlib
+import threading
+import time
+import typing
+
+from logger import logger
+
+# the date of the first APOD, which is bit 0 of every bitmap
+EPOCH = datetime.date(1995, 6, 16)
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def _to_bit(date: str) -> int:
+    return (datetime.date.fromisoformat(date) - EPOCH).days
+
+
+def _to_date(bit: int) -> str:
+    return str(EPOCH + datetime.timedelta(days=bit))
+
+
+def _encode(bitmap: int) -> str:
+    return base64.b64encode(
+        bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+    ).decode("ascii")
+
+
+def _decode(data: str) -> int:
+    return int.from_bytes(base64.b64decode(data), "little")
+
+
+class ColorIndex:
+    """An inverted index mapping filterable colors and media types to the dates of the APODs.
+
+    Each color and media type has a bitmap (a Python integer), where bit N is set
+    if the APOD from N days after `EPOCH` has that color / media type.
+    Queries combine the bitmaps with bitwise operations, so they take milliseconds
+    even for the whole archive.
+    """
+
+    def __init__(self) -> None:
+        self.days = 0
+        self.colors: typing.Dict[str, int] = {}
+        self.media_types: typing.Dict[str, int] = {}
+        self.modified = False
+
+    def remove(self, date: str) -> None:
+        """Remove a day from the index."""
+
+        mask = ~(1 << _to_bit(date))
+
+        self.days &= mask
+        for bitmaps in (self.colors, self.media_types):
+            for key in bitmaps:
+                bitmaps[key] &= mask
+
+        self.modified = True
+
+    def add(
+        self, date: str, filterable_colors: typing.List[str], media_type: str | None
+    ) -> None:
+        """Add a day to the index, replacing the previous entry of the same date.
+
+        Args:
+            date: The date of the APOD (format: "YYYY-MM-DD").
+            filterable_colors: The filterable colors of the APOD.
+            media_type: The media type returned by the APOD API.
+        """
+
+        bit = 1 << _to_bit(date)
+
+        if self.days & bit:
+            self.remove(date)
+
+        self.days |= bit
+        for color in filterable_colors:
+            self.colors[color.upper()] = self.colors.get(color.upper(), 0) | bit
+        if media_type:
+            self.media_types[media_type] = self.media_types.get(media_type, 0) | bit
+
+        self.modified = True
+
+    def query(
+        self,
+        all_colors: typing.Iterable[str] = (),
+        any_colors: typing.Iterable[str] = (),
+        start_date: str | None = None,
+        end_date: str | None = None,
+        media_type: str | None = None,
+    ) -> typing.List[str]:
+        """Find the dates of the APODs matching all the given constraints.
+
+        Args:
+            all_colors: Filterable colors which must all be present.
+            any_colors: Filterable colors of which at least one must be present.
+            start_date: The first date (format: "YYYY-MM-DD").
+            end_date: The last date (format: "YYYY-MM-DD").
+            media_type: The media type returned by the APOD API.
+
+        Returns:
+            The sorted dates.
+        """
+
+        result = self.days
+
+        for color in all_colors:
+            result &= self.colors.get(color.upper(), 0)
+
+        any_colors = list(any_colors)
+        if any_colors:
+            matches = 0
+            for color in any_colors:
+                matches |= self.colors.get(color.upper(), 0)
+            result &= matches
+
+        if media_type is not None:
+            result &= self.media_types.get(media_type, 0)
+
+        if start_date is not None:
+            result &= ~((1 << max(0, _to_bit(start_date))) - 1)
+        if end_date is not None:
+            if _to_bit(end_date) < 0:
+                return []
+            result &= (1 << (_to_bit(end_date) + 1)) - 1
+
+        # the positions of the set bits, from the least significant one
+        return [
+            _to_date(bit)
+            for bit, value in enumerate(reversed(bin(result)[2:]))
+            if value == "1"
+        ]
+
+    def to_dict(self) -> dict:
+        return {
+            "epoch": str(EPOCH),
+            "days": _encode(self.days),
+            "colors": {color: _encode(bm) for color, bm in self.colors.items() if bm},
+            "media_types": {
+                media_type: _encode(bm)
+                for media_type, bm in self.media_types.items()
+                if bm
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ColorIndex":
+        index = cls()
+        index.days = _decode(data["days"])
+        index.colors = {color: _decode(bm) for color, bm in data["colors"].items()}
+        index.media_types = {
+            media_type: _decode(bm) for media_type, bm in data["media_types"].items()
+        }
+        return index
+
+    @classmethod
+    def load(cls, path: str) -> "ColorIndex":
+        """Load an index from a file, or return an empty index if there is no file."""
+
+        if not os.path.isfile(path):
+            return cls()
+
+        return cls.from_dict(json.loads(pathlib.Path(path).read_text(encoding="utf-8")))
+
+    def save(self, path: str) -> None:
+        path = pathlib.Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        tmp_path = path.with_name(f"{path.name}.tmp")
+        tmp_path.write_text(json.dumps(self.to_dict()), encoding="utf-8")
+        os.replace(tmp_path, path)
+
+        self.modified = False
+
+
+def get_index() -> ColorIndex:
+    """Return the index at `color_index_path` (within `output_dir`), loading it on first use."""
+
+    global _index
+
+    with _index_lock:
+        if _index is None:
+            _index = ColorIndex.load(config.output_path(config.get.color_index_path))
+
+    return _index
+
+
+def close() -> None:
+    """Save the index if it was changed."""
+
+    global _index
+
+    with _index_lock:
+        if _index is not None and _index.modified:
+            logger.info("Saving the color index ...")
+            _index.save(config.output_path(config.get.color_index_path))
+        _index = None
+
+
+def _saved_days() -> typing.Iterator[typing.Tuple[str, typing.List[str], str | None]]:
+    """Read (date, filterable colors, media type) of every saved day from the output backend."""
+
+    if config.get.output_backend == "sqlite":
+        yield from catalog.get_catalog().iter_filterable()
+        return
+
+    for path in sorted(pathlib.Path(config.output_path("data")).glob("*/*/*.json")):
+        data = json.loads(path.read_text(encoding="utf-8"))
+        yield data["date"], data.get("filterable", []), data.get("media_type")
+
+
+def rebuild() -> ColorIndex:
+    """Build the index from scratch from the saved data (`output_backend`) and save it."""
+
+    global _index
+
+    index = ColorIndex()
+    for date, filterable_colors, media_type in _saved_days():
+        index.add(date, filterable_colors, media_type)
+
+    index.save(config.output_path(config.get.color_index_path))
+
+    with _index_lock:
+        _index = index
+
+    return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Find APODs by their filterable colors."
+    )
+    parser.add_argument(
+        "--all", nargs="+", default=[], metavar="COLOR", help="all of the colors"
+    )
+    parser.add_argument(
+        "--any", nargs="+", default=[], metavar="COLOR", help="any of the colors"
+    )
+    parser.add_argument("--start-date")
+    parser.add_argument("--end-date")
+    parser.add_argument("--media-type")
+    parser.add_argument(
+        "--rebuild", action="store_true", help="rebuild the index from the saved data"
+    )
+    args = parser.parse_args()
+
+    config.init()
+
+    index = rebuild() if args.rebuild else get_index()
+
+    start_time = time.perf_counter()
+    dates = index.query(
+        args.all, args.any, args.start_date, args.end_date, args.media_type
+    )
+    query_time = time.perf_counter() - start_time
+
+    for date in dates:
+        print(date)
+
+    logger.info(f"{len(dates)} day/s found in {round(query_time * 1000, 2)} ms.")
@@ -1,13 +1,33 @@
 import colorsys
 import config
-import extcolors
+import convcolors
+import extractors
+import hashlib
 import math
+import metrics
+import mmap
+import os
+import pathlib
 import typing
+import utils
 
-from PIL import Image, ImageDraw
+from PIL import Image
 from logger import logger
 
+# numpy is only needed for building the lookup table of the closest filter colors and for
+# re-filtering saved palettes in a batch, see `find_closest_colors_batch`
+if typing.TYPE_CHECKING:
+    import numpy as np
+
+# saved within `output_dir`
+FILTER_COLORS_PREVIEW_NAME = "filter_colors_preview.png"
+
 _FILTER_COLORS = None
+_FILTER_COLORS_LUT = None
+_FILTER_COLORS_VERSION = None
+
+# the modes `Image.reduce` averages as colors (palette indices and bilevel pixels are not)
+_REDUCIBLE_MODES = ("L", "LA", "RGB", "RGBA")
 
 
 def rgb_to_hex(rgb: typing.Tuple[int, int, int]) -> str:
@@ -27,19 +47,45 @@ def hex_to_rgb(hex_color: str) -> typing.Tuple[int, int, int]:
     return (r, g, b)
 
 
-def generate_filter_colors() -> None:
-    """Generate a list of visually distinct colors for filtering purposes.
+def _filter_hex_colors() -> typing.List[str]:
+    """Return the filter colors: 12 hues with 4 saturations and 4 values each, and 6 shades of gray."""
 
-    A preview image of the colors is generated as well.
-    """
+    hex_colors = []
 
-    global _FILTER_COLORS
-    if _FILTER_COLORS is not None:
-        return
+    for x in range(12):
+        for xx in range(4):
+            for xxx in range(4):
+                h = 360 - (30 * x)
+                s = 100 - (25 * xx)
+                v = 100 - (25 * xxx)
+
+                s = s / 100.0
+                v = v / 100.0
+
+                r, g, b = colorsys.hsv_to_rgb(h / 360, s, v)
+
+                hex_colors.append(
+                    "#{:02X}{:02X}{:02X}".format(
+                        int(r * (256 if r < 1 else 255)),
+                        int(g * (256 if g < 1 else 255)),
+                        int(b * (256 if b < 1 else 255)),
+                    )
+                )
+
+    hex_colors.append("#000000")
+    hex_colors.append("#333333")
+    hex_colors.append("#666666")
+    hex_colors.append("#999999")
+    hex_colors.append("#cccccc")
+    hex_colors.append("#ffffff")
+
+    return hex_colors
 
-    logger.info(
-        "Generating a list of filterable colors and a preview image for them ..."
-    )
+
+def _save_filter_colors_preview(hex_colors: typing.List[str], path: str) -> None:
+    """Save a preview image of the filter colors (one row per hue, the shades of gray at the bottom)."""
+
+    from PIL import ImageDraw
 
     img_width = 16 * 10
     img_height = 12 * 10
@@ -48,8 +94,6 @@ def generate_filter_colors() -> None:
 
     rec_pos_y = 0
 
-    hex_colors = []
-
     for x in range(12):
         rec_pos_x = 0
         draw.rectangle([0, rec_pos_y, 10, rec_pos_y + 10], fill="#000000")
@@ -57,25 +101,9 @@ def generate_filter_colors() -> None:
 
         for xx in range(4):
             for xxx in range(4):
-                h = 360 - (30 * x)
-                s = 100 - (25 * xx)
-                v = 100 - (25 * xxx)
-
-                s = s / 100.0
-                v = v / 100.0
-
-                r, g, b = colorsys.hsv_to_rgb(h / 360, s, v)
-
-                hex_color = "#{:02X}{:02X}{:02X}".format(
-                    int(r * (256 if r < 1 else 255)),
-                    int(g * (256 if g < 1 else 255)),
-                    int(b * (256 if b < 1 else 255)),
-                )
-                hex_colors.append(hex_color)
-
                 draw.rectangle(
                     [rec_pos_x, rec_pos_y, rec_pos_x + 10, rec_pos_y + 10],
-                    fill=hex_color,
+                    fill=hex_colors[16 * x + 4 * xx + xxx],
                 )
                 rec_pos_x += 10
 
@@ -85,13 +113,6 @@ def generate_filter_colors() -> None:
 
         rec_pos_y += 10
 
-    hex_colors.append("#000000")
-    hex_colors.append("#333333")
-    hex_colors.append("#666666")
-    hex_colors.append("#999999")
-    hex_colors.append("#cccccc")
-    hex_colors.append("#ffffff")
-
     draw.rectangle([0, img_height, img_width + 10, img_height + 10], fill="#000000")
 
     draw.rectangle([10, img_height, 50, img_height + 10], fill="#333333")
@@ -104,11 +125,189 @@ def generate_filter_colors() -> None:
         fill="#ffffff",
     )
 
-    image.save("./.output/filter_colors_preview.png")
+    image.save(path)
+
+
+def generate_filter_colors(preview: bool = True) -> None:
+    """Generate a list of visually distinct colors for filtering purposes.
+
+    The list is generated once per process. The preview image is only saved
+    if it does not exist yet, since the filter colors never change between runs.
+
+    Args:
+        preview: Whether to save a preview image of the colors as well.
+    """
+
+    global _FILTER_COLORS, _FILTER_COLORS_LUT
+    if _FILTER_COLORS is not None:
+        return
+
+    logger.info("Generating a list of filterable colors ...")
+
+    hex_colors = _filter_hex_colors()
+
+    preview_path = config.output_path(FILTER_COLORS_PREVIEW_NAME)
+    if preview is True and not os.path.isfile(preview_path):
+        logger.info("Saving a preview image of the filterable colors ...")
+        _save_filter_colors_preview(hex_colors, preview_path)
 
     rgb_colors = [hex_to_rgb(hex_color) for hex_color in hex_colors]
 
     _FILTER_COLORS = rgb_colors
+    _FILTER_COLORS_LUT = _load_filter_colors_lut(
+        rgb_colors, config.get.filter_colors_metric, config.get.filter_colors_lut_bits
+    )
+
+
+def filter_colors_version() -> str:
+    """Return a short digest of the filter colors and the color difference metric.
+
+    The closest colors found for a palette stay the same as long as the version does,
+    see `resultcache`. Like the filter colors, the version is computed once per process.
+    """
+
+    global _FILTER_COLORS_VERSION
+    if _FILTER_COLORS_VERSION is None:
+        _FILTER_COLORS_VERSION = hashlib.sha256(
+            f"{config.get.filter_colors_metric}/{_filter_hex_colors()}".encode()
+        ).hexdigest()[:16]
+
+    return _FILTER_COLORS_VERSION
+
+
+def reduce_for_extraction(img: Image.Image) -> Image.Image:
+    """Reduce the resolution of an image to fit within the `extraction_max_pixels` budget.
+
+    A JPEG image that has not been loaded yet is decoded at a fraction of its full size
+    (Pillow's draft mode), any other image is downscaled with `Image.reduce`.
+    Palette, bilevel and other images are converted to RGB (RGBA if they have transparency) first.
+
+    Args:
+        img: The image to reduce. Must be a Pillow's Image object.
+
+    Returns:
+        The reduced image, or the same image if it already fits within the budget.
+
+    Notes:
+        Draft mode is applied in place, so the size of the given image may change.
+        Read the original size (e.g. for `width`/`height`) before calling this function.
+    """
+
+    max_pixels = config.get.extraction_max_pixels
+
+    if not max_pixels or img.width * img.height <= max_pixels:
+        return img
+
+    original_size = img.size
+
+    if img.format == "JPEG":
+        scale = math.sqrt(max_pixels / (img.width * img.height))
+        img.draft("RGB", (int(img.width * scale), int(img.height * scale)))
+
+    if img.width * img.height > max_pixels:
+        if img.mode not in _REDUCIBLE_MODES:
+            img = img.convert("RGBA" if img.has_transparency_data else "RGB")
+        img = img.reduce(math.ceil(math.sqrt(img.width * img.height / max_pixels)))
+
+    logger.debug(f"Image reduced from {original_size} to {img.size} for extraction.")
+
+    return img
+
+
+def sample_frames(n_frames: int, budget: int) -> typing.List[int]:
+    """Pick up to `budget` evenly spaced frames of an animation, including the first and the last one.
+
+    Args:
+        n_frames: The number of frames of the animation.
+        budget: The maximum number of frames (`extraction_frames`).
+
+    Returns:
+        The indices of the frames, in ascending order.
+    """
+
+    count = min(max(1, budget), n_frames)
+    if count == 1:
+        return [0]
+
+    return [round(i * (n_frames - 1) / (count - 1)) for i in range(count)]
+
+
+def merge_palettes(
+    palettes: typing.List[typing.List[typing.Tuple[typing.Tuple[int, int, int], int]]],
+    tolerance: int,
+    limit: int | None,
+) -> typing.List[typing.Tuple[typing.Tuple[int, int, int], int]]:
+    """Combine the palettes of several frames into one palette weighted by pixel counts.
+
+    Pixel counts of the same color are added up. Going from the most common color, every less
+    common color closer than `tolerance` (CIE76) is merged into it, like `extcolors` does
+    within a single image.
+
+    Args:
+        palettes: (RGB color, pixel count) tuples of every frame, as returned by the extraction backends.
+        tolerance: The color difference below which colors are merged.
+        limit: The maximum number of colors.
+
+    Returns:
+        (RGB color, pixel count) tuples, the most common color first.
+    """
+
+    counts: typing.Dict[typing.Tuple[int, int, int], int] = {}
+    for palette in palettes:
+        for color, count in palette:
+            counts[color] = counts.get(color, 0) + count
+
+    # [color, L*a*b* color, pixel count]
+    merged = []
+    for color, count in sorted(counts.items(), key=lambda item: item[1], reverse=True):
+        lab = convcolors.rgb_to_lab(color)
+        for larger in merged:
+            if tolerance > 0 and math.dist(larger[1], lab) < tolerance:
+                larger[2] += count
+                break
+        else:
+            merged.append([color, lab, count])
+
+    merged.sort(key=lambda item: item[2], reverse=True)
+
+    if limit:
+        merged = merged[: int(limit)]
+
+    return [(color, count) for color, _, count in merged]
+
+
+def _extract_frames(
+    img: Image.Image, extract: extractors.Backend
+) -> typing.List[typing.Tuple[typing.Tuple[int, int, int], int]]:
+    """Extract a combined palette from the sampled frames of an animated image.
+
+    The frames are decoded one at a time (the decoder reuses its frame) and only the small
+    palette of each frame is kept, so memory does not grow with the length of the animation.
+    """
+
+    frames = sample_frames(img.n_frames, config.get.extraction_frames)
+
+    logger.debug(f"Sampling {len(frames)} of {img.n_frames} frames ...")
+
+    palettes = []
+
+    for index in frames:
+        with metrics.span("decode"):
+            img.seek(index)
+            frame = reduce_for_extraction(img)
+            frame.load()
+
+        with metrics.span("extract"):
+            palettes.append(extract(frame, config.get.extcolors_tolerance, None))
+
+    metrics.increment("frames_sampled_total", len(frames))
+
+    # the preview and everything else after the extraction see the first frame, as before
+    img.seek(0)
+
+    return merge_palettes(
+        palettes, config.get.extcolors_tolerance, config.get.extcolors_limit
+    )
 
 
 def extract_colors(img: Image.Image) -> typing.List[typing.Tuple[int, int, int]]:
@@ -123,52 +322,404 @@ def extract_colors(img: Image.Image) -> typing.List[typing.Tuple[int, int, int]]
     Notes:
         A lower 'tolerance' value results in more distinct colors being extracted.
         The `limit` parameter determines the maximum number of colors to be extracted from the image.
+        Large images are reduced first, see `reduce_for_extraction`.
+        The extraction itself is done by the backend selected with `extraction_backend`, see `extractors`.
+        For animated images, up to `extraction_frames` evenly spaced frames are used, see `merge_palettes`.
     """
 
     logger.info(f"Extracting colors from the image ...")
 
-    colors = extcolors.extract_from_image(
-        img, config.get.extcolors_tolerance, config.get.extcolors_limit
+    extract = extractors.get_backend(config.get.extraction_backend)
+
+    if getattr(img, "is_animated", False) and config.get.extraction_frames > 1:
+        colors = _extract_frames(img, extract)
+        return [(r, g, b) for (r, g, b), _ in colors]
+
+    # pixels are decoded here, at the reduced resolution
+    with metrics.span("decode"):
+        img = reduce_for_extraction(img)
+        img.load()
+
+    with metrics.span("extract"):
+        colors = extract(
+            img, config.get.extcolors_tolerance, config.get.extcolors_limit
+        )
+    return [(r, g, b) for (r, g, b), _ in colors]
+
+
+def _delta_e_cie2000(
+    lab1: typing.Tuple[float, float, float], lab2: typing.Tuple[float, float, float]
+) -> float:
+    """Calculate the CIEDE2000 color difference between two colors in the CIE L*a*b* color space.
+
+    See: https://hajim.rochester.edu/ece/sites/gsharma/ciede2000/ciede2000noteCRNA.pdf
+    """
+
+    l1, a1, b1 = lab1
+    l2, a2, b2 = lab2
+
+    c_avg = (math.hypot(a1, b1) + math.hypot(a2, b2)) / 2
+    g = 0.5 * (1 - math.sqrt(c_avg**7 / (c_avg**7 + 25**7)))
+
+    a1_p = (1 + g) * a1
+    a2_p = (1 + g) * a2
+    c1_p = math.hypot(a1_p, b1)
+    c2_p = math.hypot(a2_p, b2)
+    h1_p = math.degrees(math.atan2(b1, a1_p)) % 360
+    h2_p = math.degrees(math.atan2(b2, a2_p)) % 360
+
+    delta_l_p = l2 - l1
+    delta_c_p = c2_p - c1_p
+
+    if c1_p * c2_p == 0:
+        delta_h_p = 0
+        h_avg_p = h1_p + h2_p
+    else:
+        delta_h_p = h2_p - h1_p
+        if delta_h_p > 180:
+            delta_h_p -= 360
+        elif delta_h_p < -180:
+            delta_h_p += 360
+
+        h_avg_p = (h1_p + h2_p) / 2
+        if abs(h1_p - h2_p) > 180:
+            h_avg_p += 180 if h1_p + h2_p < 360 else -180
+
+    delta_big_h_p = 2 * math.sqrt(c1_p * c2_p) * math.sin(math.radians(delta_h_p / 2))
+
+    l_avg_p = (l1 + l2) / 2
+    c_avg_p = (c1_p + c2_p) / 2
+
+    t = (
+        1
+        - 0.17 * math.cos(math.radians(h_avg_p - 30))
+        + 0.24 * math.cos(math.radians(2 * h_avg_p))
+        + 0.32 * math.cos(math.radians(3 * h_avg_p + 6))
+        - 0.20 * math.cos(math.radians(4 * h_avg_p - 63))
+    )
+    delta_theta = 30 * math.exp(-(((h_avg_p - 275) / 25) ** 2))
+    r_c = 2 * math.sqrt(c_avg_p**7 / (c_avg_p**7 + 25**7))
+    s_l = 1 + (0.015 * (l_avg_p - 50) ** 2) / math.sqrt(20 + (l_avg_p - 50) ** 2)
+    s_c = 1 + 0.045 * c_avg_p
+    s_h = 1 + 0.015 * c_avg_p * t
+    r_t = -math.sin(math.radians(2 * delta_theta)) * r_c
+
+    return math.sqrt(
+        (delta_l_p / s_l) ** 2
+        + (delta_c_p / s_c) ** 2
+        + (delta_big_h_p / s_h) ** 2
+        + r_t * (delta_c_p / s_c) * (delta_big_h_p / s_h)
     )
-    return [(r, g, b) for (r, g, b), _ in colors[0]]
+
+
+def _delta_e_cie76_array(lab1: "np.ndarray", lab2: "np.ndarray") -> "np.ndarray":
+    """Calculate the CIE76 color differences between N and M colors in the CIE L*a*b* color space (N x M)."""
+
+    import numpy as np
+
+    return np.sqrt(((lab1[:, None, :] - lab2[None, :, :]) ** 2).sum(axis=2))
+
+
+def _delta_e_cie2000_array(lab1: "np.ndarray", lab2: "np.ndarray") -> "np.ndarray":
+    """Calculate the CIEDE2000 color differences between N and M colors in the CIE L*a*b* color space (N x M).
+
+    A vectorized `_delta_e_cie2000`, with the same results.
+    """
+
+    import numpy as np
+
+    l1, a1, b1 = (lab1[:, None, channel] for channel in range(3))
+    l2, a2, b2 = (lab2[None, :, channel] for channel in range(3))
+
+    c_avg = (np.hypot(a1, b1) + np.hypot(a2, b2)) / 2
+    g = 0.5 * (1 - np.sqrt(c_avg**7 / (c_avg**7 + 25**7)))
+
+    a1_p = (1 + g) * a1
+    a2_p = (1 + g) * a2
+    c1_p = np.hypot(a1_p, b1)
+    c2_p = np.hypot(a2_p, b2)
+    h1_p = np.degrees(np.arctan2(b1, a1_p)) % 360
+    h2_p = np.degrees(np.arctan2(b2, a2_p)) % 360
+
+    delta_l_p = l2 - l1
+    delta_c_p = c2_p - c1_p
+
+    delta_h_p = h2_p - h1_p
+    delta_h_p = np.where(delta_h_p > 180, delta_h_p - 360, delta_h_p)
+    delta_h_p = np.where(delta_h_p < -180, delta_h_p + 360, delta_h_p)
+
+    h_avg_p = (h1_p + h2_p) / 2
+    h_avg_p = np.where(
+        np.abs(h1_p - h2_p) > 180,
+        h_avg_p + np.where(h1_p + h2_p < 360, 180, -180),
+        h_avg_p,
+    )
+
+    is_gray = c1_p * c2_p == 0
+    delta_h_p = np.where(is_gray, 0, delta_h_p)
+    h_avg_p = np.where(is_gray, h1_p + h2_p, h_avg_p)
+
+    delta_big_h_p = 2 * np.sqrt(c1_p * c2_p) * np.sin(np.radians(delta_h_p / 2))
+
+    l_avg_p = (l1 + l2) / 2
+    c_avg_p = (c1_p + c2_p) / 2
+
+    t = (
+        1
+        - 0.17 * np.cos(np.radians(h_avg_p - 30))
+        + 0.24 * np.cos(np.radians(2 * h_avg_p))
+        + 0.32 * np.cos(np.radians(3 * h_avg_p + 6))
+        - 0.20 * np.cos(np.radians(4 * h_avg_p - 63))
+    )
+    delta_theta = 30 * np.exp(-(((h_avg_p - 275) / 25) ** 2))
+    r_c = 2 * np.sqrt(c_avg_p**7 / (c_avg_p**7 + 25**7))
+    s_l = 1 + (0.015 * (l_avg_p - 50) ** 2) / np.sqrt(20 + (l_avg_p - 50) ** 2)
+    s_c = 1 + 0.045 * c_avg_p
+    s_h = 1 + 0.015 * c_avg_p * t
+    r_t = -np.sin(np.radians(2 * delta_theta)) * r_c
+
+    return np.sqrt(
+        (delta_l_p / s_l) ** 2
+        + (delta_c_p / s_c) ** 2
+        + (delta_big_h_p / s_h) ** 2
+        + r_t * (delta_c_p / s_c) * (delta_big_h_p / s_h)
+    )
+
+
+# metric name -> (conversion of an RGB color to the metric's color space, distance function)
+_METRICS = {
+    "rgb": (lambda rgb: rgb, math.dist),
+    "cie76": (convcolors.rgb_to_lab, math.dist),
+    "ciede2000": (convcolors.rgb_to_lab, _delta_e_cie2000),
+}
+
+# metric name -> the distances between N and M L*a*b* colors (N x M), for building the lookup table
+_LAB_METRIC_ARRAYS = {
+    "cie76": _delta_e_cie76_array,
+    "ciede2000": _delta_e_cie2000_array,
+}
 
 
 def _find_closest_color(
     color: typing.Tuple[int, int, int],
     palette: typing.List[typing.Tuple[int, int, int]],
-) -> typing.Tuple[int, int, int]:
+    metric: str = "rgb",
+) -> int:
     """Find the closest color in a given palette to a specified color.
 
     Args:
         color: The RGB color for which to find the closest match.
         palette: The palette of RGB colors to search within.
+        metric: The color difference metric: 'rgb' (Euclidean distance in the RGB color space),
+            'cie76' (Euclidean distance in the CIE L*a*b* color space) or 'ciede2000'.
 
     Returns:
-        The closest color from the palette represented as an RGB tuple.
+        The index of the closest color in the palette.
+    """
+
+    convert, distance = _METRICS[metric]
+
+    point = convert(color)
+    distances = [distance(point, convert(palette_color)) for palette_color in palette]
+
+    return distances.index(min(distances))
+
+
+def _lut_index(color: typing.Tuple[int, int, int], bits: int) -> int:
+    """Return the index of the lookup table cell that contains a given RGB color."""
+
+    shift = 8 - bits
+    return (
+        ((color[0] >> shift) << (2 * bits))
+        | ((color[1] >> shift) << bits)
+        | (color[2] >> shift)
+    )
+
+
+# the layout of the lookup table file; part of its name, so tables of another layout are rebuilt
+_LUT_VERSION = 2
+
+# the largest number of filter colors (the candidates of a cell are counted in one byte)
+_LUT_MAX_COLORS = 255
+
+
+def _lut_candidates_rgb(
+    palette: typing.List[typing.Tuple[int, int, int]], bits: int
+) -> typing.Tuple["np.ndarray", "np.ndarray"]:
+    """Find the palette colors that can be the closest one (RGB distance) to a color of each cell.
+
+    A palette color is a candidate for a cell if its distance to the nearest color of the cell
+    is not larger than the distance of some palette color to the farthest color of the cell.
+    Squared distances add up per channel, so they are computed per channel first.
+
+    Returns:
+        The number of candidates of every cell, and a cells x palette mask of the candidates.
+    """
+
+    import numpy as np
+
+    size = 1 << bits
+    width = 1 << (8 - bits)
 
-    Note:
-        This function calculates the closest color using Euclidean distance in the RGB color space.
+    low = np.arange(size, dtype=np.int64)[:, None] * width
+    high = low + width - 1
+    points = np.asarray(palette, dtype=np.int64)
+
+    # squared distances along every channel: cell value x palette color
+    nearest = []
+    farthest = []
+    for channel in range(3):
+        values = points[:, channel][None, :]
+        nearest.append(
+            (np.maximum(low - values, 0) + np.maximum(values - high, 0)) ** 2
+        )
+        farthest.append(np.maximum(values - low, high - values) ** 2)
+
+    counts = np.empty(size**3, dtype=np.int64)
+    masks = []
+
+    for r_index in range(size):
+        near = (
+            nearest[0][r_index][None, None, :]
+            + nearest[1][:, None, :]
+            + nearest[2][None, :, :]
+        )
+        far = (
+            farthest[0][r_index][None, None, :]
+            + farthest[1][:, None, :]
+            + farthest[2][None, :, :]
+        )
+
+        mask = (near <= far.min(axis=2, keepdims=True)).reshape(size * size, -1)
+        counts[r_index * size * size : (r_index + 1) * size * size] = mask.sum(axis=1)
+        masks.append(mask)
+
+    return counts, np.concatenate(masks)
+
+
+def _build_filter_colors_lut(
+    palette: typing.List[typing.Tuple[int, int, int]], metric: str, bits: int
+) -> bytes:
+    """Build a lookup table of the closest palette colors of every quantized RGB color.
+
+    Every channel is quantized to `bits` bits. The table starts with a 32-bit entry per cell,
+    `(value << 8) | count`: a cell with a single candidate (`count` is 1) holds the index of its
+    palette color as `value`, any other cell holds the offset of its `count` candidates
+    (palette indices, one byte each) in the list that follows the entries.
+
+    Notes:
+        With the 'rgb' metric, the candidates of a cell are all the palette colors that can be
+        the closest one to any color of the cell, so looking a color up only compares it with
+        those, and the results are identical to a linear scan of the palette.
+        With the other metrics, each cell holds the closest palette color to its center.
+        The table takes 4 bytes per cell (128 KB at 5 bits, 1 MB at 6, 8 MB at 7 and 64 MB at 8),
+        plus the candidate lists.
+    """
+
+    import numpy as np
+
+    size = 1 << bits
+
+    if metric == "rgb":
+        counts, mask = _lut_candidates_rgb(palette, bits)
+        single = counts == 1
+
+        # `np.nonzero` walks the mask cell by cell, so the candidates of a cell are contiguous
+        candidates = np.nonzero(mask & ~single[:, None])[1].astype(np.uint8)
+        offsets = np.zeros(size**3, dtype=np.int64)
+        offsets[~single] = np.cumsum(counts[~single]) - counts[~single]
+        values = np.where(single, mask.argmax(axis=1), offsets)
+    else:
+        distances = _LAB_METRIC_ARRAYS[metric]
+        palette_lab = extractors.rgb_to_lab(np.asarray(palette, dtype=float))
+
+        width = 1 << (8 - bits)
+        centers = np.arange(size) * width + (width - 1) / 2
+        green, blue = (
+            channel.ravel() for channel in np.meshgrid(centers, centers, indexing="ij")
+        )
+
+        # the cells of one red value at a time, so memory stays small at 8 bits
+        values = np.empty(size**3, dtype=np.int64)
+        for r_index, r in enumerate(centers):
+            points = np.stack([np.full(size * size, r), green, blue], axis=1)
+            values[r_index * size * size : (r_index + 1) * size * size] = distances(
+                extractors.rgb_to_lab(points), palette_lab
+            ).argmin(axis=1)
+
+        counts = np.ones(size**3, dtype=np.int64)
+        candidates = np.empty(0, dtype=np.uint8)
+
+    entries = ((values << 8) | counts).astype(np.uint32)
+
+    return entries.tobytes() + candidates.tobytes()
+
+
+def _load_filter_colors_lut(
+    palette: typing.List[typing.Tuple[int, int, int]], metric: str, bits: int
+) -> mmap.mmap:
+    """Load the lookup table of the closest filter colors, building it first if necessary.
+
+    The table is stored in `filter_colors_lut_dir` under a name derived from the palette,
+    the metric and the number of bits, and is memory-mapped, so worker processes share it.
     """
 
-    closest_color = None
-    min_distance = float("inf")
+    if metric not in _METRICS:
+        raise utils.CriticalError(
+            f"Unknown 'filter_colors_metric': '{metric}' (expected one of: {', '.join(_METRICS)})"
+        )
 
-    for palette_color in palette:
-        distance = math.sqrt(
-            (color[0] - palette_color[0]) ** 2
-            + (color[1] - palette_color[1]) ** 2
-            + (color[2] - palette_color[2]) ** 2
+    if not 1 <= bits <= 8 or len(palette) > _LUT_MAX_COLORS:
+        raise utils.CriticalError(
+            f"'filter_colors_lut_bits' must be between 1 and 8, and there can be at most {_LUT_MAX_COLORS} filter colors"
         )
 
-        if distance < min_distance:
-            min_distance = distance
-            closest_color = palette_color
+    digest = hashlib.sha256(
+        f"{_LUT_VERSION}/{metric}/{bits}/{[rgb_to_hex(color) for color in palette]}".encode()
+    ).hexdigest()[:16]
+    lut_file = (
+        pathlib.Path(config.get.filter_colors_lut_dir) / f"{metric}-{bits}-{digest}.lut"
+    )
 
-    logger.debug(f"The closest color for {color}: {closest_color}")
+    if not lut_file.is_file():
+        logger.info(
+            f"Building a lookup table of the closest filter colors ({metric}, {bits} bits per channel) ..."
+        )
 
-    return closest_color
+        lut = _build_filter_colors_lut(palette, metric, bits)
 
+        lut_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = lut_file.with_name(f"{lut_file.name}.{os.getpid()}.tmp")
+        tmp_file.write_bytes(lut)
+        os.replace(tmp_file, lut_file)
 
+    with open(lut_file, "rb") as file:
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _lut_entries(bits: int) -> memoryview:
+    """Return the cell entries of the lookup table as 32-bit integers."""
+    return memoryview(_FILTER_COLORS_LUT)[: 4 << (3 * bits)].cast("I")
+
+
+def _resolve_candidates(
+    color: typing.Tuple[int, int, int], entry: int, bits: int
+) -> int:
+    """Find the closest filter color among the candidates of a lookup table cell."""
+
+    offset = (4 << (3 * bits)) + (entry >> 8)
+    candidates = _FILTER_COLORS_LUT[offset : offset + (entry & 0xFF)]
+
+    return candidates[
+        _find_closest_color(
+            color,
+            [_FILTER_COLORS[index] for index in candidates],
+            config.get.filter_colors_metric,
+        )
+    ]
+
+
+@metrics.span("nearest")
 def find_closest_colors(
     color_palette: typing.List[typing.Tuple[int, int, int]]
 ) -> typing.List[str]:
@@ -185,10 +736,65 @@ def find_closest_colors(
 
     logger.debug(f"Color palette: {color_palette}")
 
+    bits = config.get.filter_colors_lut_bits
+    entries = _lut_entries(bits)
+
     filterable_colors = []
     for color in color_palette:
-        filterable_colors.append(rgb_to_hex(_find_closest_color(color, _FILTER_COLORS)))
+        entry = entries[_lut_index(color, bits)]
+        index = (
+            entry >> 8 if entry & 0xFF == 1 else _resolve_candidates(color, entry, bits)
+        )
+        filterable_colors.append(rgb_to_hex(_FILTER_COLORS[index]))
 
     logger.debug(f"Filterable colors: {filterable_colors}")
 
     return filterable_colors
+
+
+def find_closest_colors_batch(rgb_colors: "np.ndarray") -> typing.List[str]:
+    """Find the closest filter color of many colors at once (a vectorized `find_closest_colors`).
+
+    All colors are looked up in the lookup table with a single NumPy operation; only colors in
+    cells with several candidates are compared with those candidates (each distinct color once).
+
+    Args:
+        rgb_colors: An N x 3 array of RGB colors, e.g. the palettes of every saved day.
+
+    Returns:
+        The hexadecimal color codes of the closest filter colors, in the same order.
+    """
+
+    import numpy as np
+
+    bits = config.get.filter_colors_lut_bits
+    shift = 8 - bits
+
+    rgb_colors = np.asarray(rgb_colors, dtype=np.uint32).reshape(-1, 3)
+    cells = (
+        ((rgb_colors[:, 0] >> shift) << (2 * bits))
+        | ((rgb_colors[:, 1] >> shift) << bits)
+        | (rgb_colors[:, 2] >> shift)
+    )
+
+    entries = np.frombuffer(_lut_entries(bits), dtype=np.uint32)[cells].astype(np.int64)
+    indices = entries >> 8
+
+    ambiguous = np.flatnonzero(entries & 0xFF != 1)
+    if ambiguous.size:
+        unique_colors, first, inverse = np.unique(
+            rgb_colors[ambiguous], axis=0, return_index=True, return_inverse=True
+        )
+        resolved = np.array(
+            [
+                _resolve_candidates(tuple(color), entry, bits)
+                for color, entry in zip(
+                    unique_colors.tolist(), entries[ambiguous][first].tolist()
+                )
+            ],
+            dtype=np.int64,
+        )
+        indices[ambiguous] = resolved[inverse.reshape(-1)]
+
+    hex_colors = np.array([rgb_to_hex(color) for color in _FILTER_COLORS])
+    return hex_colors[indices].tolist()
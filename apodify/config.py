@@ -1,5 +1,5 @@
+import os
 import utils
-import yaml
 
 from datetime import datetime, timedelta
 from logger import logger
@@ -18,7 +18,47 @@ class get:
     use_temp_apod_data = False
     use_hdurl = False
 
+    source = "network"
+
+    apod_api_url = "https://api.nasa.gov/planetary/apod"
+    apod_workers = 4
+    apod_retries = 3
+    apod_timeout = 60
+
+    http_retries = 3
+    http_backoff = 1
+    nasa_rate_limit = 1000
+
+    image_max_mb = 64
+    image_timeout = 30
+
+    image_cache = True
+    image_cache_dir = "./.cache/images"
+    image_cache_max_mb = 2048
+    image_cache_revalidate = True
+
+    result_cache = True
+    result_cache_dir = "./.cache/results"
+    result_cache_max_mb = 64
+
+    metadata_cache = True
+    metadata_cache_path = "./.cache/apod_metadata.sqlite3"
+    metadata_cache_ttl = 3600
+
     supabase_upload = True
+    supabase_batch_size = 100
+    supabase_flush_interval = 5
+    supabase_retries = 3
+
+    output_dir = "./.output"
+    shard = None
+
+    output_backend = "json"
+    catalog_path = "catalog.sqlite3"
+    catalog_batch_size = 500
+
+    color_index = True
+    color_index_path = "colorindex.json"
 
     save_url = True
     save_media_type = True
@@ -31,14 +71,68 @@ class get:
     save_is_animated = True
 
     generate_combined_image = True
+    preview_max_height = 512
+    preview_contact_sheets = False
+    preview_queue_size = 8
 
     extcolors_tolerance = 32
     extcolors_limit = 4
+    extraction_max_pixels = 0
+    extraction_backend = "extcolors"
+    extraction_histogram_bits = 8
+    extraction_frames = 1
+
+    filter_colors_metric = "rgb"
+    filter_colors_lut_bits = 5
+    filter_colors_lut_dir = "./.cache/filter_colors"
+
+    metrics = True
+    metrics_dir = "metrics"
+    metrics_prometheus_path = None
+
+    incremental = False
+
+    job_queue = False
+    job_queue_path = "jobs.sqlite3"
+    job_batch_size = 64
+    job_max_attempts = 5
+    job_backoff = 60
+    job_backoff_max = 3600
+    job_lease = 900
+    job_max_wait = 300
+
+    concurrent = False
+    io_workers = 8
+    cpu_workers = None
+    max_inflight_mb = 256
+
+
+def output_path(*parts: str) -> str:
+    """Return a path within `output_dir` (e.g. `output_path("data")`); absolute paths are kept as they are."""
+    return os.path.join(get.output_dir, *parts)
+
+
+def export() -> dict:
+    """Return a copy of the current configuration settings as a dictionary."""
+
+    return {key: value for key, value in vars(get).items() if not key.startswith("_")}
+
+
+def load(settings: dict) -> None:
+    """Update the configuration settings from a dictionary created by `export`.
+
+    Used to pass the configuration to worker processes, which do not share memory with the main process.
+    """
+
+    for key, value in settings.items():
+        setattr(get, key, value)
 
 
 def init():
     """Load `/apodify/config/settings.yaml` file and update the configuration settings."""
 
+    import yaml
+
     with open("./apodify/config/settings.yaml", "r") as file:
         data = yaml.safe_load(file)
         # todo validate the input
@@ -67,9 +161,76 @@ def init():
             get.use_temp_apod_data = data["use_temp_apod_data"]
         if "use_hdurl" in data:
             get.use_hdurl = data["use_hdurl"]
+        if "source" in data:
+            get.source = data["source"]
+
+        if "apod_api_url" in data:
+            get.apod_api_url = data["apod_api_url"]
+        if "apod_workers" in data:
+            get.apod_workers = data["apod_workers"]
+        if "apod_retries" in data:
+            get.apod_retries = data["apod_retries"]
+        if "apod_timeout" in data:
+            get.apod_timeout = data["apod_timeout"]
+
+        if "http_retries" in data:
+            get.http_retries = data["http_retries"]
+        if "http_backoff" in data:
+            get.http_backoff = data["http_backoff"]
+        if "nasa_rate_limit" in data:
+            get.nasa_rate_limit = data["nasa_rate_limit"]
+
+        if "image_max_mb" in data:
+            get.image_max_mb = data["image_max_mb"]
+        if "image_timeout" in data:
+            get.image_timeout = data["image_timeout"]
+
+        if "image_cache" in data:
+            get.image_cache = data["image_cache"]
+        if "image_cache_dir" in data:
+            get.image_cache_dir = data["image_cache_dir"]
+        if "image_cache_max_mb" in data:
+            get.image_cache_max_mb = data["image_cache_max_mb"]
+        if "image_cache_revalidate" in data:
+            get.image_cache_revalidate = data["image_cache_revalidate"]
+        if "result_cache" in data:
+            get.result_cache = data["result_cache"]
+        if "result_cache_dir" in data:
+            get.result_cache_dir = data["result_cache_dir"]
+        if "result_cache_max_mb" in data:
+            get.result_cache_max_mb = data["result_cache_max_mb"]
+        if "metadata_cache" in data:
+            get.metadata_cache = data["metadata_cache"]
+        if "metadata_cache_path" in data:
+            get.metadata_cache_path = data["metadata_cache_path"]
+        if "metadata_cache_ttl" in data:
+            get.metadata_cache_ttl = data["metadata_cache_ttl"]
 
         if "supabase_upload" in data:
             get.supabase_upload = data["supabase_upload"]
+        if "supabase_batch_size" in data:
+            get.supabase_batch_size = data["supabase_batch_size"]
+        if "supabase_flush_interval" in data:
+            get.supabase_flush_interval = data["supabase_flush_interval"]
+        if "supabase_retries" in data:
+            get.supabase_retries = data["supabase_retries"]
+
+        if "output_dir" in data:
+            get.output_dir = data["output_dir"]
+        if "shard" in data:
+            get.shard = data["shard"]
+
+        if "output_backend" in data:
+            get.output_backend = data["output_backend"]
+        if "catalog_path" in data:
+            get.catalog_path = data["catalog_path"]
+        if "catalog_batch_size" in data:
+            get.catalog_batch_size = data["catalog_batch_size"]
+
+        if "color_index" in data:
+            get.color_index = data["color_index"]
+        if "color_index_path" in data:
+            get.color_index_path = data["color_index_path"]
 
         if "save_url" in data:
             get.save_url = data["save_url"]
@@ -92,7 +253,64 @@ def init():
 
         if "generate_combined_image" in data:
             get.generate_combined_image = data["generate_combined_image"]
+        if "preview_max_height" in data:
+            get.preview_max_height = data["preview_max_height"]
+        if "preview_contact_sheets" in data:
+            get.preview_contact_sheets = data["preview_contact_sheets"]
+        if "preview_queue_size" in data:
+            get.preview_queue_size = data["preview_queue_size"]
         if "extcolors_tolerance" in data:
             get.extcolors_tolerance = data["extcolors_tolerance"]
         if "extcolors_limit" in data:
             get.extcolors_limit = data["extcolors_limit"]
+        if "extraction_max_pixels" in data:
+            get.extraction_max_pixels = data["extraction_max_pixels"]
+        if "extraction_backend" in data:
+            get.extraction_backend = data["extraction_backend"]
+        if "extraction_histogram_bits" in data:
+            get.extraction_histogram_bits = data["extraction_histogram_bits"]
+        if "extraction_frames" in data:
+            get.extraction_frames = data["extraction_frames"]
+
+        if "filter_colors_metric" in data:
+            get.filter_colors_metric = data["filter_colors_metric"]
+        if "filter_colors_lut_bits" in data:
+            get.filter_colors_lut_bits = data["filter_colors_lut_bits"]
+        if "filter_colors_lut_dir" in data:
+            get.filter_colors_lut_dir = data["filter_colors_lut_dir"]
+
+        if "metrics" in data:
+            get.metrics = data["metrics"]
+        if "metrics_dir" in data:
+            get.metrics_dir = data["metrics_dir"]
+        if "metrics_prometheus_path" in data:
+            get.metrics_prometheus_path = data["metrics_prometheus_path"]
+
+        if "incremental" in data:
+            get.incremental = data["incremental"]
+
+        if "job_queue" in data:
+            get.job_queue = data["job_queue"]
+        if "job_queue_path" in data:
+            get.job_queue_path = data["job_queue_path"]
+        if "job_batch_size" in data:
+            get.job_batch_size = data["job_batch_size"]
+        if "job_max_attempts" in data:
+            get.job_max_attempts = data["job_max_attempts"]
+        if "job_backoff" in data:
+            get.job_backoff = data["job_backoff"]
+        if "job_backoff_max" in data:
+            get.job_backoff_max = data["job_backoff_max"]
+        if "job_lease" in data:
+            get.job_lease = data["job_lease"]
+        if "job_max_wait" in data:
+            get.job_max_wait = data["job_max_wait"]
+
+        if "concurrent" in data:
+            get.concurrent = data["concurrent"]
+        if "io_workers" in data:
+            get.io_workers = data["io_workers"]
+        if "cpu_workers" in data:
+            get.cpu_workers = data["cpu_workers"]
+        if "max_inflight_mb" in data:
+            get.max_inflight_mb = data["max_inflight_mb"]
@@ -0,0 +1,166 @@
+import config
+import typing
+import utils
+
+from PIL import Image
+
+# numpy is imported by the functions of the `numpy` backend only, so it is not loaded unless used
+if typing.TYPE_CHECKING:
+    import numpy as np
+
+# a backend takes an image, the tolerance and the limit, and returns (RGB color, pixel count) tuples
+Backend = typing.Callable[
+    [Image.Image, int, int | None],
+    typing.List[typing.Tuple[typing.Tuple[int, int, int], int]],
+]
+
+
+def extract_extcolors(
+    img: Image.Image, tolerance: int, limit: int | None
+) -> typing.List[typing.Tuple[typing.Tuple[int, int, int], int]]:
+    """Extract a color palette with `extcolors` (the default backend)."""
+
+    import extcolors
+
+    colors, _ = extcolors.extract_from_image(img, tolerance, limit)
+    return colors
+
+
+def rgb_to_lab(rgb: "np.ndarray") -> "np.ndarray":
+    """Convert an array of sRGB colors to the CIE L*a*b* color space.
+
+    Matches `convcolors.rgb_to_lab`, which is used by `extcolors`.
+    """
+
+    import numpy as np
+
+    rgb = rgb / 255.0
+    rgb = np.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+
+    xyz = (
+        rgb
+        @ np.array(
+            [
+                [0.4124564, 0.2126729, 0.0193339],
+                [0.3575761, 0.7151522, 0.1191920],
+                [0.1804375, 0.0721750, 0.9503041],
+            ]
+        )
+        * 100.0
+    )
+    xyz = xyz / np.array([95.047, 100.000, 108.883])
+    xyz = np.where(xyz > 0.008856, xyz**0.3333333, ((xyz * 903.3) + 16.0) / 116.0)
+
+    x, y, z = xyz[:, 0], xyz[:, 1], xyz[:, 2]
+    return np.stack(
+        [np.maximum(0.0, (116.0 * y) - 16.0), (x - y) * 500.0, (y - z) * 200.0],
+        axis=1,
+    )
+
+
+def _histogram(
+    img: Image.Image, bits: int
+) -> tuple["np.ndarray", "np.ndarray", "np.ndarray"]:
+    """Count the colors of the visible pixels of an image.
+
+    Args:
+        img: The image. Must be a Pillow's Image object.
+        bits: The number of bits per channel; with less than 8 bits similar colors
+            share a bin, represented by the mean color of its pixels.
+
+    Returns:
+        The colors (N x 3), their pixel counts and the index of the first pixel of each color.
+    """
+
+    import numpy as np
+
+    pixels = np.asarray(img.convert("RGBA")).reshape(-1, 4)
+    pixels = pixels[pixels[:, 3] > 0, :3]
+
+    shift = 8 - bits
+    quantized = (pixels >> shift).astype(np.uint32)
+    keys = (quantized[:, 0] << (2 * bits)) | (quantized[:, 1] << bits) | quantized[:, 2]
+
+    if bits == 8:
+        unique_keys, first_index, counts = np.unique(
+            keys, return_index=True, return_counts=True
+        )
+        colors = np.stack(
+            [(unique_keys >> 16) & 0xFF, (unique_keys >> 8) & 0xFF, unique_keys & 0xFF],
+            axis=1,
+        )
+        return colors, counts, first_index
+
+    counts = np.bincount(keys, minlength=1 << (3 * bits))
+    occupied = np.flatnonzero(counts)
+    sums = np.stack(
+        [
+            np.bincount(keys, weights=pixels[:, channel], minlength=1 << (3 * bits))
+            for channel in range(3)
+        ],
+        axis=1,
+    )
+    colors = np.rint(sums[occupied] / counts[occupied, None])
+
+    # the first pixel of a bin is only used to break ties, so the bin index is good enough
+    return colors, counts[occupied], occupied
+
+
+def extract_numpy(
+    img: Image.Image, tolerance: int, limit: int | None
+) -> typing.List[typing.Tuple[typing.Tuple[int, int, int], int]]:
+    """Extract a color palette with a vectorized implementation of the `extcolors` algorithm.
+
+    Colors are counted with a histogram (`extraction_histogram_bits` per channel) and sorted by
+    their pixel count. Going from the most common color, every less common color closer than
+    `tolerance` (CIE76) is merged into it. The merged colors are sorted by their total pixel count
+    and the first `limit` are returned.
+    """
+
+    import numpy as np
+
+    colors, counts, first_index = _histogram(img, config.get.extraction_histogram_bits)
+
+    # most common first; ties in the order of appearance, like `extcolors`
+    order = np.lexsort((first_index, -counts))
+    colors = colors[order].astype(int)
+    counts = counts[order].astype(int)
+
+    if tolerance <= 0:
+        merged = list(zip(range(len(colors)), counts.tolist()))
+    else:
+        lab = rgb_to_lab(colors.astype(float))
+        merged = []
+
+        remaining = np.arange(len(colors))
+        while remaining.size:
+            larger, rest = remaining[0], remaining[1:]
+
+            is_close = np.sqrt(((lab[rest] - lab[larger]) ** 2).sum(axis=1)) < tolerance
+
+            merged.append((larger, int(counts[larger] + counts[rest[is_close]].sum())))
+            remaining = rest[~is_close]
+
+        merged.sort(key=lambda color: color[1], reverse=True)
+
+    if limit:
+        merged = merged[: min(int(limit), len(merged))]
+
+    return [(tuple(colors[index].tolist()), count) for index, count in merged]
+
+
+BACKENDS: typing.Dict[str, Backend] = {
+    "extcolors": extract_extcolors,
+    "numpy": extract_numpy,
+}
+
+
+def get_backend(name: str) -> Backend:
+    """Return the extraction backend with a given name."""
+
+    if name not in BACKENDS:
+        raise utils.CriticalError(
+            f"Unknown 'extraction_backend': '{name}' (expected one of: {', '.join(BACKENDS)})"
+        )
+
+    return BACKENDS[name]
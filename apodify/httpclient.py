@@ -0,0 +1,210 @@
+import config
+import metrics
+import threading
+import time
+import typing
+import urllib.parse
+
+from logger import logger
+
+# requests is imported when the session is created, so processes which never send a request do not load it
+if typing.TYPE_CHECKING:
+    import requests
+
+# hosts with an hourly rate limit reported in the 'X-RateLimit-*' headers
+RATE_LIMITED_HOSTS = ("api.nasa.gov",)
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+_rate_limiter = None
+
+
+class RateLimiter:
+    """A token bucket that adapts to the 'X-RateLimit-Limit' and 'X-RateLimit-Remaining' headers.
+
+    The bucket holds at most `limit` tokens and refills at `limit` tokens per hour, which matches
+    the rolling one-hour window of api.nasa.gov. Every response lowers the number of tokens
+    to what the API reports as remaining, so requests slow down before the limit is hit
+    instead of failing with '429 Too Many Requests'.
+
+    Args:
+        limit: The number of requests per hour assumed until the first response is received.
+    """
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self.remaining = None
+
+        self._tokens = float(limit)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            float(self.limit),
+            self._tokens + (now - self._last_refill) * self.limit / 3600,
+        )
+        self._last_refill = now
+
+    def reserve(self) -> float:
+        """Take a token and return the number of seconds to wait before sending the request."""
+
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+            return max(0.0, -self._tokens * 3600 / self.limit)
+
+    def acquire(self) -> None:
+        """Take a token, waiting until one is available."""
+
+        delay = self.reserve()
+        if delay > 0:
+            logger.debug(f"Rate limit reached, waiting {round(delay, 1)} sec ...")
+            metrics.increment("rate_limit_wait_seconds_total", delay)
+            time.sleep(delay)
+
+    def update(self, headers: dict) -> None:
+        """Adjust the bucket to the rate limit headers of a response."""
+
+        try:
+            limit = int(headers.get("X-RateLimit-Limit", self.limit))
+            remaining = headers.get("X-RateLimit-Remaining")
+            remaining = int(remaining) if remaining is not None else None
+        except ValueError:
+            return
+
+        with self._lock:
+            self._refill()
+            self.limit = max(1, limit)
+            if remaining is not None:
+                self.remaining = remaining
+                self._tokens = min(self._tokens, float(remaining))
+
+
+def _create_session() -> "requests.Session":
+    import requests
+
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    session = requests.Session()
+
+    pool_size = max(config.get.io_workers, config.get.apod_workers)
+
+    def adapter(retries: int) -> "HTTPAdapter":
+        return HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=Retry(
+                total=retries,
+                backoff_factor=config.get.http_backoff,
+                status_forcelist=RETRY_STATUSES,
+                allowed_methods=["GET", "HEAD"],
+                respect_retry_after_header=True,
+                raise_on_status=False,
+            ),
+        )
+
+    session.mount("http://", adapter(config.get.http_retries))
+    session.mount("https://", adapter(config.get.http_retries))
+    # requests to rate limited hosts are retried by `get`, which takes a token for every attempt
+    for host in RATE_LIMITED_HOSTS:
+        session.mount(f"https://{host}/", adapter(0))
+
+    return session
+
+
+def get_session() -> "requests.Session":
+    """Return the HTTP session shared by all threads, creating it on first use.
+
+    The session keeps connections alive in a pool per host, and retries failed requests
+    (connection errors, 429 and 5xx responses) with exponential backoff; requests to
+    `RATE_LIMITED_HOSTS` are retried by `get` instead.
+    """
+
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            _session = _create_session()
+
+    return _session
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Return the rate limiter shared by all requests to `RATE_LIMITED_HOSTS`."""
+
+    global _rate_limiter
+
+    with _session_lock:
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter(config.get.nasa_rate_limit)
+
+    return _rate_limiter
+
+
+def _get_rate_limited(
+    url: str, rate_limiter: RateLimiter, **kwargs
+) -> "requests.Response":
+    """Send a GET request to a rate limited host, retrying connection errors, 429 and 5xx responses
+    (`apod_retries`) with exponential backoff (`http_backoff`); every attempt waits for a token.
+    """
+
+    import requests
+
+    for attempt in range(config.get.apod_retries + 1):
+        if attempt > 0:
+            metrics.increment("http_retries_total")
+            time.sleep(config.get.http_backoff * 2 ** (attempt - 1))
+
+        rate_limiter.acquire()
+
+        try:
+            response = get_session().get(url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as exception:
+            if attempt == config.get.apod_retries:
+                raise
+            logger.warning(f"Request failed (attempt {attempt + 1}): {exception}")
+            continue
+
+        rate_limiter.update(response.headers)
+        logger.debug(
+            f"X-RateLimit-Remaining: {response.headers.get('X-RateLimit-Remaining')}."
+        )
+
+        if response.status_code in RETRY_STATUSES and attempt < config.get.apod_retries:
+            logger.warning(
+                f"Request failed with status code {response.status_code} (attempt {attempt + 1})."
+            )
+            response.close()
+            continue
+
+        return response
+
+
+def get(url: str, **kwargs) -> "requests.Response":
+    """Send a GET request through the shared session.
+
+    Requests to `RATE_LIMITED_HOSTS` wait for a token of the rate limiter before every attempt.
+
+    Args:
+        url: The URL to request.
+        **kwargs: Passed to `requests.Session.get` (e.g. `headers`, `stream`, `timeout`).
+
+    Returns:
+        The response.
+    """
+
+    if urllib.parse.urlsplit(url).hostname in RATE_LIMITED_HOSTS:
+        return _get_rate_limited(url, get_rate_limiter(), **kwargs)
+
+    response = get_session().get(url, **kwargs)
+
+    retries = getattr(response.raw, "retries", None)
+    if retries is not None and retries.history:
+        metrics.increment("http_retries_total", len(retries.history))
+
+    return response
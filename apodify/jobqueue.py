@@ -0,0 +1,441 @@
+import argparse
+import config
+import contextlib
+import datetime
+import itertools
+import json
+import pathlib
+import sqlite3
+import threading
+import time
+import typing
+
+from logger import logger
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    date TEXT PRIMARY KEY,
+    state TEXT NOT NULL CHECK (state IN ('pending', 'leased', 'done', 'dead')),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    next_retry REAL NOT NULL DEFAULT 0,
+    leased_until REAL,
+    updated_at TEXT
+);
+
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, next_retry);
+"""
+
+# failures which may go away on a later attempt: network errors, 429/5xx responses
+# (see `apod.FetchFailure`) and failed uploads; any other failure would happen again
+TRANSIENT_ERRORS = ("http_error", "timeout", "connection_error", "upload_error")
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def _now() -> str:
+    return datetime.datetime.now().isoformat(timespec="seconds")
+
+
+def is_transient(error: str | None) -> bool:
+    """Check whether a failure (as recorded in the run manifest) may go away on a later attempt.
+
+    A failure without a reason is assumed to be transient.
+    """
+
+    return error is None or error.split(":")[0] in TRANSIENT_ERRORS
+
+
+class JobQueue:
+    """A SQLite database with one job per day, so failed days are retried across runs.
+
+    A job is leased before its day is processed; the lease expires after `lease` seconds, so the
+    days of a crashed run are picked up again. Every lease counts as an attempt. A job which failed
+    for a transient reason (`TRANSIENT_ERRORS`) is retried after an exponential backoff (`backoff`
+    seconds, doubled after every attempt, up to `backoff_max`), and moves to the dead-letter list
+    after `max_attempts` attempts; any other failure (e.g. not an image, too large) moves it there
+    right away.
+
+    Args:
+        path: The path of the database file.
+        max_attempts: The number of attempts before a job is dead.
+        backoff: The delay before the first retry (seconds).
+        backoff_max: The longest delay between two attempts (seconds).
+        lease: The time a leased job is reserved for (seconds).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_attempts: int = 5,
+        backoff: float = 60,
+        backoff_max: float = 3600,
+        lease: float = 900,
+    ) -> None:
+        self.path = pathlib.Path(path)
+        self.max_attempts = max(1, max_attempts)
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.lease_seconds = lease
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        # results are also recorded by the background thread of the Supabase uploader
+        self._connection = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.executescript(_SCHEMA)
+
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def _transaction(self) -> typing.Iterator[sqlite3.Connection]:
+        # BEGIN IMMEDIATE takes the write lock up front, several processes may share the queue
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._connection
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+
+    def enqueue(self, dates: typing.Iterable[str]) -> None:
+        """Add a job for every day; finished jobs are opened again, dead jobs stay dead."""
+
+        with self._transaction() as connection:
+            connection.executemany(
+                """
+                INSERT INTO jobs (date, state, updated_at) VALUES (?, 'pending', ?)
+                ON CONFLICT (date) DO UPDATE SET
+                    state = 'pending', attempts = 0, last_error = NULL, next_retry = 0,
+                    updated_at = excluded.updated_at
+                WHERE jobs.state = 'done'
+                """,
+                [(date, _now()) for date in dates],
+            )
+
+    def lease(self, dates: typing.Iterable[str], limit: int) -> typing.List[str]:
+        """Lease up to `limit` of the given days whose jobs are due (pending or with an expired lease).
+
+        Expired leases of jobs without any attempt left are moved to the dead-letter list.
+
+        Returns:
+            The leased days, oldest first.
+        """
+
+        now = time.time()
+        dates_json = json.dumps(list(dates))
+
+        with self._transaction() as connection:
+            connection.execute(
+                """
+                UPDATE jobs SET state = 'dead', last_error = 'lease expired', updated_at = ?
+                WHERE state = 'leased' AND leased_until <= ? AND attempts >= ?
+                """,
+                (_now(), now, self.max_attempts),
+            )
+            leased = [
+                date
+                for (date,) in connection.execute(
+                    """
+                    SELECT date FROM jobs
+                    WHERE date IN (SELECT value FROM json_each(?))
+                    AND ((state = 'pending' AND next_retry <= ?)
+                        OR (state = 'leased' AND leased_until <= ?))
+                    ORDER BY date LIMIT ?
+                    """,
+                    (dates_json, now, now, limit),
+                )
+            ]
+            connection.executemany(
+                """
+                UPDATE jobs SET state = 'leased', attempts = attempts + 1,
+                    leased_until = ?, updated_at = ?
+                WHERE date = ?
+                """,
+                [(now + self.lease_seconds, _now(), date) for date in leased],
+            )
+
+        return leased
+
+    def complete(self, date: str) -> None:
+        """Mark the job of a day as done."""
+
+        with self._transaction() as connection:
+            connection.execute(
+                """
+                UPDATE jobs SET state = 'done', last_error = NULL, leased_until = NULL, updated_at = ?
+                WHERE date = ? AND state != 'dead'
+                """,
+                (_now(), date),
+            )
+
+    def fail(self, date: str, error: str | None) -> None:
+        """Schedule a retry of a failed job, or move it to the dead-letter list if it has no attempt left
+        or its failure is not transient (`TRANSIENT_ERRORS`)."""
+
+        with self._transaction() as connection:
+            row = connection.execute(
+                "SELECT attempts FROM jobs WHERE date = ? AND state != 'dead'", (date,)
+            ).fetchone()
+            if row is None:
+                return
+
+            attempts = row[0]
+            if not is_transient(error):
+                state, next_retry = "dead", 0
+                logger.warning(f"Not retrying {date} ({error}).")
+            elif attempts >= self.max_attempts:
+                state, next_retry = "dead", 0
+                logger.warning(
+                    f"Giving up on {date} after {attempts} attempt/s ({error})."
+                )
+            else:
+                state = "pending"
+                next_retry = time.time() + min(
+                    self.backoff * 2 ** max(0, attempts - 1), self.backoff_max
+                )
+
+            connection.execute(
+                """
+                UPDATE jobs SET state = ?, last_error = ?, next_retry = ?, leased_until = NULL,
+                    updated_at = ?
+                WHERE date = ?
+                """,
+                (state, error, next_retry, _now(), date),
+            )
+
+    def next_retry(self, dates: typing.Iterable[str]) -> float | None:
+        """Return the time (epoch seconds) of the next due retry among the given days, if any."""
+
+        with self._lock:
+            return self._connection.execute(
+                """
+                SELECT MIN(next_retry) FROM jobs
+                WHERE date IN (SELECT value FROM json_each(?)) AND state = 'pending'
+                """,
+                (json.dumps(list(dates)),),
+            ).fetchone()[0]
+
+    def unfinished(self, dates: typing.Iterable[str]) -> typing.List[str]:
+        """Return the given days whose jobs are pending or leased."""
+
+        with self._lock:
+            return [
+                date
+                for (date,) in self._connection.execute(
+                    """
+                    SELECT date FROM jobs
+                    WHERE date IN (SELECT value FROM json_each(?))
+                    AND state IN ('pending', 'leased')
+                    """,
+                    (json.dumps(list(dates)),),
+                )
+            ]
+
+    def counts(self) -> typing.Dict[str, int]:
+        """Return the number of jobs in every state."""
+
+        with self._lock:
+            return dict(
+                self._connection.execute(
+                    "SELECT state, COUNT(*) FROM jobs GROUP BY state ORDER BY state"
+                )
+            )
+
+    def dead(self) -> typing.List[typing.Tuple[str, int, str | None]]:
+        """Return the dead-letter list: (date, attempts, last error) of every dead job."""
+
+        with self._lock:
+            return list(
+                self._connection.execute(
+                    "SELECT date, attempts, last_error FROM jobs WHERE state = 'dead' ORDER BY date"
+                )
+            )
+
+    def retry_dead(self, dates: typing.Iterable[str] | None = None) -> int:
+        """Move dead jobs (all of them, or the given days) back to the queue with new attempts.
+
+        Returns:
+            The number of jobs moved back.
+        """
+
+        query = "UPDATE jobs SET state = 'pending', attempts = 0, next_retry = 0, updated_at = ? WHERE state = 'dead'"
+        parameters = (_now(),)
+        if dates is not None:
+            query += " AND date IN (SELECT value FROM json_each(?))"
+            parameters += (json.dumps(list(dates)),)
+
+        with self._transaction() as connection:
+            return connection.execute(query, parameters).rowcount
+
+    def close(self) -> None:
+        """Close the database."""
+
+        with self._lock:
+            self._connection.close()
+
+
+def get_queue() -> JobQueue:
+    """Return the job queue at `job_queue_path` (within `output_dir`), opening it on first use."""
+
+    global _queue
+
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue(
+                config.output_path(config.get.job_queue_path),
+                config.get.job_max_attempts,
+                config.get.job_backoff,
+                config.get.job_backoff_max,
+                config.get.job_lease,
+            )
+
+    return _queue
+
+
+def record(date: str, success: bool, error: str | None = None) -> None:
+    """Record the result of processing a day in the job queue.
+
+    Does nothing if `job_queue` is disabled.
+    """
+
+    if config.get.job_queue is False or date is None:
+        return
+
+    if success:
+        get_queue().complete(date)
+    else:
+        get_queue().fail(date, error)
+
+
+def _lease_stream(
+    queue: JobQueue,
+    apod_data: typing.Iterable[typing.Dict[str, typing.Union[str, int]]],
+    unfinished: typing.Dict[str, typing.Dict[str, typing.Union[str, int]]],
+) -> typing.Iterator[typing.Dict[str, typing.Union[str, int]]]:
+    """Queue and lease the days batch by batch (`job_batch_size`), as they are consumed.
+
+    The leased days are kept in `unfinished` until their jobs are done, so they can be retried;
+    the other days are not kept in memory.
+    """
+
+    apod_data = iter(apod_data)
+
+    while batch := list(itertools.islice(apod_data, max(1, config.get.job_batch_size))):
+        items = {apod_item["date"]: apod_item for apod_item in batch}
+        queue.enqueue(items)
+
+        for date in set(unfinished) - set(queue.unfinished(unfinished)):
+            del unfinished[date]
+
+        for date in queue.lease(items, len(items)):
+            unfinished[date] = items[date]
+            yield items[date]
+
+
+def run(
+    apod_data: typing.Iterable[typing.Dict[str, typing.Union[str, int]]],
+    extend: typing.Callable[
+        [typing.Iterable[typing.Dict[str, typing.Union[str, int]]]], None
+    ],
+) -> None:
+    """Extend APOD days through the job queue.
+
+    The days are queued and leased in batches (`job_batch_size`) while `extend` consumes them;
+    `extend` records their results (see `manifest.record`). Failed days are retried within the run
+    as long as their next attempt is due within `job_max_wait` seconds; later retries are left to
+    the next run.
+
+    Args:
+        apod_data: Dictionaries streamed by `apod.iter_apod_data`.
+        extend: Extends the days (serially or with `pipeline.run`).
+    """
+
+    queue = get_queue()
+    unfinished = {}
+
+    extend(_lease_stream(queue, apod_data, unfinished))
+
+    while True:
+        dates = queue.lease(unfinished, len(unfinished))
+        if dates:
+            extend([unfinished[date] for date in dates])
+            continue
+
+        unfinished = {date: unfinished[date] for date in queue.unfinished(unfinished)}
+
+        next_retry = queue.next_retry(unfinished)
+        if next_retry is None:
+            break
+
+        wait = next_retry - time.time()
+        if wait > config.get.job_max_wait:
+            logger.info(
+                f"The next retry is due in {round(wait)} sec, leaving it to the next run."
+            )
+            break
+
+        if wait > 0:
+            logger.info(f"Waiting {round(wait, 1)} sec for the next retry ...")
+            time.sleep(wait)
+
+    counts = queue.counts()
+    logger.info(
+        "Job queue: "
+        + ", ".join(f"{count} {state}" for state, count in counts.items())
+        + "."
+    )
+    if counts.get("dead"):
+        logger.warning(
+            f"{counts['dead']} day/s failed too many times, see `python apodify/jobqueue.py --dead`."
+        )
+
+
+def close() -> None:
+    """Close the job queue if it was opened."""
+
+    global _queue
+
+    with _queue_lock:
+        if _queue is not None:
+            _queue.close()
+            _queue = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Show the job queue and its dead-letter list."
+    )
+    parser.add_argument(
+        "--dead", action="store_true", help="list the days which failed too many times"
+    )
+    parser.add_argument(
+        "--retry-dead",
+        nargs="*",
+        metavar="DATE",
+        help="queue dead days again (all of them if no date is given)",
+    )
+    args = parser.parse_args()
+
+    config.init()
+
+    queue = get_queue()
+
+    if args.retry_dead is not None:
+        moved = queue.retry_dead(args.retry_dead or None)
+        logger.info(f"{moved} dead day/s queued again.")
+
+    print(
+        ", ".join(f"{count} {state}" for state, count in queue.counts().items())
+        or "The job queue is empty."
+    )
+
+    if args.dead:
+        for date, attempts, last_error in queue.dead():
+            print(f"{date}  {attempts} attempt/s  {last_error}")
+
+    close()
@@ -1,92 +1,528 @@
+import argparse
+import asyncio
 import colorama
+import config
 import datetime
 import dotenv
+import hashlib
+import httpclient
 import json
+import mimetypes
+import mmap
 import os
 import pathlib
-import requests
+import sys
+import threading
+import typing
+import urllib.parse
 
 from logger import logger
 
+# httpx is only needed for mirroring, reading the mirror (see `read_apods`) must not load it
+if typing.TYPE_CHECKING:
+    import httpx
+
 dotenv.load_dotenv()
 
+LOCAL_APOD_DIR = pathlib.Path("./.local_apod")
+MANIFEST_PATH = LOCAL_APOD_DIR / "manifest.json"
+
+FIRST_DATE = datetime.date(1995, 6, 16)
+
+_CHUNK_SIZE = 64 * 1024
+
+_manifest = None
+_manifest_lock = threading.Lock()
 
-def save_apods(start_date: str, end_date: str) -> None:
-    """Save APOD data locally for a specific date range.
 
-    Data from one APOD day corresponds to one file stored at `/.local_apod/data/{YYYY}/{MM}/{DD}.json`.
+def _load_manifest() -> dict:
+    """Load the mirror manifest.
+
+    The manifest keeps, for every mirrored day, the checksums of its files, and for every year
+    the last date up to which all days were mirrored (`synced_through`).
     """
 
-    logger.info(f"Fetching APOD data for {start_date} - {end_date} ...")
+    if MANIFEST_PATH.is_file():
+        manifest = json.loads(MANIFEST_PATH.read_text(encoding="utf-8"))
+    else:
+        manifest = {}
+
+    manifest.setdefault("synced_through", {})
+    manifest.setdefault("days", {})
+
+    return manifest
+
+
+def _save_manifest(manifest: dict) -> None:
+    MANIFEST_PATH.parent.mkdir(exist_ok=True, parents=True)
+
+    tmp_path = MANIFEST_PATH.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(manifest, indent=4, sort_keys=True))
+    os.replace(tmp_path, MANIFEST_PATH)
+
+
+def _checksum(path: pathlib.Path) -> str:
+    digest = hashlib.sha256()
+
+    with open(path, "rb") as handler:
+        while chunk := handler.read(_CHUNK_SIZE):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def _is_mirrored(file: dict | None, verify: bool) -> bool:
+    """Check whether a file listed in the manifest is present and unchanged."""
+
+    if file is None:
+        return False
+
+    path = LOCAL_APOD_DIR / file["path"]
+    if not path.is_file() or path.stat().st_size != file["size"]:
+        return False
+
+    return not verify or _checksum(path) == file["sha256"]
+
+
+def _is_day_mirrored(day: dict | None, verify: bool) -> bool:
+    if day is None or not _is_mirrored(day.get("data"), verify):
+        return False
+
+    # `None` means that the APOD does not point to an image, so there is nothing to download
+    return "image" in day and (
+        day["image"] is None or _is_mirrored(day["image"], verify)
+    )
+
+
+async def _send(
+    client: "httpx.AsyncClient", url: str, headers: dict | None = None
+) -> "httpx.Response":
+    """Send a streamed GET request, retrying connection errors, 429 and 5xx responses.
+
+    Requests to api.nasa.gov share the rate limiter of `httpclient`. The response must be closed by the caller.
+    """
+
+    import httpx
+
+    rate_limiter = (
+        httpclient.get_rate_limiter()
+        if urllib.parse.urlsplit(url).hostname in httpclient.RATE_LIMITED_HOSTS
+        else None
+    )
+
+    for attempt in range(config.get.http_retries + 1):
+        if attempt > 0:
+            await asyncio.sleep(config.get.http_backoff * 2 ** (attempt - 1))
+
+        if rate_limiter is not None:
+            await asyncio.sleep(rate_limiter.reserve())
 
-    base_url = "https://api.nasa.gov/planetary/apod"
+        try:
+            response = await client.send(
+                client.build_request("GET", url, headers=headers), stream=True
+            )
+        except httpx.TransportError as exception:
+            if attempt == config.get.http_retries:
+                raise
+            logger.warning(f"Request failed (attempt {attempt + 1}): {exception}")
+            continue
+
+        if rate_limiter is not None:
+            rate_limiter.update(response.headers)
+
+        if (
+            response.status_code in httpclient.RETRY_STATUSES
+            and attempt < config.get.http_retries
+        ):
+            logger.warning(
+                f"Request failed with status code {response.status_code} (attempt {attempt + 1})."
+            )
+            await response.aclose()
+            continue
+
+        return response
+
+
+async def _fetch_apods(
+    client: "httpx.AsyncClient",
+    semaphore: asyncio.Semaphore,
+    start_date: datetime.date,
+    end_date: datetime.date,
+) -> list | None:
+    """Retrieve APOD data for a date range, or `None` on failure."""
+
+    import httpx
+
+    base_url = config.get.apod_api_url
     query = f"start_date={start_date}&end_date={end_date}"
     url = f"{base_url}?api_key={os.getenv('NASA_API_KEY')}&{query}&thumbs=true"
 
-    response = requests.get(url)
+    logger.info(f"Fetching APOD data for {start_date} - {end_date} ...")
+
+    async with semaphore:
+        try:
+            response = await _send(client, url)
+            try:
+                await response.aread()
+            finally:
+                await response.aclose()
+        except httpx.HTTPError as exception:
+            logger.error(
+                f"Failed to fetch APOD data for {start_date} - {end_date}: {exception}"
+            )
+            return None
 
-    if response.status_code == 200:
-        logger.info("Request was successful (status code 200).")
-        logger.debug(
-            f"X-RateLimit-Remaining: {response.headers.get('X-RateLimit-Remaining')}."
+    if response.status_code != 200:
+        logger.error(
+            f"Failed to fetch APOD data for {start_date} - {end_date} (status code {response.status_code}).",
+            {"response": response.text},
         )
+        return None
 
-        apod_data = response.json()
-        logger.info(f"{len(apod_data)} day/s total.")
+    return response.json()
 
-        for apod in apod_data:
-            date = apod["date"]
 
-            logger.info(
-                f"Saving APOD data from {colorama.Style.BRIGHT}{date}{colorama.Style.NORMAL} to a file ..."
-            )
+async def _download_image(
+    client: "httpx.AsyncClient",
+    semaphore: asyncio.Semaphore,
+    url: str,
+    directory: pathlib.Path,
+    day: str,
+) -> tuple[bool, dict | None]:
+    """Download the image of an APOD day, resuming a previously interrupted download.
+
+    The image is written to `{DD}-img.part` first and renamed to `{DD}-img.{extension}` when complete.
+    If the server supports range requests, an existing `.part` file is continued.
+
+    Returns:
+        Whether the download succeeded, and the manifest entry of the image
+        (`None` if the URL does not point to an image).
+    """
 
-            date_obj = datetime.datetime.strptime(date, "%Y-%m-%d")
-            outfile = pathlib.Path(
-                f"./.local_apod/data/{date_obj.year}/{str(date_obj.month).zfill(2)}/{str(date_obj.day).zfill(2)}.json"
+    import httpx
+
+    part_path = directory / f"{day}-img.part"
+    offset = part_path.stat().st_size if part_path.is_file() else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else None
+
+    async with semaphore:
+        try:
+            response = await _send(client, url, headers)
+        except httpx.HTTPError as exception:
+            logger.warning(f"Failed to fetch the image: {exception}", {"url": url})
+            return False, None
+
+        try:
+            if response.status_code == 416:
+                # the part is broken or already complete, start over next time
+                part_path.unlink(missing_ok=True)
+                return False, None
+
+            if response.status_code not in (200, 206):
+                logger.warning(
+                    f"Failed to fetch the image (status code {response.status_code}).",
+                    {"url": url},
+                )
+                return False, None
+
+            content_type = response.headers.get("content-type")
+            if not content_type or not content_type.startswith("image/"):
+                logger.warning("Non-image APOD", {"url": url})
+                return True, None
+
+            # the server ignored the range, so the whole image is sent again
+            if response.status_code == 200:
+                offset = 0
+
+            digest = hashlib.sha256()
+            if offset:
+                with open(part_path, "rb") as handler:
+                    while chunk := handler.read(_CHUNK_SIZE):
+                        digest.update(chunk)
+
+            with open(part_path, "ab" if offset else "wb") as handler:
+                async for chunk in response.aiter_bytes(_CHUNK_SIZE):
+                    handler.write(chunk)
+                    digest.update(chunk)
+        except httpx.HTTPError as exception:
+            logger.warning(
+                f"The image download was interrupted: {exception}", {"url": url}
             )
-            outfile.parent.mkdir(exist_ok=True, parents=True)
-            outfile.write_text(json.dumps(apod, indent=4))
-
-            img_url = apod["thumbnail_url"] if "thumbnail_url" in apod else apod["url"]
-
-            img_response = requests.get(img_url)
-
-            if img_response.status_code == 200:
-                content_type = img_response.headers.get("content-type")
-                extension = content_type.split("/")[-1] if content_type else "jpg"
-
-                if content_type and content_type.startswith("image/"):
-                    logger.info(f"Saving the corresponding APOD image ...")
-
-                    img_data = img_response.content
-                    with open(
-                        f"./.local_apod/data/{date_obj.year}/{str(date_obj.month).zfill(2)}/{str(date_obj.day).zfill(2)}-img.{extension}",
-                        "wb",
-                    ) as handler:
-                        handler.write(img_data)
-                else:
-                    logger.warning(
-                        "Non-image APOD",
-                        {
-                            "date": date,
-                            "url": apod["url"],
-                            "media_type": apod["media_type"],
-                        },
-                    )
-    else:
-        return
+            return False, None
+        finally:
+            await response.aclose()
+
+    extension = content_type.split(";")[0].split("/")[-1] or "jpg"
+    img_path = directory / f"{day}-img.{extension}"
+    os.replace(part_path, img_path)
+
+    return True, {
+        "path": img_path.relative_to(LOCAL_APOD_DIR).as_posix(),
+        "sha256": digest.hexdigest(),
+        "size": img_path.stat().st_size,
+    }
+
+
+async def _mirror_day(
+    client: "httpx.AsyncClient",
+    semaphore: asyncio.Semaphore,
+    manifest: dict,
+    apod: dict,
+    verify: bool,
+) -> bool:
+    """Mirror the data and the image of a single APOD day. Returns whether it succeeded."""
+
+    date = apod["date"]
+
+    if _is_day_mirrored(manifest["days"].get(date), verify):
+        return True
 
+    logger.info(
+        f"Saving APOD data from {colorama.Style.BRIGHT}{date}{colorama.Style.NORMAL} to a file ..."
+    )
 
-def fetch_apods_by_year(year: int) -> None:
-    if year == 1995:
-        save_apods("1995-06-16", "1995-12-31")
-    elif year == datetime.date.today().year:
-        save_apods(f"{year}-01-01", f"{datetime.date.today()}")
+    date_obj = datetime.datetime.strptime(date, "%Y-%m-%d")
+    directory = (
+        LOCAL_APOD_DIR / "data" / str(date_obj.year) / str(date_obj.month).zfill(2)
+    )
+    directory.mkdir(exist_ok=True, parents=True)
+
+    outfile = directory / f"{str(date_obj.day).zfill(2)}.json"
+    outfile.write_text(json.dumps(apod, indent=4))
+
+    day = {
+        "data": {
+            "path": outfile.relative_to(LOCAL_APOD_DIR).as_posix(),
+            "sha256": _checksum(outfile),
+            "size": outfile.stat().st_size,
+        }
+    }
+    manifest["days"][date] = day
+
+    img_url = apod["thumbnail_url"] if "thumbnail_url" in apod else apod["url"]
+
+    success, image = await _download_image(
+        client, semaphore, img_url, directory, str(date_obj.day).zfill(2)
+    )
+    if success:
+        day["image"] = image
+
+    return success
+
+
+async def _sync_year(
+    client: "httpx.AsyncClient",
+    semaphore: asyncio.Semaphore,
+    manifest: dict,
+    year: int,
+    verify: bool,
+) -> bool:
+    """Mirror a single year, continuing after the last date that was fully mirrored before."""
+
+    today = datetime.date.today()
+    start_date = max(FIRST_DATE, datetime.date(year, 1, 1))
+    end_date = min(today, datetime.date(year, 12, 31))
+
+    synced_through = manifest["synced_through"].get(str(year))
+    if synced_through and not verify:
+        start_date = max(
+            start_date,
+            datetime.date.fromisoformat(synced_through) + datetime.timedelta(days=1),
+        )
+
+    if start_date > end_date:
+        logger.debug(f"{year} is already mirrored.")
+        return True
+
+    apod_data = await _fetch_apods(client, semaphore, start_date, end_date)
+    if apod_data is None:
+        return False
+
+    results = await asyncio.gather(
+        *(_mirror_day(client, semaphore, manifest, apod, verify) for apod in apod_data)
+    )
+
+    # `synced_through` only moves up to the first day that failed; today's (or, depending on the
+    # time zone, yesterday's) APOD may not be published yet, so recent days only count as mirrored
+    # up to the last day the API returned
+    failed_dates = sorted(
+        apod["date"] for apod, success in zip(apod_data, results) if not success
+    )
+    if failed_dates:
+        last_synced = datetime.date.fromisoformat(failed_dates[0]) - datetime.timedelta(
+            days=1
+        )
+    elif end_date < today - datetime.timedelta(days=1):
+        last_synced = end_date
     else:
-        save_apods(f"{year}-01-01", f"{year}-12-31")
+        last_synced = max(
+            (datetime.date.fromisoformat(apod["date"]) for apod in apod_data),
+            default=start_date - datetime.timedelta(days=1),
+        )
+
+    if last_synced >= start_date:
+        manifest["synced_through"][str(year)] = str(last_synced)
+
+    _save_manifest(manifest)
+
+    logger.info(
+        f"{year}: {len(apod_data) - len(failed_dates)} of {len(apod_data)} day/s mirrored."
+    )
+
+    return not failed_dates
+
+
+async def sync(
+    start_year: int = FIRST_DATE.year,
+    end_year: int | None = None,
+    concurrency: int = 8,
+    verify: bool = False,
+) -> bool:
+    """Mirror APOD data and images to `/.local_apod/`.
+
+    Data from one APOD day corresponds to one file stored at `/.local_apod/data/{YYYY}/{MM}/{DD}.json`,
+    and its image to `/.local_apod/data/{YYYY}/{MM}/{DD}-img.{extension}`.
+    Days that are already mirrored (according to `/.local_apod/manifest.json`) are skipped,
+    and years that are fully mirrored are not requested from the API at all.
+
+    Args:
+        start_year: The first year to mirror.
+        end_year: The last year to mirror (default: the current year).
+        concurrency: The maximum number of requests at the same time.
+        verify: Verify the checksums of mirrored files and download the changed ones again.
+
+    Returns:
+        Whether all days were mirrored.
+    """
+
+    import httpx
+
+    end_year = end_year or datetime.date.today().year
+    manifest = _load_manifest()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(
+        timeout=config.get.image_timeout,
+        follow_redirects=True,
+        limits=httpx.Limits(max_connections=concurrency),
+    ) as client:
+        try:
+            results = await asyncio.gather(
+                *(
+                    _sync_year(client, semaphore, manifest, year, verify)
+                    for year in range(max(start_year, FIRST_DATE.year), end_year + 1)
+                )
+            )
+        finally:
+            _save_manifest(manifest)
+
+    return all(results)
+
+
+def _get_manifest() -> dict:
+    """Return the mirror manifest for reading the mirror, loading it on first use."""
+
+    global _manifest
+
+    with _manifest_lock:
+        if _manifest is None:
+            _manifest = _load_manifest()
+
+    return _manifest
+
+
+def read_apods(
+    start_date: str, end_date: str
+) -> typing.Tuple[typing.List[dict], str | None]:
+    """Read mirrored APOD data for a date range.
+
+    A date counts as mirrored if its year is synced through it (see `sync`), so dates
+    without an APOD are not mistaken for gaps in the mirror.
+
+    Args:
+        start_date: The first day of the range (format: "YYYY-MM-DD").
+        end_date: The last day of the range (format: "YYYY-MM-DD").
+
+    Returns:
+        The mirrored APOD data up to the first date which is not mirrored, and that date
+        (None if the whole range is mirrored).
+    """
+
+    manifest = _get_manifest()
+    apod_data = []
+
+    date = datetime.date.fromisoformat(start_date)
+    while date <= datetime.date.fromisoformat(end_date):
+        synced_through = manifest["synced_through"].get(str(date.year))
+        if synced_through is None or str(date) > synced_through:
+            return apod_data, str(date)
+
+        day = manifest["days"].get(str(date))
+        if day is not None:
+            if not _is_mirrored(day.get("data"), verify=False):
+                return apod_data, str(date)
+            apod_data.append(
+                json.loads(
+                    (LOCAL_APOD_DIR / day["data"]["path"]).read_text(encoding="utf-8")
+                )
+            )
+
+        date += datetime.timedelta(days=1)
+
+    return apod_data, None
+
+
+def find_image(date: str, url: str) -> pathlib.Path | None:
+    """Return the path of the mirrored image of a day, or None if it is not mirrored.
+
+    The mirror keeps the image the day points to (`thumbnail_url` or `url`), so e.g. with
+    `use_hdurl` the image is only found if the APOD has no separate high-resolution image.
+    """
+
+    day = _get_manifest()["days"].get(date)
+    if (
+        day is None
+        or not day.get("image")
+        or not day["image"]["size"]
+        or not _is_mirrored(day["image"], verify=False)
+    ):
+        return None
+
+    apod = json.loads(
+        (LOCAL_APOD_DIR / day["data"]["path"]).read_text(encoding="utf-8")
+    )
+    if (apod["thumbnail_url"] if "thumbnail_url" in apod else apod["url"]) != url:
+        return None
+
+    return LOCAL_APOD_DIR / day["image"]["path"]
+
+
+def content_type(path: str | pathlib.Path) -> str | None:
+    """Guess the content type of a mirrored image from its extension."""
+    return mimetypes.guess_type(str(path))[0]
+
+
+def open_image(path: str | pathlib.Path) -> mmap.mmap:
+    """Memory-map a mirrored image, so it is decoded without reading the whole file into memory first."""
+
+    with open(path, "rb") as file:
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
 
 
 if __name__ == "__main__":
-    for year in range(1995, 2024):
-        fetch_apods_by_year(year)
+    parser = argparse.ArgumentParser(description="Mirror APOD data and images.")
+    parser.add_argument("--start-year", type=int, default=FIRST_DATE.year)
+    parser.add_argument("--end-year", type=int, default=None)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--verify", action="store_true", help="verify the checksums of mirrored files"
+    )
+    args = parser.parse_args()
+
+    config.init()
+
+    if not asyncio.run(
+        sync(args.start_year, args.end_year, args.concurrency, args.verify)
+    ):
+        logger.error("Some days were not mirrored, run the sync again to resume.")
+        sys.exit(1)
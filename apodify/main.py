@@ -3,19 +3,32 @@ import dotenv
 dotenv.load_dotenv()
 
 import apod
+import argparse
 import colorama
 import colors
 import config
 import datetime
+import jobqueue
+import manifest
+import metrics
 import os
+import pipeline
+import shard
 import traceback
+import typing
 import utils
 
 from logger import logger
 
 
-def main() -> None:
-    apod_data = apod.get_apod_data()
+def extend(
+    apod_data: typing.Iterable[typing.Dict[str, typing.Union[str, int]]]
+) -> None:
+    if config.get.concurrent is True:
+        pipeline.run(apod_data)
+        print()
+        return
+
     # todo: progress bar
 
     for apod_item in apod_data:
@@ -34,15 +47,36 @@ def main() -> None:
     print()
 
 
+def main() -> None:
+    apod_data = manifest.filter_pending(shard.select(apod.iter_apod_data()))
+
+    if config.get.job_queue is True:
+        jobqueue.run(apod_data, extend)
+    else:
+        extend(apod_data)
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract the colors of APOD images.")
+    parser.add_argument(
+        "--shard",
+        metavar="i/N",
+        help="process only the i-th of N shards of the days (overrides 'shard'), merge with `shard.py`",
+    )
+    args = parser.parse_args()
+
     _start_time = datetime.datetime.now()
 
     try:
         utils.print_start_info()
         config.init()
 
-        os.makedirs("./.output/images/", exist_ok=True)
-        os.makedirs("./.output/data/", exist_ok=True)
+        if args.shard:
+            config.get.shard = args.shard
+        shard.activate()
+
+        os.makedirs(config.output_path("images"), exist_ok=True)
+        os.makedirs(config.output_path("data"), exist_ok=True)
         os.makedirs("./.temp/", exist_ok=True)
 
         colors.generate_filter_colors()
@@ -52,6 +86,9 @@ if __name__ == "__main__":
         logger.critical(critical_error)
     except Exception as exception:
         logger.critical(traceback.format_exc())
+    finally:
+        apod.finalize()
+        metrics.export()
 
     logger.info(
         f"The program finished in {colorama.Style.BRIGHT}{(datetime.datetime.now() - _start_time).total_seconds()}{colorama.Style.NORMAL} sec!"
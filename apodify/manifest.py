@@ -0,0 +1,265 @@
+import catalog
+import config
+import datetime
+import hashlib
+import jobqueue
+import json
+import os
+import pathlib
+import threading
+import typing
+
+from logger import logger
+
+# the run manifest is kept within `output_dir`
+MANIFEST_NAME = "manifest.jsonl"
+
+# configuration settings that change the saved data of a day
+_FINGERPRINT_FIELDS = (
+    "use_hdurl",
+    "supabase_upload",
+    "output_backend",
+    "save_url",
+    "save_media_type",
+    "save_content_type",
+    "save_color_palette",
+    "save_filterable_colors",
+    "save_img_width",
+    "save_img_height",
+    "save_img_wh_ratio",
+    "save_is_animated",
+    "extcolors_tolerance",
+    "extcolors_limit",
+    "extraction_max_pixels",
+    "extraction_backend",
+    "extraction_histogram_bits",
+    "extraction_frames",
+)
+
+# configuration settings that only change the filterable colors of a day, which can be updated
+# from the saved palette without processing the day again (see `refilter`)
+_FILTER_FINGERPRINT_FIELDS = (
+    "filter_colors_metric",
+    "filter_colors_lut_bits",
+)
+
+_manifest_file = None
+_manifest_lock = threading.Lock()
+
+
+def _hash_settings(fields: typing.Iterable[str]) -> str:
+    settings = {field: getattr(config.get, field) for field in fields}
+    return hashlib.sha256(
+        json.dumps(settings, sort_keys=True).encode("utf-8")
+    ).hexdigest()[:16]
+
+
+def fingerprint() -> str:
+    """Return a short hash of the configuration settings that affect the saved data of a day."""
+    return _hash_settings(_FINGERPRINT_FIELDS)
+
+
+def filter_fingerprint() -> str:
+    """Return a short hash of the configuration settings that only affect the filterable colors."""
+    return _hash_settings(_FILTER_FINGERPRINT_FIELDS)
+
+
+def load(path: str | None = None) -> typing.Dict[str, dict]:
+    """Load the run manifest.
+
+    The manifest is an append-only JSON Lines file, so an interrupted run never corrupts it.
+    The latest record of a date wins.
+
+    Args:
+        path: The path of the manifest (default: `manifest.jsonl` within `output_dir`).
+
+    Returns:
+        A dictionary mapping dates (YYYY-MM-DD) to their latest record.
+    """
+
+    manifest_path = path or config.output_path(MANIFEST_NAME)
+
+    records = {}
+    lines = 0
+
+    if not os.path.isfile(manifest_path):
+        return records
+
+    with open(manifest_path, encoding="utf-8") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # a partially written line after a crash
+                continue
+            records[record["date"]] = record
+            lines += 1
+
+    if lines > 2 * len(records) + 1000:
+        logger.debug("Compacting the run manifest ...")
+        tmp_path = pathlib.Path(f"{manifest_path}.tmp")
+        tmp_path.write_text(
+            "".join(json.dumps(record) + "\n" for record in records.values()),
+            encoding="utf-8",
+        )
+        os.replace(tmp_path, manifest_path)
+
+    return records
+
+
+def _is_output_missing(date: str, catalog_dates: typing.Set[str] | None) -> bool:
+    if config.get.supabase_upload is True:
+        return False
+
+    if catalog_dates is not None:
+        return date not in catalog_dates
+
+    date_obj = datetime.datetime.strptime(date, "%Y-%m-%d")
+    return not os.path.isfile(
+        config.output_path(
+            "data",
+            str(date_obj.year),
+            str(date_obj.month).zfill(2),
+            f"{str(date_obj.day).zfill(2)}.json",
+        )
+    )
+
+
+def filter_pending(
+    apod_data: typing.Iterable[typing.Dict[str, typing.Union[str, int]]]
+) -> typing.Iterator[typing.Dict[str, typing.Union[str, int]]]:
+    """Keep only the days that are missing, failed or stale (processed with different settings).
+
+    A day whose filterable colors were found with other settings is stale as well, unless
+    they were updated by `refilter` since.
+
+    Does nothing if `incremental` is disabled.
+
+    Args:
+        apod_data: Dictionaries streamed by `apod.iter_apod_data`.
+
+    Yields:
+        The days which still need to be processed.
+    """
+
+    if config.get.incremental is False:
+        yield from apod_data
+        return
+
+    records = load()
+    current_fingerprint = fingerprint()
+    current_filter_fingerprint = filter_fingerprint()
+    catalog_dates = (
+        catalog.get_catalog().dates() if config.get.output_backend == "sqlite" else None
+    )
+
+    done = pending = 0
+
+    for apod_item in apod_data:
+        if (
+            apod_item.get("date") not in records
+            or records[apod_item["date"]]["status"] != "done"
+            or records[apod_item["date"]]["fingerprint"] != current_fingerprint
+            or records[apod_item["date"]].get("filter_fingerprint")
+            != current_filter_fingerprint
+            or _is_output_missing(apod_item["date"], catalog_dates)
+        ):
+            pending += 1
+            yield apod_item
+        else:
+            done += 1
+
+    logger.info(
+        f"Incremental run: {done} day/s already done, {pending} day/s processed."
+    )
+
+
+def record(date: str, success: bool, error: str | None = None) -> None:
+    """Record the result of processing a day in the run manifest and in the job queue (`job_queue`).
+
+    Does nothing if both `incremental` and `job_queue` are disabled.
+
+    Args:
+        date: The date of the processed APOD (format: "YYYY-MM-DD").
+        success: Whether the day was extended and saved.
+        error: The reason of the failure (e.g. a `FetchFailure` value), if the day failed.
+    """
+
+    jobqueue.record(date, success, error)
+
+    if config.get.incremental is False:
+        return
+
+    entry = {
+        "date": date,
+        "status": "done" if success else "failed",
+        "fingerprint": fingerprint(),
+        "filter_fingerprint": filter_fingerprint(),
+        "finished_at": datetime.datetime.now().isoformat(timespec="seconds"),
+    }
+    if not success and error is not None:
+        entry["error"] = error
+
+    _append([entry])
+
+
+def _append(entries: typing.List[dict]) -> None:
+    """Append records to the run manifest."""
+
+    global _manifest_file
+
+    lines = "".join(json.dumps(entry) + "\n" for entry in entries)
+
+    # failures of write-behind uploads are recorded from a background thread
+    with _manifest_lock:
+        if _manifest_file is None:
+            manifest_path = pathlib.Path(config.output_path(MANIFEST_NAME))
+            manifest_path.parent.mkdir(parents=True, exist_ok=True)
+            _manifest_file = open(manifest_path, "a", encoding="utf-8")
+
+        _manifest_file.write(lines)
+        _manifest_file.flush()
+
+
+def record_refiltered(dates: typing.Iterable[str]) -> int:
+    """Record that the filterable colors of days were updated to the current settings (see `refilter`).
+
+    Only days that are done with the current settings otherwise are updated; days that are stale
+    for another reason stay stale.
+
+    Returns:
+        The number of updated records.
+    """
+
+    records = load()
+    current_fingerprint = fingerprint()
+    current_filter_fingerprint = filter_fingerprint()
+
+    entries = [
+        {
+            **records[date],
+            "filter_fingerprint": current_filter_fingerprint,
+            "finished_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        }
+        for date in dates
+        if date in records
+        and records[date]["status"] == "done"
+        and records[date]["fingerprint"] == current_fingerprint
+        and records[date].get("filter_fingerprint") != current_filter_fingerprint
+    ]
+
+    if entries:
+        _append(entries)
+
+    return len(entries)
+
+
+def close() -> None:
+    """Close the run manifest if it was opened for appending."""
+
+    global _manifest_file
+
+    with _manifest_lock:
+        if _manifest_file is not None:
+            _manifest_file.close()
+            _manifest_file = None
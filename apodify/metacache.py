@@ -0,0 +1,164 @@
+import config
+import datetime
+import json
+import pathlib
+import sqlite3
+import threading
+import time
+import typing
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS days (
+    date TEXT PRIMARY KEY,
+    data TEXT,
+    fetched_at REAL NOT NULL
+);
+"""
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class MetadataCache:
+    """A SQLite database with the APOD data of every retrieved day.
+
+    A day fetched after its date is over does not change anymore, so it is kept forever; a day
+    fetched on its date (which may not be published yet, depending on the time zone) expires
+    after `ttl` seconds. A day without an APOD within a retrieved range is kept as a tombstone
+    (without data) under the same rules, so it is not requested again either.
+
+    Args:
+        path: The path of the database file.
+        ttl: The time the data of today and yesterday is kept for (seconds).
+    """
+
+    def __init__(self, path: str, ttl: float = 3600) -> None:
+        self.path = pathlib.Path(path)
+        self.ttl = ttl
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        # chunks of the date range are retrieved on several threads
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.executescript(_SCHEMA)
+
+        self._lock = threading.Lock()
+
+    def _is_fresh(self, date: str, fetched_at: float, now: float) -> bool:
+        # a day fetched on a later day than its date was published in every time zone,
+        # anything fetched earlier may have changed since (or may not have been published yet)
+        if datetime.date.fromtimestamp(fetched_at) > datetime.date.fromisoformat(date):
+            return True
+
+        return now - fetched_at < self.ttl
+
+    def lookup(
+        self, start_date: str, end_date: str
+    ) -> typing.Tuple[
+        typing.List[typing.Dict[str, typing.Union[str, int]]],
+        typing.List[typing.Tuple[str, str]],
+    ]:
+        """Find the cached days of a date range.
+
+        Returns:
+            The APOD data of the cached days (oldest first), and the sub-ranges of the date range
+            (start date, end date) which are not cached or expired.
+        """
+
+        now = time.time()
+
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT date, data, fetched_at FROM days WHERE date BETWEEN ? AND ? ORDER BY date",
+                (start_date, end_date),
+            ).fetchall()
+
+        cached = {
+            date: data
+            for date, data, fetched_at in rows
+            if self._is_fresh(date, fetched_at, now)
+        }
+
+        missing_ranges = []
+        date = datetime.date.fromisoformat(start_date)
+        last_date = datetime.date.fromisoformat(end_date)
+        while date <= last_date:
+            if date.isoformat() not in cached:
+                if (
+                    missing_ranges
+                    and missing_ranges[-1][1]
+                    == (date - datetime.timedelta(days=1)).isoformat()
+                ):
+                    missing_ranges[-1] = (missing_ranges[-1][0], date.isoformat())
+                else:
+                    missing_ranges.append((date.isoformat(), date.isoformat()))
+            date += datetime.timedelta(days=1)
+
+        return [
+            json.loads(data) for data in cached.values() if data is not None
+        ], missing_ranges
+
+    def store(
+        self,
+        start_date: str,
+        end_date: str,
+        apod_data: typing.List[typing.Dict[str, typing.Union[str, int]]],
+    ) -> None:
+        """Save the APOD data retrieved for a date range; the days of the range without data become tombstones."""
+
+        now = time.time()
+        days = {
+            apod_item["date"]: json.dumps(apod_item)
+            for apod_item in apod_data
+            if "date" in apod_item
+        }
+
+        rows = []
+        date = datetime.date.fromisoformat(start_date)
+        last_date = datetime.date.fromisoformat(end_date)
+        while date <= last_date:
+            rows.append((date.isoformat(), days.pop(date.isoformat(), None), now))
+            date += datetime.timedelta(days=1)
+        # days returned outside of the requested range are kept as well
+        rows.extend((date, data, now) for date, data in days.items())
+
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO days (date, data, fetched_at) VALUES (?, ?, ?)",
+                rows,
+            )
+
+    def close(self) -> None:
+        """Close the database."""
+
+        with self._lock:
+            self._connection.close()
+
+
+def get_cache() -> MetadataCache | None:
+    """Return the metadata cache at `metadata_cache_path`, or None if it is disabled (`metadata_cache`)."""
+
+    global _cache
+
+    if config.get.metadata_cache is False:
+        return None
+
+    with _cache_lock:
+        if _cache is None:
+            _cache = MetadataCache(
+                config.get.metadata_cache_path, config.get.metadata_cache_ttl
+            )
+
+    return _cache
+
+
+def close() -> None:
+    """Close the metadata cache if it was opened."""
+
+    global _cache
+
+    with _cache_lock:
+        if _cache is not None:
+            _cache.close()
+            _cache = None
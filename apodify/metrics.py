@@ -0,0 +1,199 @@
+import config
+import contextlib
+import datetime
+import json
+import os
+import pathlib
+import threading
+import time
+import typing
+
+from logger import logger
+
+# the stages of extending a day, in the order they happen
+STAGES = (
+    "fetch",
+    "decode",
+    "extract",
+    "nearest",
+    "persist",
+    "preview",
+    "preview_render",
+)
+
+_spans: typing.Dict[str, typing.List[float]] = {}
+_counters: typing.Dict[str, float] = {}
+_lock = threading.Lock()
+_started_at = datetime.datetime.now()
+
+
+def _key(name: str, labels: typing.Dict[str, str]) -> str:
+    """Format a counter name with its labels, e.g. `fetch_failures_total{reason="timeout"}`."""
+
+    if not labels:
+        return name
+
+    return (
+        name
+        + "{"
+        + ",".join(f'{label}="{value}"' for label, value in sorted(labels.items()))
+        + "}"
+    )
+
+
+def observe(name: str, seconds: float) -> None:
+    """Record the duration of a span."""
+
+    with _lock:
+        _spans.setdefault(name, []).append(seconds)
+
+
+@contextlib.contextmanager
+def span(name: str) -> typing.Iterator[None]:
+    """Measure the duration of a block of code, e.g. `with metrics.span("extract"): ...`."""
+
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start_time)
+
+
+def increment(name: str, value: float = 1, **labels: str) -> None:
+    """Increase a counter, e.g. `metrics.increment("fetch_failures_total", reason="timeout")`."""
+
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def drain() -> dict:
+    """Return the recorded spans and counters, and start recording from scratch.
+
+    Used by worker processes to hand their measurements over to the main process (see `merge`).
+    """
+
+    global _spans, _counters
+
+    with _lock:
+        snapshot = {"spans": _spans, "counters": _counters}
+        _spans, _counters = {}, {}
+
+    return snapshot
+
+
+def merge(snapshot: dict) -> None:
+    """Add measurements returned by `drain` (in another process) to this process."""
+
+    with _lock:
+        for name, samples in snapshot["spans"].items():
+            _spans.setdefault(name, []).extend(samples)
+        for key, value in snapshot["counters"].items():
+            _counters[key] = _counters.get(key, 0) + value
+
+
+def summarize(samples: typing.List[float]) -> typing.Dict[str, float]:
+    """Return the count, total, mean, p50, p95 and max of a list of durations (in seconds)."""
+
+    samples = sorted(samples)
+    if not samples:
+        return {"count": 0}
+
+    def percentile(p: float) -> float:
+        return samples[min(len(samples) - 1, int(round(p * (len(samples) - 1))))]
+
+    return {
+        "count": len(samples),
+        "total": round(sum(samples), 4),
+        "mean": round(sum(samples) / len(samples), 4),
+        "p50": round(percentile(0.5), 4),
+        "p95": round(percentile(0.95), 4),
+        "max": round(samples[-1], 4),
+    }
+
+
+def summary() -> dict:
+    """Return a summary of the current run: span statistics per stage and all counters."""
+
+    with _lock:
+        spans = {name: list(samples) for name, samples in _spans.items()}
+        counters = dict(_counters)
+
+    ordered = [stage for stage in STAGES if stage in spans] + sorted(
+        name for name in spans if name not in STAGES
+    )
+
+    return {
+        "started_at": _started_at.isoformat(timespec="seconds"),
+        "duration": round((datetime.datetime.now() - _started_at).total_seconds(), 3),
+        "spans": {name: summarize(spans[name]) for name in ordered},
+        "counters": dict(sorted(counters.items())),
+    }
+
+
+def _prometheus(summary: dict) -> str:
+    lines = [
+        "# HELP apodify_stage_seconds Duration of the stages of extending a day.",
+        "# TYPE apodify_stage_seconds summary",
+    ]
+
+    for name, stats in summary["spans"].items():
+        if not stats["count"]:
+            continue
+        for quantile, key in (("0.5", "p50"), ("0.95", "p95")):
+            lines.append(
+                f'apodify_stage_seconds{{stage="{name}",quantile="{quantile}"}} {stats[key]}'
+            )
+        lines.append(f'apodify_stage_seconds_sum{{stage="{name}"}} {stats["total"]}')
+        lines.append(f'apodify_stage_seconds_count{{stage="{name}"}} {stats["count"]}')
+
+    lines.append("# TYPE apodify_stage_seconds_max gauge")
+    for name, stats in summary["spans"].items():
+        if stats["count"]:
+            lines.append(f'apodify_stage_seconds_max{{stage="{name}"}} {stats["max"]}')
+
+    declared = set()
+    for key, value in summary["counters"].items():
+        name = key.split("{")[0]
+        if name not in declared:
+            lines.append(f"# TYPE apodify_{name} counter")
+            declared.add(name)
+        lines.append(f"apodify_{key} {value}")
+
+    lines.append("# TYPE apodify_run_duration_seconds gauge")
+    lines.append(f"apodify_run_duration_seconds {summary['duration']}")
+
+    return "\n".join(lines) + "\n"
+
+
+def export() -> None:
+    """Write the summary of the run to `metrics_dir` (within `output_dir`) as JSON and, if set, to `metrics_prometheus_path`.
+
+    The Prometheus text file is meant for the textfile collector of node_exporter;
+    it is replaced atomically, so the collector never reads a partial file.
+    """
+
+    if config.get.metrics is False:
+        return
+
+    run_summary = summary()
+
+    metrics_dir = pathlib.Path(config.output_path(config.get.metrics_dir))
+    metrics_dir.mkdir(parents=True, exist_ok=True)
+    outfile = metrics_dir / f"{_started_at.strftime('%Y-%m-%d_%H-%M-%S')}.json"
+    outfile.write_text(json.dumps(run_summary, indent=4))
+
+    logger.info(f"Metrics saved to {outfile}.")
+
+    for name, stats in run_summary["spans"].items():
+        if stats["count"]:
+            logger.debug(
+                f"{name:<10} p50: {stats['p50']} sec, p95: {stats['p95']} sec, max: {stats['max']} sec ({stats['count']}x)"
+            )
+
+    if config.get.metrics_prometheus_path:
+        path = pathlib.Path(config.get.metrics_prometheus_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(_prometheus(run_summary))
+        os.replace(tmp_path, path)
@@ -0,0 +1,237 @@
+import apod
+import colorama
+import colors
+import concurrent.futures
+import config
+import datetime
+import manifest
+import metrics
+import multiprocessing
+import preview
+import resultcache
+import typing
+
+from logger import logger
+
+
+def _init_worker(settings: dict) -> None:
+    """Prepare a worker process for extending APODs."""
+
+    config.load(settings)
+    colors.generate_filter_colors(preview=False)
+
+
+def _download(img_url: str) -> apod.Download:
+    """Download an APOD image (runs on a thread)."""
+    return apod.download_apod_image(img_url)
+
+
+def _analyze(date: str, img_data: bytes | str) -> dict:
+    """Decode an APOD image, extract its colors and reduce it for the preview (runs in a worker process).
+
+    `img_data` is either a downloaded image or the path of a mirrored image, which is memory-mapped
+    by the worker, so its content is never copied between processes.
+
+    The reduced image is rendered and saved by the preview writer of the main process.
+    """
+
+    if isinstance(img_data, str):
+        import local
+
+        img_data = local.open_image(img_data)
+
+    img = apod.open_apod_image(img_data)
+    try:
+        # the size may change if the image is reduced for extraction
+        img_size = img.size
+        is_animated = getattr(img, "is_animated", False)
+        hex_colors_palette, filterable_colors = apod.analyze_apod_image(
+            img, resultcache.content_hash(img_data)
+        )
+
+        preview_img = None
+        if preview.enabled():
+            with metrics.span("preview"):
+                preview_img = preview.thumbnail(img)
+    finally:
+        # release the decoded image (and the mapped file) before the next one is decoded
+        img.close()
+        if hasattr(img_data, "close"):
+            img_data.close()
+
+    return {
+        "metrics": metrics.drain(),
+        "color_palette": hex_colors_palette,
+        "filterable_colors": filterable_colors,
+        "img_size": img_size,
+        "is_animated": is_animated,
+        "preview": preview_img,
+    }
+
+
+def run(apod_data: typing.Iterable[typing.Dict[str, typing.Union[str, int]]]) -> None:
+    """Extend APOD days concurrently.
+
+    Images are downloaded on a pool of threads (`io_workers`), while decoding, color extraction
+    and finding the closest colors is done on a pool of worker processes (`cpu_workers`).
+    The results are saved in the main process, in the same way `apod.extend_apod` saves them.
+
+    The days are pulled from `apod_data` only when there is room for them: the number of days in
+    flight is bounded, and no download is started while the downloaded images waiting for
+    (or in) analysis take more than `max_inflight_mb`. Memory does not grow with the date range.
+
+    Args:
+        apod_data: Dictionaries streamed by `apod.iter_apod_data` (or a list of them).
+    """
+
+    _start_time = datetime.datetime.now()
+
+    cpu_workers = config.get.cpu_workers or multiprocessing.cpu_count()
+    max_pending = config.get.io_workers + 2 * cpu_workers
+    max_inflight_bytes = config.get.max_inflight_mb * 1024 * 1024
+
+    logger.info(
+        f"Extending days using {config.get.io_workers} I/O thread/s and {cpu_workers} worker process/es ..."
+    )
+
+    items = iter(apod_data)
+    downloads: dict[concurrent.futures.Future, tuple[dict, str]] = {}
+    analyses: dict[concurrent.futures.Future, tuple[dict, str, str, int]] = {}
+    inflight_bytes = 0
+    submitted = 0
+    extended = 0
+
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=config.get.io_workers
+    ) as io_pool, concurrent.futures.ProcessPoolExecutor(
+        max_workers=cpu_workers,
+        # 'spawn' behaves the same on every platform and is safe to use next to running threads
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(config.export(),),
+    ) as cpu_pool:
+
+        def submit_downloads() -> None:
+            nonlocal submitted
+
+            # the number of days (and bytes of images) in flight is bounded, so images do not pile up in memory
+            while len(downloads) + len(analyses) < max_pending:
+                if max_inflight_bytes and inflight_bytes >= max_inflight_bytes:
+                    metrics.increment("inflight_throttled_total")
+                    return
+
+                apod_item = next(items, None)
+                if apod_item is None:
+                    return
+
+                submitted += 1
+
+                media_type = apod_item.get("media_type")
+                if media_type not in ["image", "video"]:
+                    logger.critical(
+                        f"The media type was not recognized! ({apod_item.get('date')})"
+                    )
+                    logger.warning("Skipping this day!")
+                    manifest.record(apod_item.get("date"), False, "unknown_media_type")
+                    continue
+
+                img_url = apod.select_image_url(
+                    apod_item.get("url"),
+                    apod_item.get("hdurl"),
+                    apod_item.get("thumbnail_url"),
+                    media_type,
+                )
+
+                # mirrored images are read by the worker processes, without the I/O threads
+                local_image = apod.find_local_image(apod_item.get("date"), img_url)
+                if local_image is not None:
+                    img_path, content_type = local_image
+                    # mapped files are kept in the page cache, not counted as images in flight
+                    analyses[cpu_pool.submit(_analyze, apod_item["date"], img_path)] = (
+                        apod_item,
+                        img_url,
+                        content_type,
+                        0,
+                    )
+                    continue
+
+                downloads[io_pool.submit(_download, img_url)] = (apod_item, img_url)
+
+        submit_downloads()
+
+        while downloads or analyses:
+            done, _ = concurrent.futures.wait(
+                [*downloads, *analyses], return_when=concurrent.futures.FIRST_COMPLETED
+            )
+
+            for future in done:
+                if future in downloads:
+                    apod_item, img_url = downloads.pop(future)
+                    img_data, content_type, failure = future.result()
+
+                    if failure is not None:
+                        logger.warning(
+                            f"This APOD was NOT extended! ({apod_item['date']}, {failure.value})"
+                        )
+                        metrics.increment("fetch_failures_total", reason=failure.value)
+                        metrics.increment("days_total", status="failed")
+                        manifest.record(apod_item["date"], False, failure.value)
+                        continue
+
+                    analyses[cpu_pool.submit(_analyze, apod_item["date"], img_data)] = (
+                        apod_item,
+                        img_url,
+                        content_type,
+                        len(img_data),
+                    )
+                    inflight_bytes += len(img_data)
+                else:
+                    apod_item, img_url, content_type, img_bytes = analyses.pop(future)
+                    inflight_bytes -= img_bytes
+
+                    try:
+                        result = future.result()
+                    except Exception as exception:
+                        logger.error(
+                            f"Failed to extend APOD from {apod_item['date']}: {exception}"
+                        )
+                        metrics.increment("days_total", status="failed")
+                        manifest.record(
+                            apod_item["date"],
+                            False,
+                            f"{type(exception).__name__}: {exception}",
+                        )
+                        continue
+
+                    metrics.merge(result["metrics"])
+
+                    apod.save_apod_data(
+                        apod_item["date"],
+                        result["color_palette"],
+                        result["filterable_colors"],
+                        img_url,
+                        apod_item.get("hdurl"),
+                        apod_item.get("media_type"),
+                        content_type,
+                        result["img_size"],
+                        result["is_animated"],
+                    )
+
+                    if result["preview"] is not None:
+                        preview.submit(
+                            apod_item["date"],
+                            result["preview"],
+                            result["color_palette"],
+                            result["filterable_colors"],
+                        )
+
+                    metrics.increment("days_total", status="extended")
+                    manifest.record(apod_item["date"], True)
+                    extended += 1
+                    print(colorama.Fore.YELLOW + f"{' ' * 20} {apod_item['date']}")
+
+            submit_downloads()
+
+    logger.info(
+        f"Extended {extended} of {submitted} day/s in {colorama.Style.BRIGHT}{(datetime.datetime.now() - _start_time).total_seconds()}{colorama.Style.NORMAL} sec!"
+    )
@@ -0,0 +1,286 @@
+import config
+import datetime
+import metrics
+import pathlib
+import queue
+import threading
+import typing
+
+from PIL import Image, ImageDraw
+from logger import logger
+
+# a contact sheet is a calendar of a month: one cell per day, 7 days per row
+_SHEET_COLUMNS = 7
+_SHEET_ROWS = 5
+_CELL_SIZE = (320, 180)
+_CELL_MARGIN = 4
+_SHEET_BACKGROUND = (24, 24, 24)
+
+# the number of months whose cells are kept in memory, the oldest one is written first
+_OPEN_MONTHS = 3
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def preview_path(date: str) -> pathlib.Path:
+    """Return the path of the combined image of a day (within `output_dir`)."""
+    return pathlib.Path(config.output_path("images", f"{date}.jpg"))
+
+
+def contact_sheet_path(month: str) -> pathlib.Path:
+    """Return the path of the contact sheet of a month (format: "YYYY-MM")."""
+    return pathlib.Path(config.output_path("images", "contact_sheets", f"{month}.jpg"))
+
+
+def enabled() -> bool:
+    """Check whether any preview (combined images or contact sheets) is generated."""
+
+    return (
+        config.get.generate_combined_image is True
+        or config.get.preview_contact_sheets is True
+    )
+
+
+def thumbnail(img: Image.Image) -> Image.Image:
+    """Reduce an APOD image to `preview_max_height` pixels (0 keeps the original size).
+
+    This is the only part of generating a preview done on the critical path; the full-resolution
+    image can be released right after, and the small RGB copy is handed over to the background writer.
+    """
+
+    max_height = config.get.preview_max_height
+    reduced = img
+
+    if max_height and img.height > max_height:
+        width = max(1, round(img.width * max_height / img.height))
+        # `reducing_gap` shrinks the image by an integer factor first, which is much faster for large images
+        reduced = img.resize(
+            (width, max_height), Image.Resampling.LANCZOS, reducing_gap=2.0
+        )
+
+    if reduced.mode != "RGB":
+        reduced = reduced.convert("RGB")
+
+    # never hand over the original image, the caller closes it
+    return reduced if reduced is not img else img.copy()
+
+
+def render(
+    img: Image.Image,
+    color_palette: typing.List[str],
+    filterable_colors: typing.List[str],
+) -> Image.Image:
+    """Put an APOD image next to its color palette and filterable colors."""
+
+    img_width, img_height = img.size
+    new_image = Image.new(
+        "RGB", (img_width + 10 + 100 + 10 + 100 + 10, img_height), "white"
+    )
+    new_image.paste(img, (0, 0))
+
+    draw = ImageDraw.Draw(new_image)
+
+    rec_height = (img_height - 20) / len(color_palette)
+
+    pos_x = img_width + 10
+    pos_y = 10
+
+    for i, color in enumerate(color_palette):
+        draw.rectangle(
+            [
+                (pos_x, pos_y + i * rec_height),
+                (pos_x + 100, pos_y + (i + 1) * rec_height),
+            ],
+            fill=color,
+            outline=None,
+        )
+
+    pos_x = img_width + 10 + 100 + 10
+    pos_y = 10
+
+    if config.get.save_filterable_colors is True:
+        for i, color in enumerate(filterable_colors):
+            draw.rectangle(
+                [
+                    (pos_x, pos_y + i * rec_height),
+                    (pos_x + 100, pos_y + (i + 1) * rec_height),
+                ],
+                fill=color,
+                outline=None,
+            )
+
+    return new_image
+
+
+def _cell_position(day: int) -> typing.Tuple[int, int]:
+    column, row = (day - 1) % _SHEET_COLUMNS, (day - 1) // _SHEET_COLUMNS
+    return (
+        _CELL_MARGIN + column * (_CELL_SIZE[0] + _CELL_MARGIN),
+        _CELL_MARGIN + row * (_CELL_SIZE[1] + _CELL_MARGIN),
+    )
+
+
+def save_contact_sheet(month: str, cells: typing.Dict[int, Image.Image]) -> None:
+    """Paste the previews of some days of a month into its contact sheet.
+
+    Every day has a fixed cell, so days extended by an earlier run stay on the sheet.
+
+    Args:
+        month: The month (format: "YYYY-MM").
+        cells: Previews keyed by the day of the month, already reduced to fit a cell.
+    """
+
+    path = contact_sheet_path(month)
+    size = (
+        _SHEET_COLUMNS * (_CELL_SIZE[0] + _CELL_MARGIN) + _CELL_MARGIN,
+        _SHEET_ROWS * (_CELL_SIZE[1] + _CELL_MARGIN) + _CELL_MARGIN,
+    )
+
+    sheet = None
+    if path.is_file():
+        with Image.open(path) as existing:
+            if existing.size == size:
+                sheet = existing.convert("RGB")
+    if sheet is None:
+        sheet = Image.new("RGB", size, _SHEET_BACKGROUND)
+
+    draw = ImageDraw.Draw(sheet)
+
+    for day, cell in sorted(cells.items()):
+        x, y = _cell_position(day)
+        draw.rectangle(
+            [(x, y), (x + _CELL_SIZE[0] - 1, y + _CELL_SIZE[1] - 1)],
+            fill=_SHEET_BACKGROUND,
+        )
+        sheet.paste(
+            cell,
+            (
+                x + (_CELL_SIZE[0] - cell.width) // 2,
+                y + (_CELL_SIZE[1] - cell.height) // 2,
+            ),
+        )
+        draw.rectangle([(x, y), (x + 22, y + 14)], fill=_SHEET_BACKGROUND)
+        draw.text((x + 4, y + 2), str(day), fill="white")
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    sheet.save(path, "JPEG", quality=90)
+
+
+def contact_sheet_cells(
+    path: pathlib.Path, days: typing.Iterable[int]
+) -> typing.Dict[int, Image.Image]:
+    """Cut the cells of some days out of a contact sheet (e.g. to merge sheets, see `shard`)."""
+
+    with Image.open(path) as sheet:
+        sheet = sheet.convert("RGB")
+
+    cells = {}
+    for day in days:
+        x, y = _cell_position(day)
+        cells[day] = sheet.crop((x, y, x + _CELL_SIZE[0], y + _CELL_SIZE[1]))
+
+    return cells
+
+
+class PreviewWriter:
+    """Render and save previews on a background thread.
+
+    The queue is bounded (`preview_queue_size`), so a slow disk makes `submit` wait instead of
+    piling up images in memory. With `preview_contact_sheets`, the previews of the last
+    few months are kept as small cells and written to `/.output/images/contact_sheets/{YYYY-MM}.jpg`.
+    """
+
+    def __init__(self, max_queued: int = 8) -> None:
+        self._queue = queue.Queue(maxsize=max(1, max_queued))
+        self._months: typing.Dict[str, typing.Dict[int, Image.Image]] = {}
+        self._thread = threading.Thread(
+            target=self._run, name="preview-writer", daemon=True
+        )
+        self._thread.start()
+
+    def submit(
+        self,
+        date: str,
+        img: Image.Image,
+        color_palette: typing.List[str],
+        filterable_colors: typing.List[str],
+    ) -> None:
+        """Queue the preview of a day; `img` should already be reduced by `thumbnail`."""
+
+        self._queue.put((date, img, color_palette, filterable_colors))
+
+    def close(self) -> None:
+        """Wait for the queued previews and write the remaining contact sheets."""
+
+        self._queue.put(None)
+        self._thread.join()
+
+        for month in sorted(self._months):
+            self._save_month(month)
+
+    def _run(self) -> None:
+        while (item := self._queue.get()) is not None:
+            date = item[0]
+            try:
+                with metrics.span("preview_render"):
+                    self._render(*item)
+            except Exception as exception:
+                logger.error(f"Failed to generate the preview of {date}: {exception}")
+
+    def _render(
+        self,
+        date: str,
+        img: Image.Image,
+        color_palette: typing.List[str],
+        filterable_colors: typing.List[str],
+    ) -> None:
+        combined_image = render(img, color_palette, filterable_colors)
+
+        if config.get.generate_combined_image is True:
+            combined_image.save(preview_path(date), "JPEG")
+
+        if config.get.preview_contact_sheets is True:
+            date_obj = datetime.date.fromisoformat(date)
+            month = date_obj.strftime("%Y-%m")
+
+            combined_image.thumbnail(_CELL_SIZE)
+            self._months.setdefault(month, {})[date_obj.day] = combined_image
+
+            if len(self._months) > _OPEN_MONTHS:
+                self._save_month(min(self._months))
+
+    def _save_month(self, month: str) -> None:
+        logger.info(f"Saving the contact sheet of {month} ...")
+        try:
+            save_contact_sheet(month, self._months.pop(month))
+        except Exception as exception:
+            logger.error(f"Failed to save the contact sheet of {month}: {exception}")
+
+
+def submit(
+    date: str,
+    img: Image.Image,
+    color_palette: typing.List[str],
+    filterable_colors: typing.List[str],
+) -> None:
+    """Queue the preview of a day on the background writer, starting it on first use."""
+
+    global _writer
+
+    with _writer_lock:
+        if _writer is None:
+            _writer = PreviewWriter(config.get.preview_queue_size)
+
+    _writer.submit(date, img, color_palette, filterable_colors)
+
+
+def close() -> None:
+    """Finish all queued previews and contact sheets."""
+
+    global _writer
+
+    with _writer_lock:
+        if _writer is not None:
+            _writer.close()
+        _writer = None
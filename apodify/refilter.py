@@ -0,0 +1,150 @@
+import argparse
+import catalog
+import colorindex
+import colors
+import config
+import json
+import manifest
+import os
+import pathlib
+import time
+import typing
+
+from logger import logger
+
+
+def _read_json_days() -> typing.Dict[pathlib.Path, dict]:
+    """Read the saved data of all days with a color palette and filterable colors from the JSON files."""
+
+    days = {}
+
+    for path in sorted(pathlib.Path(config.output_path("data")).glob("*/*/*.json")):
+        data = json.loads(path.read_text(encoding="utf-8"))
+        if "filterable" in data and "colors" in data:
+            days[path] = data
+
+    return days
+
+
+def _write_json_days(days: typing.Dict[pathlib.Path, dict]) -> None:
+    for path, data in days.items():
+        tmp_path = path.with_name(f"{path.name}.tmp")
+        tmp_path.write_text(json.dumps(data, indent=4))
+        os.replace(tmp_path, path)
+
+
+def _date(key: pathlib.Path | str) -> str:
+    """Return the date of a day read from a JSON file (`data/{YYYY}/{MM}/{DD}.json`) or the catalog."""
+
+    if isinstance(key, pathlib.Path):
+        return f"{key.parent.parent.name}-{key.parent.name}-{key.stem}"
+
+    return key
+
+
+def refilter(dry_run: bool = False) -> typing.Tuple[int, int]:
+    """Recompute the filterable colors of all saved days from their saved color palettes.
+
+    Reads the palettes from the output backend (`output_backend`), maps all of them to the
+    current filter colors (`filter_colors_metric`) in a single batch and rewrites only the
+    filterable colors that changed. No image is downloaded or analyzed.
+    Days without a saved palette or without filterable colors are left as they are.
+    Data uploaded to Supabase is not changed. The run manifest records the current filter
+    settings for the checked days, so incremental runs do not process them again.
+
+    Args:
+        dry_run: Only count the days whose filterable colors would change.
+
+    Returns:
+        The number of checked days and the number of changed days.
+    """
+
+    import numpy as np
+
+    colors.generate_filter_colors(preview=False)
+
+    if config.get.output_backend == "sqlite":
+        json_days = None
+        palettes = dict(catalog.get_catalog().iter_palettes())
+        current = {
+            date: filterable_colors
+            for date, filterable_colors, _ in catalog.get_catalog().iter_filterable()
+        }
+    else:
+        json_days = _read_json_days()
+        palettes = {path: data["colors"] for path, data in json_days.items()}
+        current = {path: data["filterable"] for path, data in json_days.items()}
+
+    if not palettes:
+        return 0, 0
+
+    logger.info(f"Finding the closest colors for {len(palettes)} palette/s ...")
+
+    keys = list(palettes)
+    lengths = [len(palettes[key]) for key in keys]
+    rgb_colors = np.array(
+        [colors.hex_to_rgb(color) for key in keys for color in palettes[key]],
+        dtype=np.uint8,
+    ).reshape(-1, 3)
+
+    closest_colors = colors.find_closest_colors_batch(rgb_colors)
+
+    filterable = {}
+    offset = 0
+    for key, length in zip(keys, lengths):
+        filterable[key] = closest_colors[offset : offset + length]
+        offset += length
+
+    changed = {
+        key: filterable_colors
+        for key, filterable_colors in filterable.items()
+        if filterable_colors != current.get(key)
+    }
+
+    if changed and not dry_run:
+        logger.info(f"Saving the filterable colors of {len(changed)} day/s ...")
+
+        if json_days is None:
+            catalog.get_catalog().update_filterable(changed)
+        else:
+            _write_json_days(
+                {
+                    path: {**json_days[path], "filterable": filterable_colors}
+                    for path, filterable_colors in changed.items()
+                }
+            )
+
+        if config.get.color_index is True:
+            logger.info("Rebuilding the color index ...")
+            colorindex.rebuild()
+
+    if not dry_run:
+        # the filterable colors of all checked days match the current settings now
+        manifest.record_refiltered(_date(key) for key in palettes)
+
+    return len(palettes), len(changed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Recompute the filterable colors of the saved days (offline)."
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="only count the days whose filterable colors would change",
+    )
+    args = parser.parse_args()
+
+    config.init()
+
+    start_time = time.perf_counter()
+    try:
+        checked, changed = refilter(args.dry_run)
+    finally:
+        catalog.close()
+        manifest.close()
+
+    logger.info(
+        f"{changed} of {checked} day/s {'would change' if args.dry_run else 'changed'} in {round(time.perf_counter() - start_time, 2)} sec."
+    )
@@ -0,0 +1,96 @@
+import cache
+import colors
+import config
+import hashlib
+import json
+import threading
+import typing
+
+# bump when the extraction or the nearest-color search changes in a way the settings do not capture
+_VERSION = 1
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _get_cache() -> cache.DiskCache | None:
+    """Return the result cache, or None if caching results is disabled."""
+
+    global _cache
+
+    if config.get.result_cache is False:
+        return None
+
+    with _cache_lock:
+        if _cache is None:
+            _cache = cache.DiskCache(
+                config.get.result_cache_dir,
+                config.get.result_cache_max_mb * 1024 * 1024,
+            )
+
+    return _cache
+
+
+def content_hash(img_data: bytes) -> str:
+    """Return the SHA-256 hash of the content of a downloaded image."""
+    return hashlib.sha256(img_data).hexdigest()
+
+
+def _key(img_hash: str) -> str:
+    """Build the cache key of an image from its content hash and every setting that affects the result."""
+
+    settings = {
+        "version": _VERSION,
+        "backend": config.get.extraction_backend,
+        "tolerance": config.get.extcolors_tolerance,
+        "limit": config.get.extcolors_limit,
+        "max_pixels": config.get.extraction_max_pixels,
+        "histogram_bits": config.get.extraction_histogram_bits,
+        "frames": config.get.extraction_frames,
+        "filter_colors": colors.filter_colors_version(),
+        "filter_colors_lut_bits": config.get.filter_colors_lut_bits,
+        "save_color_palette": config.get.save_color_palette,
+        "save_filterable_colors": config.get.save_filterable_colors,
+    }
+
+    return f"{img_hash}/{json.dumps(settings, sort_keys=True)}"
+
+
+def get(
+    img_hash: str,
+) -> tuple[typing.List[str], typing.List[str]] | None:
+    """Return the cached color palette and filterable colors of an image, or None if it is not cached.
+
+    Args:
+        img_hash: The content hash of the image (see `content_hash`).
+    """
+
+    result_cache = _get_cache()
+    if result_cache is None:
+        return None
+
+    cached = result_cache.get(_key(img_hash))
+    if cached is None:
+        return None
+
+    result = json.loads(cached[0])
+    return result["color_palette"], result["filterable_colors"]
+
+
+def put(
+    img_hash: str,
+    color_palette: typing.List[str],
+    filterable_colors: typing.List[str],
+) -> None:
+    """Store the color palette and filterable colors of an image."""
+
+    result_cache = _get_cache()
+    if result_cache is None:
+        return
+
+    result_cache.put(
+        _key(img_hash),
+        json.dumps(
+            {"color_palette": color_palette, "filterable_colors": filterable_colors}
+        ).encode(),
+    )
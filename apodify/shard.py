@@ -0,0 +1,364 @@
+import argparse
+import catalog
+import colorindex
+import config
+import datetime
+import json
+import manifest
+import pathlib
+import preview
+import re
+import shutil
+import sys
+import typing
+import utils
+
+from logger import logger
+
+# days are assigned to shards by their number of days since the first APOD
+EPOCH = datetime.date(1995, 6, 16)
+
+ASSIGNMENT_NAME = "shard.json"
+SUMMARY_NAME = "merge_summary.json"
+
+_PARTITION_PATTERN = re.compile(r"^(\d+)-of-(\d+)$")
+
+
+def parse(spec: str) -> typing.Tuple[int, int]:
+    """Parse a shard specification such as "2/4" (the second of four shards).
+
+    Returns:
+        The index of the shard (starting at 1) and the number of shards.
+    """
+
+    match = re.fullmatch(r"\s*(\d+)\s*/\s*(\d+)\s*", str(spec))
+    if match is None or not 1 <= int(match[1]) <= int(match[2]):
+        raise utils.CriticalError(
+            f"Invalid 'shard': '{spec}' (expected 'i/N' with 1 <= i <= N, e.g. '1/4')"
+        )
+
+    return int(match[1]), int(match[2])
+
+
+def is_assigned(date: str, index: int, count: int) -> bool:
+    """Check whether a day belongs to a shard.
+
+    Consecutive days go to consecutive shards, so every shard gets the same share of old
+    (small) and recent (large) images, and the assignment does not depend on the date range.
+    """
+
+    return (datetime.date.fromisoformat(date) - EPOCH).days % count == index - 1
+
+
+def partition_dir(index: int, count: int) -> str:
+    """Return the output directory of a shard (within `output_dir`)."""
+    return config.output_path("shards", f"{index}-of-{count}")
+
+
+def _date_range() -> typing.Tuple[str, str]:
+    """Return the first and the last day of this run (`date`, or `start_date` and `end_date`)."""
+
+    if config.get.date is not None:
+        return str(config.get.date), str(config.get.date)
+
+    return str(config.get.start_date), str(config.get.end_date)
+
+
+def _write_assignment(index: int, count: int, dates: typing.Iterable[str]) -> None:
+    """Record the days assigned to this run's shard in its partition (see `merge`)."""
+
+    start_date, end_date = _date_range()
+
+    path = pathlib.Path(config.output_path(ASSIGNMENT_NAME))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(
+        json.dumps(
+            {
+                "shard": f"{index}/{count}",
+                "start_date": start_date,
+                "end_date": end_date,
+                "dates": sorted(dates),
+            },
+            indent=4,
+        )
+    )
+
+
+def activate() -> None:
+    """Write the outputs of this run to the partition of its shard (`shard`), if it is set.
+
+    The days of the date range assigned to the shard are recorded before any of them is processed,
+    so the merge step reports the days of a shard that stopped early as missing.
+    """
+
+    if not config.get.shard:
+        return
+
+    index, count = parse(config.get.shard)
+    config.get.output_dir = partition_dir(index, count)
+
+    logger.info(
+        f"Running shard {index} of {count} (output: '{config.get.output_dir}')."
+    )
+
+    start_date, end_date = _date_range()
+    date = datetime.date.fromisoformat(start_date)
+    dates = []
+    while date <= datetime.date.fromisoformat(end_date):
+        if is_assigned(date.isoformat(), index, count):
+            dates.append(date.isoformat())
+        date += datetime.timedelta(days=1)
+
+    _write_assignment(index, count, dates)
+
+
+def select(
+    apod_data: typing.Iterable[typing.Dict[str, typing.Union[str, int]]]
+) -> typing.Iterator[typing.Dict[str, typing.Union[str, int]]]:
+    """Keep only the days of this run's shard (`shard`).
+
+    Does nothing if `shard` is not set. Once all days are streamed, the assignment recorded by
+    `activate` is narrowed down to the days that have an APOD.
+
+    Args:
+        apod_data: Dictionaries streamed by `apod.iter_apod_data`.
+
+    Yields:
+        The days assigned to the shard.
+    """
+
+    if not config.get.shard:
+        yield from apod_data
+        return
+
+    index, count = parse(config.get.shard)
+
+    selected = []
+    total = 0
+    for apod_item in apod_data:
+        total += 1
+        if is_assigned(apod_item["date"], index, count):
+            selected.append(apod_item["date"])
+            yield apod_item
+
+    logger.info(f"Shard {index}/{count}: {len(selected)} of {total} day/s.")
+
+    # the merge step compares the assigned days with the saved ones
+    _write_assignment(index, count, selected)
+
+
+def _partition_days(partition: pathlib.Path) -> typing.Dict[str, typing.Any]:
+    """Return the saved days of a partition, mapped to their JSON file (or `None` for the catalog)."""
+
+    if config.get.output_backend == "sqlite":
+        catalog_path = partition / config.get.catalog_path
+        if not catalog_path.is_file():
+            return {}
+        shard_catalog = catalog.Catalog(str(catalog_path))
+        try:
+            return {date: None for date in shard_catalog.dates()}
+        finally:
+            shard_catalog.close()
+
+    return {
+        path.parent.parent.name + "-" + path.parent.name + "-" + path.stem: path
+        for path in sorted((partition / "data").glob("*/*/*.json"))
+    }
+
+
+def _merge_partition(
+    partition: pathlib.Path, dates: typing.Set[str], files: typing.Dict[str, typing.Any]
+) -> None:
+    """Copy the given days of a partition (data, previews, contact sheet cells) to the output."""
+
+    if config.get.output_backend == "sqlite":
+        shard_catalog = catalog.Catalog(str(partition / config.get.catalog_path))
+        try:
+            for row, color_palette, filterable_colors in shard_catalog.iter_days():
+                if row["date"] in dates:
+                    catalog.get_catalog().add(row, color_palette, filterable_colors)
+        finally:
+            shard_catalog.close()
+    else:
+        for date in dates:
+            outfile = pathlib.Path(config.output_path("data", *date.split("-")[:2]))
+            outfile.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(files[date], outfile / files[date].name)
+
+    for date in dates:
+        img_path = partition / "images" / f"{date}.jpg"
+        if img_path.is_file():
+            preview.preview_path(date).parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(img_path, preview.preview_path(date))
+
+    months: typing.Dict[str, typing.List[int]] = {}
+    for date in dates:
+        months.setdefault(date[:7], []).append(int(date[8:]))
+
+    for month, days in sorted(months.items()):
+        sheet_path = partition / "images" / "contact_sheets" / f"{month}.jpg"
+        if sheet_path.is_file():
+            preview.save_contact_sheet(
+                month, preview.contact_sheet_cells(sheet_path, days)
+            )
+
+
+def _merge_manifest(
+    partition: pathlib.Path, index: int, saved: typing.Dict[str, typing.List[int]]
+) -> None:
+    """Append the manifest records of a shard to the run manifest (failed days included)."""
+
+    records = manifest.load(str(partition / manifest.MANIFEST_NAME))
+    if not records:
+        return
+
+    path = pathlib.Path(config.output_path(manifest.MANIFEST_NAME))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as file:
+        for date, record in sorted(records.items()):
+            if date not in saved or saved[date][0] == index:
+                file.write(json.dumps(record) + "\n")
+
+
+def _sum_counters(partition: pathlib.Path) -> typing.Dict[str, float]:
+    """Add up the counters of all runs of a shard (from its metrics summaries)."""
+
+    counters = {}
+    for path in sorted((partition / config.get.metrics_dir).glob("*.json")):
+        for key, value in json.loads(path.read_text(encoding="utf-8"))[
+            "counters"
+        ].items():
+            counters[key] = counters.get(key, 0) + value
+
+    return counters
+
+
+def merge(dry_run: bool = False) -> dict:
+    """Combine the outputs of all shards (`/.output/shards/{i}-of-{N}/`) into the output.
+
+    Data is merged into the JSON files or the catalog (`output_backend`), together with the
+    previews, the contact sheets and the run manifests; the color index is rebuilt.
+    A day saved by more than one shard is taken from the first of them.
+
+    Args:
+        dry_run: Only compare the assigned and the saved days, without copying anything.
+
+    Returns:
+        The summary of the merge, which is also saved to `/.output/merge_summary.json`:
+        the missing shards, the assigned days which were not saved (missing, this includes
+        days without an image), the days saved
+        by more than one shard (duplicate), and the counters of all shards added up.
+    """
+
+    partitions = {}
+    for path in sorted(pathlib.Path(config.output_path("shards")).glob("*-of-*")):
+        match = _PARTITION_PATTERN.match(path.name)
+        if match and path.is_dir():
+            partitions[(int(match[1]), int(match[2]))] = path
+
+    counts = {count for _, count in partitions}
+    if not partitions:
+        raise utils.CriticalError(
+            f"No shards found in '{config.output_path('shards')}'."
+        )
+    if len(counts) > 1:
+        raise utils.CriticalError(
+            f"The shards were split differently ({', '.join(f'{index}-of-{count}' for index, count in sorted(partitions))})."
+        )
+
+    count = counts.pop()
+    missing_shards = sorted(
+        index for index in range(1, count + 1) if (index, count) not in partitions
+    )
+
+    assigned: typing.Set[str] = set()
+    saved: typing.Dict[str, typing.List[int]] = {}
+    partition_days = {}
+    counters: typing.Dict[str, float] = {}
+
+    for (index, _), partition in sorted(partitions.items()):
+        assignment_path = partition / ASSIGNMENT_NAME
+        if assignment_path.is_file():
+            assigned.update(
+                json.loads(assignment_path.read_text(encoding="utf-8"))["dates"]
+            )
+        else:
+            logger.warning(f"Shard {index}/{count} has no '{ASSIGNMENT_NAME}'.")
+
+        partition_days[index] = _partition_days(partition)
+        for date in partition_days[index]:
+            saved.setdefault(date, []).append(index)
+
+        for key, value in _sum_counters(partition).items():
+            counters[key] = counters.get(key, 0) + value
+
+    summary = {
+        "merged_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "shards": count,
+        "missing_shards": missing_shards,
+        "assigned_days": len(assigned),
+        "saved_days": len(saved),
+        "missing_days": sorted(assigned - set(saved)),
+        "duplicate_days": {
+            date: indexes for date, indexes in sorted(saved.items()) if len(indexes) > 1
+        },
+        "counters": dict(sorted(counters.items())),
+    }
+
+    if not dry_run:
+        for (index, _), partition in sorted(partitions.items()):
+            # a duplicate day is taken from the first shard that saved it
+            dates = {date for date in partition_days[index] if saved[date][0] == index}
+
+            logger.info(f"Merging {len(dates)} day/s of shard {index}/{count} ...")
+
+            _merge_partition(partition, dates, partition_days[index])
+            _merge_manifest(partition, index, saved)
+
+        catalog.close()
+
+        if config.get.color_index is True:
+            logger.info("Rebuilding the color index ...")
+            colorindex.rebuild()
+
+        outfile = pathlib.Path(config.output_path(SUMMARY_NAME))
+        outfile.parent.mkdir(parents=True, exist_ok=True)
+        outfile.write_text(json.dumps(summary, indent=4))
+
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Merge the outputs of sharded runs (`main.py --shard i/N`)."
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="only report missing and duplicate days",
+    )
+    args = parser.parse_args()
+
+    config.init()
+
+    try:
+        summary = merge(args.dry_run)
+    except utils.CriticalError as critical_error:
+        logger.critical(critical_error)
+        sys.exit(1)
+
+    logger.info(
+        f"{summary['saved_days']} day/s saved by {summary['shards'] - len(summary['missing_shards'])} of {summary['shards']} shard/s, "
+        f"{len(summary['missing_days'])} missing, {len(summary['duplicate_days'])} duplicate."
+    )
+    if summary["missing_shards"]:
+        logger.warning(
+            f"Missing shards: {', '.join(map(str, summary['missing_shards']))}"
+        )
+    if summary["missing_days"]:
+        logger.warning(f"Missing days: {', '.join(summary['missing_days'])}")
+    if summary["duplicate_days"]:
+        logger.warning(f"Duplicate days: {', '.join(summary['duplicate_days'])}")
+
+    if summary["missing_shards"]:
+        sys.exit(1)
@@ -1,11 +1,36 @@
-from typing import List
-from supabase import create_client, Client
+import metrics
+import threading
+import time
+
+from typing import Callable, List, TYPE_CHECKING
 from os import getenv
+from logger import logger
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> "Client":
+    """Return the Supabase client, creating it on first use.
+
+    The `supabase` package is only imported here, so runs without Supabase uploads never load it.
+    """
 
-supabase: Client = create_client(getenv("SUPABASE_URL"), getenv("SUPABASE_KEY"))
+    global _client
 
+    with _client_lock:
+        if _client is None:
+            from supabase import create_client
 
-def supabase_upload_v1(
+            _client = create_client(getenv("SUPABASE_URL"), getenv("SUPABASE_KEY"))
+
+    return _client
+
+
+def apods_v1_row(
     year: int,
     month: int,
     day: int,
@@ -16,26 +41,179 @@ def supabase_upload_v1(
     height: int,
     ratio: float,
     colors: List[str],
-) -> None:
-    try:
-        (
-            supabase.table("apods_v1")
-            .insert(
-                {
-                    "year": year,
-                    "month": month,
-                    "day": day,
-                    "url": url,
-                    "hdurl": hdurl,
-                    "type": type,
-                    "width": width,
-                    "height": height,
-                    "ratio": ratio,
-                    "colors": colors,
-                }
-            )
-            .execute()
+) -> dict:
+    """Create a row of the `apods_v1` table."""
+
+    return {
+        "year": year,
+        "month": month,
+        "day": day,
+        "url": url,
+        "hdurl": hdurl,
+        "type": type,
+        "width": width,
+        "height": height,
+        "ratio": ratio,
+        "colors": colors,
+    }
+
+
+class BatchUploader:
+    """Buffer rows and upsert them to a Supabase table in batches on a background thread.
+
+    A batch is flushed once it reaches `batch_size` rows or `flush_interval` seconds after
+    its first row was added. A failed batch is retried with exponential backoff (`backoff` seconds,
+    doubled after every retry); if it still fails, its rows are upserted one by one so every failing row can be reported.
+
+    Args:
+        client: A Supabase client, or any object with the same `table(...).upsert(...).execute()` interface.
+        table: The name of the table.
+        on_conflict: Comma-separated columns of the unique constraint used for upserts.
+        batch_size: The maximum number of rows in a single request.
+        flush_interval: The maximum number of seconds a row waits in the buffer.
+        retries: The number of retries of a failed batch.
+        backoff: The delay before the first retry (seconds).
+        on_failure: Called with a row and the exception for every row that failed to upload.
+    """
+
+    def __init__(
+        self,
+        client: "Client",
+        table: str,
+        on_conflict: str,
+        batch_size: int = 100,
+        flush_interval: float = 5.0,
+        retries: int = 3,
+        backoff: float = 1.0,
+        on_failure: Callable[[dict, Exception], None] | None = None,
+    ) -> None:
+        self.client = client
+        self.table = table
+        self.on_conflict = on_conflict
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.backoff = backoff
+        self.on_failure = on_failure
+
+        self.uploaded = 0
+        self.failed: List[tuple[dict, Exception]] = []
+
+        self._buffer: List[dict] = []
+        self._first_row_time = None
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(
+            target=self._run, name="supabase-uploader", daemon=True
+        )
+        self._thread.start()
+
+    def add(self, row: dict) -> None:
+        """Add a row to the buffer."""
+
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("The uploader is closed.")
+
+            self._buffer.append(row)
+
+            # wake up the background thread to start the flush timer or to flush a full batch
+            if self._first_row_time is None:
+                self._first_row_time = time.monotonic()
+                self._condition.notify()
+            elif len(self._buffer) >= self.batch_size:
+                self._condition.notify()
+
+    def close(self) -> List[tuple[dict, Exception]]:
+        """Flush the remaining rows and stop the background thread.
+
+        Returns:
+            A list of (row, exception) tuples for every row that failed to upload.
+        """
+
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+
+        self._thread.join()
+
+        logger.info(
+            f"{self.uploaded} row/s uploaded to '{self.table}', {len(self.failed)} failed."
         )
 
-    except Exception as exception:
-        print(exception)
+        return self.failed
+
+    def _take_batch(self) -> List[dict] | None:
+        """Wait until a batch is due and take it from the buffer (None means the uploader is closed)."""
+
+        with self._condition:
+            while True:
+                if len(self._buffer) >= self.batch_size or (
+                    self._closed and self._buffer
+                ):
+                    break
+
+                if self._closed:
+                    return None
+
+                if self._first_row_time is None:
+                    self._condition.wait()
+                    continue
+
+                remaining = (
+                    self._first_row_time + self.flush_interval - time.monotonic()
+                )
+                if remaining <= 0:
+                    break
+
+                self._condition.wait(remaining)
+
+            batch = self._buffer[: self.batch_size]
+            del self._buffer[: self.batch_size]
+            self._first_row_time = time.monotonic() if self._buffer else None
+
+            return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+
+            self._upload_batch(batch)
+
+    def _upsert(self, rows: List[dict]) -> None:
+        self.client.table(self.table).upsert(
+            rows, on_conflict=self.on_conflict
+        ).execute()
+
+    def _upload_batch(self, batch: List[dict]) -> None:
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+
+            try:
+                with metrics.span("upload"):
+                    self._upsert(batch)
+            except Exception as exception:
+                logger.warning(
+                    f"Failed to upload a batch of {len(batch)} row/s to '{self.table}' (attempt {attempt + 1}): {exception}"
+                )
+                continue
+
+            self.uploaded += len(batch)
+            logger.debug(f"Uploaded a batch of {len(batch)} row/s to '{self.table}'.")
+            return
+
+        # find out which rows cause the failure
+        for row in batch:
+            try:
+                self._upsert([row])
+            except Exception as exception:
+                logger.error(f"Failed to upload a row to '{self.table}': {exception}")
+                metrics.increment("upload_failures_total")
+                self.failed.append((row, exception))
+                if self.on_failure is not None:
+                    self.on_failure(row, exception)
+            else:
+                self.uploaded += 1
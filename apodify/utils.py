@@ -1,8 +1,9 @@
 import colorama
 import json
 import re
+import typing
 
-from datetime import datetime
+from datetime import datetime, timedelta
 
 VERSION: str = "0.0.1"
 
@@ -37,6 +38,37 @@ def is_valid_date_format(date_string: str) -> bool:
     )
 
 
+def split_date_range(
+    start_date: str, end_date: str
+) -> typing.List[typing.Tuple[str, str]]:
+    """Split a date range into chunks, one for each calendar month.
+
+    Args:
+        start_date: The first day of the range (format: "YYYY-MM-DD").
+        end_date: The last day of the range (format: "YYYY-MM-DD").
+
+    Returns:
+        A list of (start_date, end_date) tuples covering the whole range, in order.
+    """
+
+    chunks = []
+
+    chunk_start = datetime.strptime(start_date, "%Y-%m-%d")
+    last_day = datetime.strptime(end_date, "%Y-%m-%d")
+
+    while chunk_start <= last_day:
+        next_month = (chunk_start.replace(day=1) + timedelta(days=32)).replace(day=1)
+        chunk_end = min(next_month - timedelta(days=1), last_day)
+
+        chunks.append(
+            (chunk_start.strftime("%Y-%m-%d"), chunk_end.strftime("%Y-%m-%d"))
+        )
+
+        chunk_start = next_month
+
+    return chunks
+
+
 def print_start_info() -> None:
     print(colorama.Fore.YELLOW + "▁" * 32)
     print(colorama.Fore.YELLOW + "███ apodify " + "█" * 14)
@@ -0,0 +1,194 @@
+"""Generate a fixed corpus of images for benchmarks.
+
+The images are generated from a fixed seed, so every run produces exactly the same files.
+
+Usage (from the root of the repository):
+    python benchmarks/corpus.py [DIRECTORY]
+"""
+
+import math
+import pathlib
+import random
+import sys
+
+from PIL import Image, ImageDraw, ImageFilter
+
+DEFAULT_DIRECTORY = "./.bench/corpus"
+
+
+def _nebula(size: tuple[int, int], seed: int) -> Image.Image:
+    """Soft, overlapping color blobs on a dark background."""
+
+    rng = random.Random(seed)
+    img = Image.new(
+        "RGB", size, (rng.randrange(20), rng.randrange(20), rng.randrange(30))
+    )
+    draw = ImageDraw.Draw(img)
+
+    for _ in range(40):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        radius = rng.randrange(size[0] // 20, size[0] // 4)
+        color = tuple(rng.randrange(256) for _ in range(3))
+        draw.ellipse([x - radius, y - radius, x + radius, y + radius], fill=color)
+
+    return img.filter(ImageFilter.GaussianBlur(size[0] // 30))
+
+
+def _starfield(size: tuple[int, int], seed: int) -> Image.Image:
+    """Bright dots of different colors on a black sky."""
+
+    rng = random.Random(seed)
+    img = Image.new("RGB", size, "black")
+    draw = ImageDraw.Draw(img)
+
+    for _ in range(size[0] * size[1] // 200):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        brightness = rng.randrange(120, 256)
+        tint = rng.choice([(1, 1, 1), (1, 0.8, 0.6), (0.7, 0.8, 1)])
+        draw.point((x, y), fill=tuple(int(brightness * t) for t in tint))
+
+    return img
+
+
+def _gradient(size: tuple[int, int], seed: int) -> Image.Image:
+    """A smooth gradient between two random colors."""
+
+    rng = random.Random(seed)
+    start = [rng.randrange(256) for _ in range(3)]
+    end = [rng.randrange(256) for _ in range(3)]
+
+    img = Image.new("RGB", size)
+    draw = ImageDraw.Draw(img)
+    for x in range(size[0]):
+        t = x / max(1, size[0] - 1)
+        draw.line(
+            [(x, 0), (x, size[1])],
+            fill=tuple(int(s + (e - s) * t) for s, e in zip(start, end)),
+        )
+
+    return img
+
+
+def _planet(size: tuple[int, int], seed: int) -> Image.Image:
+    """A banded disc with a transparent background (RGBA)."""
+
+    rng = random.Random(seed)
+    img = Image.new("RGBA", size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(img)
+
+    radius = min(size) // 2 - 2
+    center = (size[0] // 2, size[1] // 2)
+    bands = [tuple(rng.randrange(256) for _ in range(3)) + (255,) for _ in range(6)]
+
+    for y in range(center[1] - radius, center[1] + radius):
+        half_width = int(math.sqrt(max(0, radius**2 - (y - center[1]) ** 2)))
+        band = bands[(y * len(bands) // size[1]) % len(bands)]
+        draw.line([(center[0] - half_width, y), (center[0] + half_width, y)], fill=band)
+
+    return img
+
+
+def _animation(size: tuple[int, int], seed: int, frames: int) -> list[Image.Image]:
+    """Frames of a nebula slowly shifting its hue."""
+
+    base = _nebula(size, seed).convert("HSV")
+    h, s, v = base.split()
+
+    return [
+        Image.merge(
+            "HSV", (h.point(lambda value: (value + shift) % 256), s, v)
+        ).convert("RGB")
+        for shift in range(0, 256, 256 // frames)
+    ][:frames]
+
+
+def generate(directory: str = DEFAULT_DIRECTORY, scale: int = 1) -> list[pathlib.Path]:
+    """Generate the image corpus.
+
+    Args:
+        directory: The directory the images are saved to.
+        scale: Multiplies the size of every image.
+
+    Returns:
+        The paths of the generated images.
+    """
+
+    path = pathlib.Path(directory)
+    path.mkdir(parents=True, exist_ok=True)
+
+    small = (320 * scale, 240 * scale)
+    files = []
+
+    for seed in range(4):
+        files.append(path / f"nebula-{seed}.jpg")
+        _nebula(small, seed).save(files[-1], quality=90)
+
+    files.append(path / "starfield.jpg")
+    _starfield(small, 10).save(files[-1], quality=90)
+
+    files.append(path / "gradient.png")
+    _gradient(small, 20).save(files[-1])
+
+    files.append(path / "planet.png")
+    _planet(small, 30).save(files[-1])
+
+    files.append(path / "grayscale.jpg")
+    _nebula(small, 40).convert("L").save(files[-1], quality=90)
+
+    # palette and bilevel images, which are converted before they can be reduced
+    files.append(path / "palette.png")
+    _nebula(small, 80).quantize(64).save(files[-1])
+
+    files.append(path / "palette-transparent.png")
+    _planet(small, 90).quantize(16).save(files[-1])
+
+    files.append(path / "still.gif")
+    _nebula(small, 100).save(files[-1])
+
+    files.append(path / "bilevel.png")
+    _starfield(small, 110).convert("1").save(files[-1])
+
+    files.append(path / "animation.gif")
+    frames = _animation((small[0] // 2, small[1] // 2), 50, 8)
+    frames[0].save(
+        files[-1], save_all=True, append_images=frames[1:], duration=100, loop=0
+    )
+
+    return files
+
+
+def generate_hosted(
+    directory: str = DEFAULT_DIRECTORY, scale: int = 1
+) -> dict[str, list[pathlib.Path]]:
+    """Generate the corpus served by the local APOD API stand-in (see `suite.py`).
+
+    Args:
+        directory: The directory the images are saved to.
+        scale: Multiplies the size of every image.
+
+    Returns:
+        The paths of the images by their role: `small` (regular images), `hd` (huge `hdurl` images),
+        `animated` (animated GIFs) and `thumbnail` (video thumbnails).
+    """
+
+    files = generate(directory, scale)
+    path = pathlib.Path(directory)
+
+    hd = path / "hd-nebula.jpg"
+    if not hd.is_file():
+        _nebula((4000 * scale, 3000 * scale), 60).save(hd, quality=90)
+
+    thumbnail = path / "video-thumbnail.jpg"
+    _gradient((480 * scale, 360 * scale), 70).save(thumbnail, quality=85)
+
+    return {
+        "small": [file for file in files if file.stem != "animation"],
+        "hd": [hd],
+        "animated": [file for file in files if file.stem == "animation"],
+        "thumbnail": [thumbnail],
+    }
+
+
+if __name__ == "__main__":
+    for file in generate(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DIRECTORY):
+        print(file)
@@ -0,0 +1,115 @@
+"""Compare the color extraction backends (the `extraction_backend` option) against `extcolors`.
+
+Every backend extracts palettes from a fixed corpus (see `corpus.py`) or from the given images.
+The extraction time and the parity with `extcolors` are reported:
+
+- `exact`: whether the palette is identical to the one extracted by `extcolors`,
+- `drift_mean`: CIE76 distance from each `extcolors` palette color to the closest color of the palette.
+
+With `--check`, the script exits with status 1 if the `numpy` backend (with 8 bits per channel)
+does not extract exactly the same palettes as `extcolors`.
+
+Usage (from the root of the repository):
+    python benchmarks/extraction_backends.py [IMAGE ...] [--tolerance 32] [--limit 4] [--json] [--check]
+"""
+
+import argparse
+import json
+import math
+import pathlib
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1] / "apodify"))
+
+import config
+import convcolors
+import corpus
+import extractors
+
+from PIL import Image
+
+# (backend, histogram bits per channel)
+VARIANTS = [("extcolors", 8), ("numpy", 8), ("numpy", 6), ("numpy", 5)]
+
+
+def _drift(reference: list, palette: list) -> float:
+    if not reference or not palette:
+        return 0.0
+
+    palette_lab = [convcolors.rgb_to_lab(color) for color in palette]
+    return sum(
+        min(math.dist(convcolors.rgb_to_lab(color), lab) for lab in palette_lab)
+        for color in reference
+    ) / len(reference)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("images", nargs="*")
+    parser.add_argument("--tolerance", type=int, default=config.get.extcolors_tolerance)
+    parser.add_argument("--limit", type=int, default=config.get.extcolors_limit)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument(
+        "--check", action="store_true", help="fail if numpy palettes differ"
+    )
+    args = parser.parse_args()
+
+    images = args.images or [str(path) for path in corpus.generate()]
+
+    results = []
+    mismatches = 0
+
+    for path in images:
+        reference = None
+
+        for backend, bits in VARIANTS:
+            config.get.extraction_histogram_bits = bits
+
+            with Image.open(path) as img:
+                img.load()
+                start_time = time.perf_counter()
+                palette = extractors.get_backend(backend)(
+                    img, args.tolerance, args.limit
+                )
+                extraction_time = time.perf_counter() - start_time
+
+            palette = [color for color, _ in palette]
+            if reference is None:
+                reference, reference_time = palette, extraction_time
+
+            exact = palette == reference
+            if backend == "numpy" and bits == 8 and not exact:
+                mismatches += 1
+
+            results.append(
+                {
+                    "image": path,
+                    "backend": backend,
+                    "bits": bits,
+                    "time": round(extraction_time, 4),
+                    "speedup": round(reference_time / extraction_time, 1),
+                    "exact": exact,
+                    "drift_mean": round(_drift(reference, palette), 2),
+                }
+            )
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+    else:
+        print(
+            f"{'image':<24} {'backend':<10} {'bits':>4} {'s':>8} {'speedup':>8} {'exact':>6} {'drift':>6}"
+        )
+        for result in results:
+            print(
+                f"{pathlib.Path(result['image']).name[:24]:<24} {result['backend']:<10} {result['bits']:>4} "
+                f"{result['time']:>8} {result['speedup']:>8} {str(result['exact']):>6} {result['drift_mean']:>6}"
+            )
+
+    if args.check and mismatches:
+        print(f"{mismatches} palette/s extracted by numpy differ from extcolors.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
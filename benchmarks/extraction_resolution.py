@@ -0,0 +1,112 @@
+"""Benchmark color extraction at reduced resolutions (the `extraction_max_pixels` option).
+
+For every image, the palette is extracted at full resolution and then within each pixel budget.
+The extraction time and the palette drift against the full resolution palette are reported:
+
+- `drift_mean` / `drift_max`: CIE76 distance from each full resolution palette color
+  to the closest color of the reduced palette,
+- `filterable_match`: the share of filterable colors that stay the same.
+
+Usage (from the root of the repository):
+    python benchmarks/extraction_resolution.py IMAGE [IMAGE ...] [--budgets 4000000 1000000 250000] [--json]
+"""
+
+import argparse
+import json
+import math
+import pathlib
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1] / "apodify"))
+
+import colors
+import config
+import convcolors
+
+from PIL import Image
+
+
+def _extract(path: str, max_pixels: int) -> tuple[list, float]:
+    config.get.extraction_max_pixels = max_pixels
+
+    with Image.open(path) as img:
+        start_time = time.perf_counter()
+        palette = colors.extract_colors(img)
+        return palette, time.perf_counter() - start_time
+
+
+def _drift(full_palette: list, reduced_palette: list) -> tuple[float, float]:
+    if not full_palette or not reduced_palette:
+        return 0.0, 0.0
+
+    reduced_lab = [convcolors.rgb_to_lab(color) for color in reduced_palette]
+    distances = [
+        min(math.dist(convcolors.rgb_to_lab(color), lab) for lab in reduced_lab)
+        for color in full_palette
+    ]
+
+    return sum(distances) / len(distances), max(distances)
+
+
+def _filterable_match(full_palette: list, reduced_palette: list) -> float:
+    full = set(colors.find_closest_colors(full_palette))
+    reduced = set(colors.find_closest_colors(reduced_palette))
+    return len(full & reduced) / len(full | reduced) if full | reduced else 1.0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("images", nargs="+")
+    parser.add_argument(
+        "--budgets", nargs="+", type=int, default=[4_000_000, 1_000_000, 250_000]
+    )
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    colors.generate_filter_colors(preview=False)
+
+    results = []
+
+    for path in args.images:
+        with Image.open(path) as img:
+            size = img.size
+
+        full_palette, full_time = _extract(path, 0)
+
+        for max_pixels in args.budgets:
+            palette, extraction_time = _extract(path, max_pixels)
+            drift_mean, drift_max = _drift(full_palette, palette)
+
+            results.append(
+                {
+                    "image": path,
+                    "size": size,
+                    "max_pixels": max_pixels,
+                    "full_time": round(full_time, 4),
+                    "time": round(extraction_time, 4),
+                    "speedup": round(full_time / extraction_time, 2),
+                    "drift_mean": round(drift_mean, 2),
+                    "drift_max": round(drift_max, 2),
+                    "filterable_match": round(
+                        _filterable_match(full_palette, palette), 2
+                    ),
+                }
+            )
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+        return
+
+    print(
+        f"{'image':<40} {'max_pixels':>10} {'full s':>8} {'s':>8} {'speedup':>8} {'drift':>7} {'max':>7} {'match':>6}"
+    )
+    for result in results:
+        print(
+            f"{pathlib.Path(result['image']).name[:40]:<40} {result['max_pixels']:>10} {result['full_time']:>8} {result['time']:>8} "
+            f"{result['speedup']:>8} {result['drift_mean']:>7} {result['drift_max']:>7} {result['filterable_match']:>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
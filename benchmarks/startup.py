@@ -0,0 +1,131 @@
+"""Check the startup time of apodify and that heavy dependencies are loaded lazily.
+
+Every check runs in a fresh interpreter (several times, the median is reported):
+
+- `main`: importing the main module (what every run pays before doing any work),
+- `worker`: importing `pipeline` and initializing a worker process (`pipeline._init_worker`).
+
+After importing `main`, none of the `LAZY_MODULES` may be loaded; they are only needed
+by the features which use them (Supabase uploads, HTTP requests, the `numpy` backend, ...).
+The checks run in a temporary directory, so the caches they build do not end up in the repository.
+The script exits with status 1 if a lazy module is loaded or a check exceeds its budget.
+
+Usage (from the root of the repository):
+    python benchmarks/startup.py [--repeat 5] [--max-main-ms 150] [--max-worker-ms 300] [--json]
+"""
+
+import argparse
+import json
+import os
+import pathlib
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPOSITORY_DIR = pathlib.Path(__file__).resolve().parents[1]
+
+LAZY_MODULES = ("supabase", "requests", "httpx", "numpy", "extcolors", "yaml")
+
+_CHECKS = {
+    "main": "import main",
+    "worker": "import config, pipeline; pipeline._init_worker(config.export())",
+}
+
+_CHILD = """
+import json, sys, time
+sys.path.insert(0, {apodify_dir!r})
+start_time = time.perf_counter()
+{code}
+print(json.dumps({{
+    "import_ms": (time.perf_counter() - start_time) * 1000,
+    "loaded": [module for module in {lazy_modules!r} if module in sys.modules],
+}}))
+"""
+
+
+def _run(code: str, work_dir: str) -> dict:
+    start_time = time.perf_counter()
+    process = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            _CHILD.format(
+                code=code,
+                apodify_dir=str(REPOSITORY_DIR / "apodify"),
+                lazy_modules=LAZY_MODULES,
+            ),
+        ],
+        cwd=work_dir,
+        # the check must not depend on (or talk to) a configured Supabase project
+        env={
+            key: value
+            for key, value in os.environ.items()
+            if not key.startswith("SUPABASE")
+        },
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+    result["total_ms"] = (time.perf_counter() - start_time) * 1000
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--max-main-ms", type=float, default=150)
+    parser.add_argument("--max-worker-ms", type=float, default=300)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    budgets = {"main": args.max_main_ms, "worker": args.max_worker_ms}
+    results = {}
+    failures = []
+
+    with tempfile.TemporaryDirectory(prefix="apodify-startup-") as work_dir:
+        for name, code in _CHECKS.items():
+            # the first run may build caches (e.g. the lookup table of the filter colors)
+            _run(code, work_dir)
+            runs = [_run(code, work_dir) for _ in range(args.repeat)]
+
+            results[name] = {
+                "import_ms": round(
+                    statistics.median(run["import_ms"] for run in runs), 1
+                ),
+                "total_ms": round(
+                    statistics.median(run["total_ms"] for run in runs), 1
+                ),
+                "budget_ms": budgets[name],
+                "loaded": runs[0]["loaded"],
+            }
+
+            if name == "main" and runs[0]["loaded"]:
+                failures.append(
+                    f"'{name}' loads {', '.join(runs[0]['loaded'])} (expected lazily)"
+                )
+            if results[name]["import_ms"] > budgets[name]:
+                failures.append(
+                    f"'{name}' takes {results[name]['import_ms']} ms (budget: {budgets[name]} ms)"
+                )
+
+    if args.json:
+        print(json.dumps({"results": results, "failures": failures}, indent=4))
+    else:
+        print(f"{'check':<8} {'import ms':>10} {'total ms':>10} {'budget':>8}  loaded")
+        for name, result in results.items():
+            print(
+                f"{name:<8} {result['import_ms']:>10} {result['total_ms']:>10} {result['budget_ms']:>8}  "
+                f"{', '.join(result['loaded']) or '-'}"
+            )
+        for failure in failures:
+            print(failure)
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,412 @@
+"""Benchmark apodify end to end against a local stand-in for the APOD API.
+
+A local HTTP server replays APOD metadata and serves a generated image corpus (see `corpus.py`):
+small JPEG/PNG images, huge images, animated GIFs, video thumbnails and non-image pages.
+By default the metadata is synthesized for `--days` days; with `--metadata`, a recorded API response
+(e.g. `.temp/apod_data.json`) is replayed with its image URLs pointed at the corpus.
+
+The suite reports:
+
+- `runs`: the wall time of complete runs (`serial` like `main.py`, `concurrent` like `pipeline.run`),
+- `stages`: per-day timings of every stage of a serial run (`fetch`, `decode`, `extract`,
+  `nearest`, `save`, `preview`); `decode` only reads the image header, pixels are decoded during `extract`,
+- `extraction`: the extraction time of every backend for the same images.
+
+Every run happens in a fresh working directory, so the output of apodify never mixes with previous runs;
+the corpus and all the working directories are created in a temporary directory, which is removed afterwards.
+
+Usage (from the root of the repository):
+    python benchmarks/suite.py [--days 20] [--scale 1] [--metadata FILE] [--modes serial concurrent]
+        [--set KEY=VALUE ...] [--output FILE]
+"""
+
+import argparse
+import contextlib
+import datetime
+import hashlib
+import http.server
+import io
+import json
+import logging
+import mimetypes
+import os
+import pathlib
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1] / "apodify"))
+
+import apod
+import colors
+import config
+import corpus
+import extractors
+import metrics
+import pipeline
+import yaml
+
+from logger import logger
+
+REPOSITORY_DIR = pathlib.Path(__file__).resolve().parents[1]
+
+FIRST_SYNTHETIC_DATE = datetime.date(2020, 1, 1)
+
+_NON_IMAGE_PAGE = b"<!DOCTYPE html><html><body><iframe src='https://www.youtube.com/embed/apod'></iframe></body></html>"
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    """Serves `/planetary/apod` from `server.apod_data`, `/corpus/{name}` and `/page/{name}`."""
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str, **headers) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name.replace("_", "-"), value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        url = urllib.parse.urlsplit(self.path)
+
+        if url.path == "/planetary/apod":
+            query = urllib.parse.parse_qs(url.query)
+            start_date = query.get("start_date", [""])[0]
+            end_date = query.get("end_date", [start_date])[0]
+            days = [
+                day
+                for day in self.server.apod_data
+                if start_date <= day["date"] <= end_date
+            ]
+            self._send(
+                200,
+                json.dumps(days).encode("utf-8"),
+                "application/json",
+                X_RateLimit_Limit="1000",
+                X_RateLimit_Remaining="999",
+            )
+
+        elif url.path.startswith("/corpus/"):
+            path = self.server.corpus_dir / pathlib.Path(url.path).name
+            if not path.is_file():
+                self._send(404, b"", "text/plain")
+                return
+
+            body = path.read_bytes()
+            etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+
+            self._send(200, body, mimetypes.guess_type(path.name)[0], ETag=etag)
+
+        elif url.path.startswith("/page/"):
+            self._send(200, _NON_IMAGE_PAGE, "text/html; charset=utf-8")
+
+        else:
+            self._send(404, b"", "text/plain")
+
+
+def _synthesize_metadata(days: int) -> list[dict]:
+    """APOD metadata without URLs (see `_assign_urls`) for `days` days."""
+
+    apod_data = []
+
+    for day in range(days):
+        date = FIRST_SYNTHETIC_DATE + datetime.timedelta(days=day)
+        apod_data.append(
+            {
+                "date": str(date),
+                "title": f"Synthetic APOD {day}",
+                "explanation": "A generated image.",
+                "media_type": "image",
+                "service_version": "v1",
+            }
+        )
+
+    return apod_data
+
+
+def _assign_urls(apod_data: list[dict], base_url: str, hosted: dict) -> list[dict]:
+    """Point every day at the corpus.
+
+    Every 10 days have 6 small images (one of them also with a huge `hdurl`), a huge image,
+    an animated GIF, a video and an image URL pointing to a page. Videos keep being videos.
+    """
+
+    def corpus_url(path: pathlib.Path) -> str:
+        return f"{base_url}/corpus/{path.name}"
+
+    for index, day in enumerate(apod_data):
+        kind = index % 10
+        day.pop("thumbnail_url", None)
+        day.pop("hdurl", None)
+
+        if day.get("media_type") == "video" or kind == 7:
+            day["media_type"] = "video"
+            day["url"] = f"{base_url}/page/video-{index}"
+            day["thumbnail_url"] = corpus_url(hosted["thumbnail"][0])
+        elif kind == 8:
+            day["media_type"] = "image"
+            day["url"] = f"{base_url}/page/image-{index}"
+        elif kind == 9:
+            day["media_type"] = "image"
+            day["url"] = day["hdurl"] = corpus_url(hosted["hd"][0])
+        elif kind == 6:
+            day["media_type"] = "image"
+            day["url"] = corpus_url(hosted["animated"][0])
+        else:
+            day["media_type"] = "image"
+            day["url"] = corpus_url(hosted["small"][index % len(hosted["small"])])
+            if kind == 0:
+                day["hdurl"] = corpus_url(hosted["hd"][0])
+
+    return apod_data
+
+
+@contextlib.contextmanager
+def _run_directory(work_dir: pathlib.Path, name: str):
+    """Run apodify in a fresh working directory (outputs, temp files and caches are relative)."""
+
+    run_dir = work_dir / name
+    shutil.rmtree(run_dir, ignore_errors=True)
+    for directory in (".output/images", ".output/data", ".temp"):
+        (run_dir / directory).mkdir(parents=True)
+
+    cwd = os.getcwd()
+    os.chdir(run_dir)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        apod.finalize()
+        os.chdir(cwd)
+
+
+def _run_serial(apod_data: list[dict]) -> None:
+    for apod_item in apod_data:
+        apod.extend_apod(
+            apod_item.get("date"),
+            apod_item.get("title"),
+            apod_item.get("url"),
+            apod_item.get("hdurl"),
+            apod_item.get("thumbnail_url"),
+            apod_item.get("media_type"),
+            apod_item.get("explanation"),
+        )
+
+
+def _time_stages(apod_data: list[dict]) -> tuple[dict, list[bytes]]:
+    """Time every stage of extending the days one after another."""
+
+    stages = {
+        stage: []
+        for stage in ("fetch", "decode", "extract", "nearest", "save", "preview")
+    }
+    images = []
+
+    for apod_item in apod_data:
+        if apod_item["media_type"] not in ["image", "video"]:
+            continue
+
+        img_url = apod.select_image_url(
+            apod_item["url"],
+            apod_item.get("hdurl"),
+            apod_item.get("thumbnail_url"),
+            apod_item["media_type"],
+        )
+
+        start_time = time.perf_counter()
+        img_data, content_type, failure = apod.download_apod_image(img_url)
+        stages["fetch"].append(time.perf_counter() - start_time)
+
+        if img_data is None:
+            continue
+        images.append(img_data)
+
+        start_time = time.perf_counter()
+        img = apod.open_apod_image(img_data)
+        img_size = img.size
+        stages["decode"].append(time.perf_counter() - start_time)
+
+        start_time = time.perf_counter()
+        palette = colors.extract_colors(img)
+        stages["extract"].append(time.perf_counter() - start_time)
+
+        start_time = time.perf_counter()
+        filterable_colors = colors.find_closest_colors(palette)
+        stages["nearest"].append(time.perf_counter() - start_time)
+
+        hex_palette = [colors.rgb_to_hex(color) for color in palette]
+
+        start_time = time.perf_counter()
+        apod.save_apod_data(
+            apod_item["date"],
+            hex_palette,
+            filterable_colors,
+            img_url,
+            apod_item.get("hdurl"),
+            apod_item["media_type"],
+            content_type,
+            img_size,
+            getattr(img, "is_animated", False),
+        )
+        stages["save"].append(time.perf_counter() - start_time)
+
+        start_time = time.perf_counter()
+        apod.generate_combined_image(
+            img, apod_item["date"], hex_palette, filterable_colors
+        )
+        stages["preview"].append(time.perf_counter() - start_time)
+
+    return {
+        stage: metrics.summarize(samples) for stage, samples in stages.items()
+    }, images
+
+
+def _time_extraction(images: list[bytes]) -> dict:
+    """Time every extraction backend on the same (already downloaded) images."""
+
+    results = {}
+
+    for backend in extractors.BACKENDS:
+        samples = []
+        for img_data in images:
+            img = colors.reduce_for_extraction(apod.open_apod_image(img_data))
+            start_time = time.perf_counter()
+            extractors.get_backend(backend)(
+                img, config.get.extcolors_tolerance, config.get.extcolors_limit
+            )
+            samples.append(time.perf_counter() - start_time)
+        results[backend] = metrics.summarize(samples)
+
+    return results
+
+
+def _environment() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPOSITORY_DIR,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except OSError:
+        commit = None
+
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, default=20)
+    parser.add_argument("--scale", type=int, default=1)
+    parser.add_argument("--metadata", help="a recorded APOD API response to replay")
+    parser.add_argument(
+        "--modes", nargs="+", default=["serial", "concurrent"], metavar="MODE"
+    )
+    parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="override a configuration setting (the value is parsed as YAML)",
+    )
+    parser.add_argument("--output", help="write the results to a JSON file")
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+
+    config.get.supabase_upload = False
+    config.get.image_cache = False
+    for setting in args.set:
+        key, _, value = setting.partition("=")
+        if not hasattr(config.get, key):
+            parser.error(f"unknown configuration setting: '{key}'")
+        setattr(config.get, key, yaml.safe_load(value))
+
+    work_dir = pathlib.Path(tempfile.mkdtemp(prefix="apodify-bench-"))
+    hosted = corpus.generate_hosted(str(work_dir / "corpus"), args.scale)
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.daemon_threads = True
+    server.corpus_dir = work_dir / "corpus"
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    if args.metadata:
+        apod_data = json.loads(pathlib.Path(args.metadata).read_text(encoding="utf-8"))
+    else:
+        apod_data = _synthesize_metadata(args.days)
+    server.apod_data = _assign_urls(apod_data, base_url, hosted)
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    config.get.apod_api_url = f"{base_url}/planetary/apod"
+    config.get.date = None
+    config.get.start_date = min(day["date"] for day in apod_data)
+    config.get.end_date = max(day["date"] for day in apod_data)
+
+    # the lookup table of the filter colors is cached in the working directory
+    with _run_directory(work_dir, "filter_colors"):
+        colors.generate_filter_colors(preview=False)
+
+    results = {
+        "environment": _environment(),
+        "settings": {
+            "days": len(apod_data),
+            "scale": args.scale,
+            "metadata": args.metadata,
+            "overrides": args.set,
+        },
+        "runs": {},
+    }
+
+    try:
+        with _run_directory(work_dir, "metadata"):
+            start_time = time.perf_counter()
+            apod.get_apod_data()
+            results["runs"]["metadata"] = round(time.perf_counter() - start_time, 4)
+
+        for mode in args.modes:
+            with _run_directory(work_dir, mode):
+                start_time = time.perf_counter()
+                if mode == "serial":
+                    _run_serial(apod.get_apod_data())
+                elif mode == "concurrent":
+                    pipeline.run(apod.get_apod_data())
+                else:
+                    parser.error(f"unknown mode: '{mode}'")
+                results["runs"][mode] = round(time.perf_counter() - start_time, 4)
+
+        with _run_directory(work_dir, "stages"):
+            results["stages"], images = _time_stages(apod_data)
+
+        results["extraction"] = _time_extraction(images)
+    finally:
+        server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = json.dumps(results, indent=4)
+    if args.output:
+        pathlib.Path(args.output).write_text(output, encoding="utf-8")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+import pathlib
+import pytest
+import sys
+
+# the modules of apodify import each other by their bare names
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1] / "apodify"))
+
+import catalog
+import colorindex
+import config
+import jobqueue
+import manifest
+
+
+@pytest.fixture
+def output_dir(tmp_path, monkeypatch) -> pathlib.Path:
+    """Run in a temporary directory, with the outputs (`output_dir`) in `.output/` within it."""
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(config.get, "output_dir", str(tmp_path / ".output"))
+
+    yield tmp_path / ".output"
+
+    manifest.close()
+    catalog.close()
+    colorindex.close()
+    jobqueue.close()
@@ -0,0 +1,27 @@
+import apod
+import pytest
+
+
+class FakeResponse:
+    def __init__(self, headers: dict, chunks: list) -> None:
+        self.headers = headers
+        self.chunks = chunks
+
+    def iter_content(self, chunk_size: int):
+        return iter(self.chunks)
+
+
+@pytest.mark.parametrize(
+    "content_length", [None, "", "abc", "-5", "1.5", "2", "4", "999999999999"]
+)
+def test_the_body_is_read_whatever_its_content_length(content_length):
+    headers = {} if content_length is None else {"content-length": content_length}
+    response = FakeResponse(headers, [b"ab", b"cd"])
+
+    assert apod._read_body(response, 100) == b"abcd"
+
+
+def test_a_body_larger_than_the_limit_is_dropped():
+    response = FakeResponse({"content-length": "bogus"}, [b"ab", b"cd"])
+
+    assert apod._read_body(response, 3) is None
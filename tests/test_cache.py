@@ -0,0 +1,26 @@
+import cache
+import os
+
+
+def test_eviction_frees_space_below_the_cap(tmp_path):
+    disk_cache = cache.DiskCache(str(tmp_path), 1000)
+
+    for index in range(10):
+        disk_cache.put(str(index), bytes([index]) * 100)
+        # the modification time of a blob is its last access time
+        access_time = 2000 if index == 0 else 1000 + index
+        os.utime(
+            disk_cache._blob_path(disk_cache.get_meta(str(index))["hash"]),
+            (access_time, access_time),
+        )
+
+    assert disk_cache._size == 1000
+
+    disk_cache.put("10", bytes([10]) * 100)
+
+    assert disk_cache._size <= 1000 * cache.LOW_WATER_MARK
+    assert [key for key in map(str, range(11)) if disk_cache.get(key) is None] == [
+        "1",
+        "2",
+    ]
+    assert not list(tmp_path.glob("*/*/*.tmp"))
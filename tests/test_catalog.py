@@ -0,0 +1,84 @@
+import catalog
+import colors
+import pytest
+import sqlite3
+
+
+def _row(date: str, **values) -> dict:
+    return {
+        "date": date,
+        "url": f"https://apod.nasa.gov/apod/image/{date}.jpg",
+        "media_type": "image",
+        "content_type": "image/jpeg",
+        "width": 640,
+        "height": 480,
+        "wh_ratio": 1.333,
+        "is_animated": 0,
+        **values,
+    }
+
+
+@pytest.fixture
+def database(tmp_path):
+    days = catalog.Catalog(str(tmp_path / "catalog.sqlite3"), batch_size=2)
+    yield days
+    days.close()
+
+
+def test_days_round_trip(database):
+    database.add(_row("2024-01-02"), ["#102030", "#405060"], ["#000040", "#404040"])
+    database.add(_row("2024-01-01", media_type="video"), None, None)
+    database.add(_row("2024-01-03"), ["#FF0000"], None)
+
+    # the third day is still queued
+    assert database.dates() == {"2024-01-01", "2024-01-02", "2024-01-03"}
+
+    assert list(database.iter_days()) == [
+        (_row("2024-01-01", media_type="video"), None, None),
+        (_row("2024-01-02"), ["#102030", "#405060"], ["#000040", "#404040"]),
+        (_row("2024-01-03"), ["#FF0000"], None),
+    ]
+    assert list(database.iter_palettes()) == [("2024-01-02", ["#102030", "#405060"])]
+    assert list(database.iter_filterable()) == [
+        ("2024-01-01", [], "video"),
+        ("2024-01-02", ["#000040", "#404040"], "image"),
+        ("2024-01-03", [], "image"),
+    ]
+
+
+def test_a_day_saved_again_replaces_its_colors(database):
+    database.add(_row("2024-01-01"), ["#102030", "#405060"], ["#000040", "#404040"])
+    database.flush()
+    database.add(_row("2024-01-01", width=320), ["#FFFFFF"], ["#FFFFFF"])
+
+    assert list(database.iter_days()) == [
+        (_row("2024-01-01", width=320), ["#FFFFFF"], ["#FFFFFF"])
+    ]
+
+
+def test_filterable_colors_are_updated(database):
+    database.add(_row("2024-01-01"), ["#102030"], ["#000040"])
+    database.add(_row("2024-01-02"), ["#405060"], ["#404040"])
+
+    database.update_filterable({"2024-01-02": ["#408060", "#406080"]})
+
+    assert [
+        (date, filterable) for date, filterable, _ in database.iter_filterable()
+    ] == [("2024-01-01", ["#000040"]), ("2024-01-02", ["#408060", "#406080"])]
+
+
+def test_colors_are_stored_in_uppercase_for_queries(database, tmp_path):
+    database.add(
+        _row("2024-01-01"),
+        [colors.rgb_to_hex((240, 16, 16))],
+        [colors.rgb_to_hex((255, 0, 0))],
+    )
+    database.flush()
+
+    connection = sqlite3.connect(tmp_path / "catalog.sqlite3")
+    try:
+        assert connection.execute(
+            "select date from colors where kind = 'filterable' and color = '#FF0000'"
+        ).fetchall() == [("2024-01-01",)]
+    finally:
+        connection.close()
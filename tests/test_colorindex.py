@@ -0,0 +1,99 @@
+import catalog
+import colorindex
+import config
+import json
+import pytest
+
+
+# the columns of the catalog which the index does not use
+_EMPTY_ROW = dict.fromkeys(
+    ("url", "content_type", "width", "height", "wh_ratio", "is_animated")
+)
+
+
+@pytest.fixture
+def index() -> colorindex.ColorIndex:
+    color_index = colorindex.ColorIndex()
+    color_index.add("1995-06-16", ["#FF0000", "#0000FF"], "image")
+    color_index.add("2000-01-01", ["#ff0000"], "image")
+    color_index.add("2010-07-25", ["#0000FF", "#00FF00"], "video")
+    color_index.add("2024-01-01", ["#00FF00"], "image")
+    return color_index
+
+
+def test_all_and_any_colors(index):
+    assert index.query() == ["1995-06-16", "2000-01-01", "2010-07-25", "2024-01-01"]
+    assert index.query(all_colors=["#FF0000"]) == ["1995-06-16", "2000-01-01"]
+    assert index.query(all_colors=["#FF0000", "#0000ff"]) == ["1995-06-16"]
+    assert index.query(any_colors=["#FF0000", "#00FF00"]) == [
+        "1995-06-16",
+        "2000-01-01",
+        "2010-07-25",
+        "2024-01-01",
+    ]
+    assert index.query(all_colors=["#0000FF"], any_colors=["#00FF00"]) == ["2010-07-25"]
+    assert index.query(all_colors=["#123456"]) == []
+
+
+def test_date_range_and_media_type(index):
+    assert index.query(start_date="2000-01-01", end_date="2010-07-25") == [
+        "2000-01-01",
+        "2010-07-25",
+    ]
+    assert index.query(start_date="1990-01-01", end_date="1995-06-16") == ["1995-06-16"]
+    assert index.query(end_date="1990-01-01") == []
+    assert index.query(any_colors=["#00FF00"], media_type="image") == ["2024-01-01"]
+
+
+def test_a_day_added_again_replaces_its_entry(index):
+    index.add("2000-01-01", ["#00FF00"], "video")
+
+    assert index.query(all_colors=["#FF0000"]) == ["1995-06-16"]
+    assert index.query(media_type="video") == ["2000-01-01", "2010-07-25"]
+
+    index.remove("2024-01-01")
+
+    assert index.query(all_colors=["#00FF00"]) == ["2000-01-01", "2010-07-25"]
+
+
+def test_the_index_survives_saving_and_loading(index, tmp_path):
+    index.save(str(tmp_path / "colorindex.json"))
+    loaded = colorindex.ColorIndex.load(str(tmp_path / "colorindex.json"))
+
+    assert not index.modified
+    assert loaded.query(all_colors=["#0000FF"], media_type="video") == ["2010-07-25"]
+    assert loaded.to_dict() == index.to_dict()
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_rebuild_reads_the_saved_days(output_dir, monkeypatch, backend):
+    monkeypatch.setattr(config.get, "output_backend", backend)
+
+    days = [
+        ("2024-01-01", ["#FF0000"], "image"),
+        ("2024-01-02", ["#00FF00", "#FF0000"], "video"),
+    ]
+    for date, filterable, media_type in days:
+        if backend == "sqlite":
+            catalog.get_catalog().add(
+                {**_EMPTY_ROW, "date": date, "media_type": media_type},
+                ["#F01010"],
+                filterable,
+            )
+        else:
+            path = output_dir / "data" / date[:4] / date[5:7] / f"{date[8:]}.json"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(
+                json.dumps(
+                    {"date": date, "filterable": filterable, "media_type": media_type}
+                )
+            )
+
+    colorindex.rebuild()
+
+    assert colorindex.get_index().query(all_colors=["#FF0000"]) == [
+        "2024-01-01",
+        "2024-01-02",
+    ]
+    assert colorindex.get_index().query(media_type="video") == ["2024-01-02"]
+    assert (output_dir / config.get.color_index_path).is_file()
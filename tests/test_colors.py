@@ -0,0 +1,25 @@
+import colors
+import config
+import pytest
+
+
+@pytest.mark.parametrize("metric", ["cie76", "ciede2000"])
+def test_lab_lookup_tables_hold_the_closest_color_of_every_cell(
+    tmp_path, monkeypatch, metric
+):
+    monkeypatch.setattr(config.get, "filter_colors_lut_dir", str(tmp_path / "luts"))
+    palette = [colors.hex_to_rgb(color) for color in colors._filter_hex_colors()]
+    bits = 3
+
+    lut = colors._load_filter_colors_lut(palette, metric, bits)
+
+    assert len(list((tmp_path / "luts").glob(f"{metric}-{bits}-*.lut"))) == 1
+
+    entries = memoryview(lut)[: 4 << (3 * bits)].cast("I")
+    for cell in range(1 << (3 * bits)):
+        # the center of the cell
+        center = tuple(
+            ((cell >> shift) & 0b111) * 32 + 15.5 for shift in (2 * bits, bits, 0)
+        )
+        assert entries[cell] & 0xFF == 1
+        assert entries[cell] >> 8 == colors._find_closest_color(center, palette, metric)
@@ -0,0 +1,54 @@
+import config
+import extractors
+import pytest
+import random
+import utils
+
+from PIL import Image, ImageDraw
+
+
+def _blocks() -> Image.Image:
+    img = Image.new("RGB", (48, 32), (20, 40, 90))
+    draw = ImageDraw.Draw(img)
+    draw.rectangle((0, 0, 15, 31), fill=(230, 30, 30))
+    draw.rectangle((16, 0, 23, 15), fill=(235, 35, 28))
+    draw.rectangle((24, 16, 47, 31), fill=(250, 250, 240))
+    draw.ellipse((30, 2, 44, 14), fill=(40, 200, 60))
+    return img
+
+
+def _gradient() -> Image.Image:
+    img = Image.new("RGB", (64, 16))
+    img.putdata([(x * 4, y * 16, 255 - x * 4) for y in range(16) for x in range(64)])
+    return img
+
+
+def _noise() -> Image.Image:
+    generator = random.Random(1995)
+    img = Image.new("RGB", (32, 32))
+    img.putdata(
+        [tuple(generator.randrange(0, 256, 32) for _ in range(3)) for _ in range(1024)]
+    )
+    return img
+
+
+def _transparent() -> Image.Image:
+    img = _blocks().convert("RGBA")
+    ImageDraw.Draw(img).rectangle((0, 0, 23, 31), fill=(0, 0, 0, 0))
+    return img
+
+
+@pytest.mark.parametrize("image", [_blocks, _gradient, _noise, _transparent])
+@pytest.mark.parametrize("tolerance, limit", [(0, None), (12, 8), (32, 4)])
+def test_numpy_extracts_the_palettes_of_extcolors(monkeypatch, image, tolerance, limit):
+    monkeypatch.setattr(config.get, "extraction_histogram_bits", 8)
+
+    img = image()
+    expected = extractors.get_backend("extcolors")(img, tolerance, limit)
+
+    assert extractors.get_backend("numpy")(img, tolerance, limit) == expected
+
+
+def test_unknown_backends_are_rejected():
+    with pytest.raises(utils.CriticalError):
+        extractors.get_backend("opencv")
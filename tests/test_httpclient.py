@@ -0,0 +1,75 @@
+import config
+import httpclient
+import pytest
+import requests
+
+URL = "https://api.nasa.gov/planetary/apod?date=2024-01-01"
+
+
+class FakeResponse:
+    def __init__(self, status_code: int) -> None:
+        self.status_code = status_code
+        self.headers = {"X-RateLimit-Limit": "1000", "X-RateLimit-Remaining": "999"}
+        self.closed = False
+        self.raw = None
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class FakeSession:
+    """Answers with the given status codes (or raises the given exceptions) in turn."""
+
+    def __init__(self, results: list) -> None:
+        self.results = list(results)
+        self.requests = 0
+
+    def get(self, url: str, **kwargs) -> FakeResponse:
+        self.requests += 1
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return FakeResponse(result)
+
+
+class CountingRateLimiter(httpclient.RateLimiter):
+    def __init__(self) -> None:
+        super().__init__(1000)
+        self.acquired = 0
+
+    def acquire(self) -> None:
+        self.acquired += 1
+
+
+@pytest.fixture
+def rate_limiter(monkeypatch) -> CountingRateLimiter:
+    rate_limiter = CountingRateLimiter()
+    monkeypatch.setattr(httpclient, "_rate_limiter", rate_limiter)
+    monkeypatch.setattr(config.get, "apod_retries", 2)
+    monkeypatch.setattr(config.get, "http_backoff", 0)
+    return rate_limiter
+
+
+def test_every_attempt_takes_a_token(monkeypatch, rate_limiter):
+    session = FakeSession([503, requests.ConnectionError("reset"), 200])
+    monkeypatch.setattr(httpclient, "_session", session)
+
+    assert httpclient.get(URL).status_code == 200
+    assert session.requests == rate_limiter.acquired == 3
+
+
+def test_the_last_failed_response_is_returned(monkeypatch, rate_limiter):
+    session = FakeSession([429, 503, 502])
+    monkeypatch.setattr(httpclient, "_session", session)
+
+    assert httpclient.get(URL).status_code == 502
+    assert session.requests == rate_limiter.acquired == 3
+
+
+def test_other_hosts_do_not_take_tokens(monkeypatch, rate_limiter):
+    session = FakeSession([503])
+    monkeypatch.setattr(httpclient, "_session", session)
+
+    # the retries of other hosts are left to the session
+    assert httpclient.get("https://apod.nasa.gov/apod/image/a.jpg").status_code == 503
+    assert rate_limiter.acquired == 0
@@ -0,0 +1,119 @@
+import jobqueue
+import pytest
+
+DATES = ["2024-01-01", "2024-01-02", "2024-01-03"]
+
+
+class Clock:
+    """Stands in for `time.time`, so backoffs and leases expire without waiting."""
+
+    def __init__(self) -> None:
+        self.now = 1_700_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(jobqueue.time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    jobs = jobqueue.JobQueue(
+        str(tmp_path / "jobs.sqlite3"),
+        max_attempts=3,
+        backoff=10,
+        backoff_max=30,
+        lease=100,
+    )
+    jobs.enqueue(DATES)
+    yield jobs
+    jobs.close()
+
+
+def test_leased_days_are_not_leased_again(queue):
+    assert queue.lease(DATES, 2) == ["2024-01-01", "2024-01-02"]
+    assert queue.lease(DATES, 2) == ["2024-01-03"]
+    assert queue.lease(DATES, 2) == []
+
+    queue.complete("2024-01-01")
+
+    assert queue.counts() == {"done": 1, "leased": 2}
+    assert sorted(queue.unfinished(DATES)) == ["2024-01-02", "2024-01-03"]
+
+
+def test_failed_days_are_retried_after_a_backoff(queue, clock):
+    queue.lease(DATES, 1)
+    queue.fail("2024-01-01", "timeout")
+
+    assert queue.next_retry(["2024-01-01"]) == clock.now + 10
+    assert queue.lease(["2024-01-01"], 1) == []
+
+    clock.now += 10
+    assert queue.lease(["2024-01-01"], 1) == ["2024-01-01"]
+    queue.fail("2024-01-01", "http_error")
+
+    # doubled after every attempt, up to `backoff_max`
+    assert queue.next_retry(["2024-01-01"]) == clock.now + 20
+
+    clock.now += 20
+    assert queue.lease(["2024-01-01"], 1) == ["2024-01-01"]
+    queue.fail("2024-01-01", "connection_error")
+
+    assert queue.dead() == [("2024-01-01", 3, "connection_error")]
+    assert queue.next_retry(["2024-01-01"]) is None
+
+
+def test_permanent_failures_are_not_retried(queue):
+    queue.lease(DATES, 3)
+    queue.fail("2024-01-01", "not_an_image")
+    queue.fail("2024-01-02", "client_error")
+    queue.fail("2024-01-03", "upload_error: 503 Service Unavailable")
+
+    assert queue.dead() == [
+        ("2024-01-01", 1, "not_an_image"),
+        ("2024-01-02", 1, "client_error"),
+    ]
+    assert queue.unfinished(DATES) == ["2024-01-03"]
+
+
+def test_expired_leases_are_leased_again(queue, clock):
+    assert queue.lease(DATES, 3) == DATES
+
+    clock.now += 100
+    for _ in range(2):
+        assert queue.lease(DATES, 3) == DATES
+        clock.now += 100
+
+    # out of attempts
+    assert queue.lease(DATES, 3) == []
+    assert queue.dead() == [(date, 3, "lease expired") for date in DATES]
+
+
+def test_dead_days_are_queued_again(queue):
+    queue.lease(DATES, 3)
+    for date in DATES:
+        queue.fail(date, "too_large")
+
+    # enqueueing does not revive dead days
+    queue.enqueue(DATES)
+    assert queue.counts() == {"dead": 3}
+
+    assert queue.retry_dead(["2024-01-02"]) == 1
+    assert queue.lease(DATES, 3) == ["2024-01-02"]
+
+    assert queue.retry_dead() == 2
+    assert queue.lease(DATES, 3) == ["2024-01-01", "2024-01-03"]
+
+
+def test_done_days_are_opened_again(queue):
+    queue.lease(DATES, 1)
+    queue.complete("2024-01-01")
+
+    queue.enqueue(["2024-01-01"])
+
+    assert queue.lease(["2024-01-01"], 1) == ["2024-01-01"]
@@ -0,0 +1,91 @@
+import config
+import json
+import manifest
+import pytest
+
+
+@pytest.fixture
+def settings(output_dir, monkeypatch):
+    monkeypatch.setattr(config.get, "incremental", True)
+    monkeypatch.setattr(config.get, "job_queue", False)
+    monkeypatch.setattr(config.get, "supabase_upload", False)
+    monkeypatch.setattr(config.get, "output_backend", "json")
+    return output_dir
+
+
+def _save_day(output_dir, date: str) -> None:
+    path = output_dir / "data" / date[:4] / date[5:7] / f"{date[8:]}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({"date": date}))
+
+
+def _pending(dates: list) -> list:
+    return [
+        apod_item["date"]
+        for apod_item in manifest.filter_pending({"date": date} for date in dates)
+    ]
+
+
+def test_missing_failed_and_stale_days_are_pending(settings, monkeypatch):
+    dates = ["2024-01-01", "2024-01-02", "2024-01-03", "2024-01-04", "2024-01-05"]
+    for date in dates:
+        _save_day(settings, date)
+
+    manifest.record("2024-01-01", True)
+    manifest.record("2024-01-02", False, "timeout")
+    manifest.record("2024-01-03", True)
+    manifest.record("2024-01-04", True)
+    # never recorded: 2024-01-05
+
+    # the output of a done day was deleted
+    (settings / "data" / "2024" / "01" / "04.json").unlink()
+
+    assert _pending(dates) == ["2024-01-02", "2024-01-04", "2024-01-05"]
+
+    # processed with other settings
+    monkeypatch.setattr(config.get, "extcolors_limit", config.get.extcolors_limit + 1)
+
+    assert _pending(dates) == dates
+
+
+def test_a_later_record_wins(settings):
+    _save_day(settings, "2024-01-01")
+
+    manifest.record("2024-01-01", False, "http_error")
+    manifest.record("2024-01-01", True)
+
+    assert _pending(["2024-01-01"]) == []
+    assert manifest.load()["2024-01-01"]["status"] == "done"
+
+
+def test_nothing_is_skipped_without_incremental(settings, monkeypatch):
+    _save_day(settings, "2024-01-01")
+    manifest.record("2024-01-01", True)
+
+    monkeypatch.setattr(config.get, "incremental", False)
+
+    assert _pending(["2024-01-01"]) == ["2024-01-01"]
+
+
+def test_the_manifest_is_compacted(settings):
+    path = settings / manifest.MANIFEST_NAME
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    lines = [
+        json.dumps(
+            {"date": f"2024-01-{day:02}", "status": "failed", "attempt": attempt}
+        )
+        for attempt in range(600)
+        for day in (1, 2)
+    ]
+    # a line cut short by a crash is skipped
+    path.write_text("\n".join(lines) + '\n{"date": "2024-01-0')
+
+    records = manifest.load()
+
+    assert records == {
+        "2024-01-01": {"date": "2024-01-01", "status": "failed", "attempt": 599},
+        "2024-01-02": {"date": "2024-01-02", "status": "failed", "attempt": 599},
+    }
+    assert len(path.read_text().splitlines()) == 2
+    assert manifest.load() == records
@@ -0,0 +1,69 @@
+import datetime
+import metacache
+import pytest
+import time
+
+
+def _day(days_ago: int) -> str:
+    return (datetime.date.today() - datetime.timedelta(days=days_ago)).isoformat()
+
+
+def _timestamp(date: str, hour: int) -> float:
+    return datetime.datetime.combine(
+        datetime.date.fromisoformat(date), datetime.time(hour)
+    ).timestamp()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    metadata_cache = metacache.MetadataCache(str(tmp_path / "apod.sqlite3"), ttl=3600)
+    yield metadata_cache
+    metadata_cache.close()
+
+
+def _store_at(monkeypatch, cache, fetched_at, start_date, end_date, apod_data):
+    monkeypatch.setattr(metacache.time, "time", lambda: fetched_at)
+    cache.store(start_date, end_date, apod_data)
+    monkeypatch.undo()
+
+
+def test_only_the_missing_ranges_are_requested(cache):
+    cache.store(_day(30), _day(28), [{"date": _day(30)}, {"date": _day(28)}])
+
+    apod_data, missing = cache.lookup(_day(32), _day(26))
+
+    assert apod_data == [{"date": _day(30)}, {"date": _day(28)}]
+    assert missing == [(_day(32), _day(31)), (_day(27), _day(26))]
+
+
+def test_days_fetched_after_their_date_are_kept_forever(monkeypatch, cache):
+    _store_at(
+        monkeypatch,
+        cache,
+        time.time() - 30 * 24 * 3600,
+        _day(40),
+        _day(39),
+        [{"date": _day(40)}],
+    )
+
+    # the day with data and the tombstone are both permanent
+    assert cache.lookup(_day(40), _day(39)) == ([{"date": _day(40)}], [])
+
+
+def test_a_tombstone_fetched_on_its_date_expires(monkeypatch, cache):
+    # fetched two days ago, early in the morning, before the APOD was published
+    date = _day(2)
+    _store_at(monkeypatch, cache, _timestamp(date, 1), date, date, [])
+
+    assert cache.lookup(date, date) == ([], [(date, date)])
+
+
+def test_a_day_fetched_on_its_date_follows_the_ttl(monkeypatch, cache):
+    date = _day(0)
+    _store_at(monkeypatch, cache, time.time() - 60, date, date, [{"date": date}])
+
+    assert cache.lookup(date, date) == ([{"date": date}], [])
+
+    _store_at(monkeypatch, cache, time.time() - 7200, date, date, [{"date": date}])
+
+    assert cache.lookup(date, date) == ([], [(date, date)])
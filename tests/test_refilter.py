@@ -0,0 +1,74 @@
+import colors
+import config
+import json
+import manifest
+import pytest
+import refilter
+
+
+@pytest.fixture
+def settings(output_dir, monkeypatch):
+    monkeypatch.setattr(config.get, "incremental", True)
+    monkeypatch.setattr(config.get, "output_backend", "json")
+    monkeypatch.setattr(config.get, "color_index", False)
+    monkeypatch.setattr(config.get, "job_queue", False)
+
+    # the filter colors are generated once per process
+    for name in ("_FILTER_COLORS", "_FILTER_COLORS_LUT", "_FILTER_COLORS_VERSION"):
+        monkeypatch.setattr(colors, name, None)
+
+    return output_dir
+
+
+def _save_day(output_dir, date: str, palette: list, filterable: list) -> None:
+    year, month, day = date.split("-")
+    path = output_dir / "data" / year / month / f"{day}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(
+        json.dumps({"date": date, "colors": palette, "filterable": filterable})
+    )
+
+
+def _pending(dates: list) -> list:
+    return [
+        apod_item["date"]
+        for apod_item in manifest.filter_pending({"date": date} for date in dates)
+    ]
+
+
+def test_refiltered_days_are_not_processed_again(settings, monkeypatch):
+    palette = ["#E01010", "#102030", "#F0F0A0"]
+    _save_day(settings, "2024-01-05", palette, ["#000000"] * 3)
+    _save_day(settings, "2024-01-06", palette, ["#000000"] * 3)
+
+    manifest.record("2024-01-05", True)
+    # processed with other extraction settings, refiltering does not make it current
+    limit = config.get.extcolors_limit
+    monkeypatch.setattr(config.get, "extcolors_limit", limit + 1)
+    manifest.record("2024-01-06", True)
+    monkeypatch.setattr(config.get, "extcolors_limit", limit)
+
+    monkeypatch.setattr(config.get, "filter_colors_metric", "cie76")
+    assert _pending(["2024-01-05", "2024-01-06"]) == ["2024-01-05", "2024-01-06"]
+
+    assert refilter.refilter() == (2, 2)
+
+    assert _pending(["2024-01-05", "2024-01-06"]) == ["2024-01-06"]
+
+    colors.generate_filter_colors(preview=False)
+    saved = json.loads((settings / "data" / "2024" / "01" / "05.json").read_text())
+    assert saved["filterable"] == colors.find_closest_colors(
+        [colors.hex_to_rgb(color) for color in palette]
+    )
+
+
+def test_a_dry_run_changes_nothing(settings, monkeypatch):
+    _save_day(settings, "2024-01-05", ["#E01010"], ["#000000"])
+    manifest.record("2024-01-05", True)
+
+    monkeypatch.setattr(config.get, "filter_colors_metric", "cie76")
+
+    assert refilter.refilter(dry_run=True) == (1, 1)
+    assert _pending(["2024-01-05"]) == ["2024-01-05"]
+    saved = json.loads((settings / "data" / "2024" / "01" / "05.json").read_text())
+    assert saved["filterable"] == ["#000000"]
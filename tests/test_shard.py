@@ -0,0 +1,98 @@
+import config
+import datetime
+import json
+import pathlib
+import pytest
+import shard
+import utils
+
+DATES = [f"2024-01-{day:02}" for day in range(1, 10)]
+
+
+@pytest.fixture
+def settings(output_dir, monkeypatch):
+    monkeypatch.setattr(config.get, "date", None)
+    monkeypatch.setattr(config.get, "start_date", datetime.date(2024, 1, 1))
+    monkeypatch.setattr(config.get, "end_date", datetime.date(2024, 1, 9))
+    monkeypatch.setattr(config.get, "output_backend", "json")
+    monkeypatch.setattr(config.get, "color_index", False)
+    return output_dir
+
+
+def _run_shard(output_dir, monkeypatch, spec: str, saved: list) -> list:
+    """Run a shard over `DATES` which saves the given days, and return its assigned days."""
+
+    monkeypatch.setattr(config.get, "shard", spec)
+
+    shard.activate()
+    assigned = [
+        apod_item["date"]
+        for apod_item in shard.select({"date": date} for date in DATES)
+    ]
+
+    for date in saved:
+        path = pathlib.Path(config.output_path("data", *date.split("-")[:2]))
+        path.mkdir(parents=True, exist_ok=True)
+        (path / f"{date[8:]}.json").write_text(
+            json.dumps({"date": date, "shard": spec})
+        )
+
+    # back to the output of the merge
+    monkeypatch.setattr(config.get, "output_dir", str(output_dir))
+    return assigned
+
+
+def test_every_day_belongs_to_one_shard():
+    for date in DATES:
+        assert [index for index in (1, 2, 3) if shard.is_assigned(date, index, 3)] == [
+            1 + (datetime.date.fromisoformat(date) - shard.EPOCH).days % 3
+        ]
+
+    assert shard.parse(" 2 / 3 ") == (2, 3)
+    for spec in ("0/3", "4/3", "2", "a/b"):
+        with pytest.raises(utils.CriticalError):
+            shard.parse(spec)
+
+
+def test_merge_reports_missing_and_duplicate_days(settings, monkeypatch):
+    first = [date for date in DATES if shard.is_assigned(date, 1, 3)]
+    second = [date for date in DATES if shard.is_assigned(date, 2, 3)]
+
+    # the first shard stopped after two days, the second one also saved a day of the first
+    assert _run_shard(settings, monkeypatch, "1/3", first[:2]) == first
+    assert _run_shard(settings, monkeypatch, "2/3", second + first[:1]) == second
+    # the third shard never ran
+
+    summary = shard.merge()
+
+    assert summary["missing_shards"] == [3]
+    assert summary["assigned_days"] == 6
+    assert summary["saved_days"] == 5
+    assert summary["missing_days"] == [first[2]]
+    assert summary["duplicate_days"] == {first[0]: [1, 2]}
+
+    # a duplicate day is taken from the first shard
+    saved = {
+        path.stem: json.loads(path.read_text())["shard"]
+        for path in (settings / "data" / "2024" / "01").glob("*.json")
+    }
+    assert saved == {
+        **{date[8:]: "1/3" for date in first[:2]},
+        **{date[8:]: "2/3" for date in second},
+    }
+    assert json.loads((settings / shard.SUMMARY_NAME).read_text()) == summary
+
+
+def test_a_dry_run_copies_nothing(settings, monkeypatch):
+    first = _run_shard(settings, monkeypatch, "1/2", DATES[:4])
+    second = _run_shard(settings, monkeypatch, "2/2", DATES[4:])
+
+    summary = shard.merge(dry_run=True)
+
+    assert summary["missing_shards"] == []
+    assert summary["missing_days"] == []
+    assert summary["duplicate_days"] == {}
+    assert summary["assigned_days"] == len(first) + len(second) == len(DATES)
+    assert summary["saved_days"] == len(DATES)
+    assert not (settings / "data").exists()
+    assert not (settings / shard.SUMMARY_NAME).exists()
@@ -0,0 +1,118 @@
+import pytest
+import supa
+import threading
+import time
+
+
+class FakeClient:
+    """Records upserts instead of sending them; rows with `"bad": True` make an upsert fail."""
+
+    def __init__(self, failures: int = 0) -> None:
+        self.failures = failures
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def table(self, name: str) -> "FakeClient":
+        self.table_name = name
+        return self
+
+    def upsert(self, rows: list, on_conflict: str) -> "FakeClient":
+        with self.lock:
+            self.calls.append((self.table_name, list(rows), on_conflict))
+            if self.failures > 0:
+                self.failures -= 1
+                raise ConnectionError("temporarily unavailable")
+            if any(row.get("bad") for row in rows):
+                raise ValueError("violates a constraint")
+        return self
+
+    def execute(self) -> None:
+        pass
+
+
+@pytest.fixture
+def sleeps(monkeypatch) -> list:
+    delays = []
+    monkeypatch.setattr(supa.time, "sleep", delays.append)
+    return delays
+
+
+def _rows(count: int) -> list:
+    return [{"year": 2024, "month": 1, "day": day} for day in range(1, count + 1)]
+
+
+def test_rows_are_upserted_in_batches():
+    client = FakeClient()
+    uploader = supa.BatchUploader(
+        client, "apods_v1", "year,month,day", batch_size=2, flush_interval=60
+    )
+
+    for row in _rows(5):
+        uploader.add(row)
+
+    assert uploader.close() == []
+    assert uploader.uploaded == 5
+    assert [len(rows) for _, rows, _ in client.calls] == [2, 2, 1]
+    assert {(table, on_conflict) for table, _, on_conflict in client.calls} == {
+        ("apods_v1", "year,month,day")
+    }
+    assert [row for _, rows, _ in client.calls for row in rows] == _rows(5)
+
+
+def test_a_partial_batch_is_flushed_after_the_interval():
+    client = FakeClient()
+    uploader = supa.BatchUploader(
+        client, "apods_v1", "year,month,day", batch_size=100, flush_interval=0.05
+    )
+
+    uploader.add(_rows(1)[0])
+
+    deadline = time.monotonic() + 5
+    while not client.calls and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert len(client.calls) == 1
+    assert uploader.close() == []
+
+
+def test_a_failed_batch_is_retried_with_the_configured_backoff(sleeps):
+    client = FakeClient(failures=2)
+    uploader = supa.BatchUploader(
+        client, "apods_v1", "year,month,day", retries=3, backoff=0.5
+    )
+
+    for row in _rows(3):
+        uploader.add(row)
+
+    assert uploader.close() == []
+    assert uploader.uploaded == 3
+    assert len(client.calls) == 3
+    assert sleeps == [0.5, 1.0]
+
+
+def test_failing_rows_are_uploaded_one_by_one_and_reported(sleeps):
+    reported = []
+    client = FakeClient()
+    uploader = supa.BatchUploader(
+        client,
+        "apods_v1",
+        "year,month,day",
+        retries=1,
+        backoff=0.5,
+        on_failure=lambda row, exception: reported.append((row, exception)),
+    )
+
+    rows = _rows(3)
+    rows[1]["bad"] = True
+    for row in rows:
+        uploader.add(row)
+
+    failed = uploader.close()
+
+    assert uploader.uploaded == 2
+    assert [row for row, _ in failed] == [rows[1]]
+    assert [row for row, _ in reported] == [rows[1]]
+    assert isinstance(reported[0][1], ValueError)
+    assert sleeps == [0.5]
+    # two attempts of the batch, then one upsert per row
+    assert [len(rows) for _, rows, _ in client.calls] == [3, 3, 1, 1, 1]